@@ -0,0 +1,134 @@
+"""
+Efecto del archivo de cupos pasados sobre las consultas de disponibilidad.
+
+Crea una base de datos temporal (no toca la configurada) con varios años de
+cupos y reservas. Mide las consultas más frecuentes sobre ``Disponibilidad``,
+ejecuta ``archivar_disponibilidades`` y las vuelve a medir:
+
+    python benchmarks/archivo_disponibilidades.py --medicos 40 --dias 1095
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils.timezone import localtime, now  # noqa: E402
+
+from ficha_medica.archivo import archivar_disponibilidades  # noqa: E402
+from ficha_medica.calendario import disponibilidad_mensual  # noqa: E402
+from ficha_medica.estadisticas import actualizar_resumenes  # noqa: E402
+from ficha_medica.models import Disponibilidad, Especialidad, Medico, Paciente, Reserva  # noqa: E402
+
+REPETICIONES = 20
+
+
+def poblar(medicos, dias, cupos_por_dia, dias_futuros=60):
+    especialidad = Especialidad.objects.create(nombre='Benchmark')
+    usuarios = User.objects.bulk_create([User(username=f'bench{i}') for i in range(medicos)])
+    medicos = Medico.objects.bulk_create([Medico(user=u, especialidad=especialidad) for u in usuarios])
+    pacientes = Paciente.objects.bulk_create(
+        [Paciente(rut=f'{i}-0', nombre=f'Paciente {i}') for i in range(2000)], batch_size=500
+    )
+    inicio = now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=dias)
+    azar = random.Random(1)
+    for medico in medicos:
+        cupos = [
+            Disponibilidad(
+                medico=medico,
+                fecha_disponible=inicio + timedelta(days=dia, minutes=30 * n),
+                ocupada=dia < dias and azar.random() < 0.6,
+            )
+            for dia in range(dias + dias_futuros)
+            for n in range(cupos_por_dia)
+        ]
+        Disponibilidad.objects.bulk_create(cupos, batch_size=2000)
+        Reserva.objects.bulk_create(
+            [
+                Reserva(paciente=azar.choice(pacientes), especialidad=especialidad, medico=medico,
+                        fecha_reserva=cupo, motivo='Control')
+                for cupo in cupos if cupo.ocupada
+            ],
+            batch_size=2000,
+        )
+    return medicos
+
+
+def medir(funcion):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def consultas(medicos):
+    medico = medicos[len(medicos) // 2]
+    hoy = localtime(now())
+    inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'cupos libres de un médico (api_disponibilidades)': lambda: list(
+            Disponibilidad.objects.filter(medico=medico, ocupada=False, fecha_disponible__gte=now())
+        ),
+        'cupos del médico (gestionar_disponibilidades)': lambda: list(Disponibilidad.objects.filter(medico=medico)),
+        'cupos libres del médico (modificar_reserva)': lambda: list(
+            Disponibilidad.objects.filter(medico=medico, ocupada=False)
+        ),
+        'calendario del mes': lambda: disponibilidad_mensual(hoy.year, hoy.month),
+        'admin: total de cupos': lambda: Disponibilidad.objects.count(),
+        'admin: filtro "este mes"': lambda: Disponibilidad.objects.filter(fecha_disponible__gte=inicio_mes).count(),
+        'admin: primera página': lambda: list(Disponibilidad.objects.select_related('medico__user').order_by('-id')[:100]),
+        'reservas futuras (scheduler)': lambda: list(
+            Reserva.objects.filter(fecha_reserva__fecha_disponible__range=(now(), now() + timedelta(minutes=5)))
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--medicos', type=int, default=40)
+    parser.add_argument('--dias', type=int, default=3 * 365, help="Días de historia.")
+    parser.add_argument('--cupos-por-dia', type=int, default=8)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(directorio, 'benchmark.sqlite3')
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        inicio = time.perf_counter()
+        medicos = poblar(args.medicos, args.dias, args.cupos_por_dia)
+        actualizar_resumenes()
+        print(f"Datos creados en {time.perf_counter() - inicio:.1f} s: "
+              f"{Disponibilidad.objects.count()} cupos, {Reserva.objects.count()} reservas.")
+
+        connection.cursor().execute('ANALYZE')
+        antes = {nombre: medir(funcion) for nombre, funcion in consultas(medicos).items()}
+        inicio = time.perf_counter()
+        resultado = archivar_disponibilidades()
+        print(f"Archivo en {time.perf_counter() - inicio:.1f} s: {resultado}")
+        connection.cursor().execute('ANALYZE')
+        despues = {nombre: medir(funcion) for nombre, funcion in consultas(medicos).items()}
+
+        print(f"\n{'consulta':<48} {'antes (ms)':>11} {'después (ms)':>13}")
+        for nombre in antes:
+            print(f"{nombre:<48} {antes[nombre]:>11.2f} {despues[nombre]:>13.2f}")
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
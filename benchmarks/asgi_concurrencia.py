@@ -0,0 +1,174 @@
+"""
+Vistas JSON síncronas frente a las ``async`` bajo un worker ASGI.
+
+Crea una base temporal con un médico, su sesión, cupos y notificaciones,
+levanta ``centro_medico.asgi`` con uvicorn (un proceso) y abre muchas
+conexiones keep-alive a la vez. Cada una recorre en bucle los endpoints de
+sondeo (notificaciones, reservas activas, médicos, disponibilidades y
+validación de RUT). Lo hace con ``VISTAS_ASYNC=0`` (las vistas de
+``views.py``) y con ``VISTAS_ASYNC=1`` (``views_async.py``). Informa
+peticiones por segundo, latencias y el máximo de hilos del servidor:
+
+    python benchmarks/asgi_concurrencia.py --clientes 500 --segundos 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+_TEMPORAL = tempfile.mkdtemp()
+os.environ['SQLITE_PATH'] = os.path.join(_TEMPORAL, 'benchmark.sqlite3')
+# Otra base: sin usuarios ni páginas cacheados de la real.
+os.environ['SESIONES_CACHE_DIR'] = os.path.join(_TEMPORAL, 'sesiones')
+os.environ['CACHE_COMPARTIDA_DIR'] = os.path.join(_TEMPORAL, 'compartida')
+os.environ['SCHEDULER_AUTOINICIO'] = '0'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # noqa: E402
+from django.contrib.auth.models import Group, User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.utils.module_loading import import_string  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from ficha_medica.models import Disponibilidad, Especialidad, Medico, Notificacion, Paciente  # noqa: E402
+
+
+def poblar():
+    call_command('migrate', verbosity=0)
+    especialidad = Especialidad.objects.create(nombre='Benchmark')
+    usuario = User.objects.create_user('bench-medico', password='bench')
+    usuario.groups.add(Group.objects.get_or_create(name='Medico')[0])
+    medico = Medico.objects.create(user=usuario, especialidad=especialidad)
+    inicio = now()
+    Disponibilidad.objects.bulk_create(
+        [Disponibilidad(medico=medico, fecha_disponible=inicio + timedelta(hours=n)) for n in range(1, 21)]
+    )
+    Notificacion.objects.bulk_create([Notificacion(usuario=usuario, mensaje=f"Aviso {n}") for n in range(5)])
+    Paciente.objects.create(rut='12345678-5', nombre='Paciente Benchmark')
+    sesion = import_string(f'{settings.SESSION_ENGINE}.SessionStore')()
+    sesion[SESSION_KEY] = str(usuario.pk)
+    sesion[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sesion[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    sesion.create()
+    return sesion.session_key, [
+        '/notificaciones/ajax/',
+        '/reservas/activas/',
+        f'/api/medicos/?especialidad_id={especialidad.id}',
+        f'/api/disponibilidades/?medico_id={medico.id}',
+        '/api/validar_rut/?rut=12345678-5',
+    ]
+
+
+async def cliente(puerto, peticiones, fin, latencias, errores):
+    lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+    indice = 0
+    while time.monotonic() < fin:
+        escritor.write(peticiones[indice % len(peticiones)])
+        indice += 1
+        comienzo = time.monotonic()
+        estado = await lector.readline()
+        largo = 0
+        while (linea := await lector.readline()) not in (b'\r\n', b''):
+            if linea.lower().startswith(b'content-length:'):
+                largo = int(linea.split(b':')[1])
+        await lector.readexactly(largo)
+        if estado.split()[1] == b'200':
+            latencias.append(time.monotonic() - comienzo)
+        else:
+            errores.append(estado)
+    escritor.close()
+
+
+async def cargar(puerto, rutas, cookie, clientes, segundos):
+    peticiones = [
+        f'GET {ruta} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {settings.SESSION_COOKIE_NAME}={cookie}\r\n\r\n'.encode()
+        for ruta in rutas
+    ]
+    latencias, errores = [], []
+    fin = time.monotonic() + segundos
+    # Cada cliente empieza en un endpoint distinto.
+    await asyncio.gather(*(
+        cliente(puerto, peticiones[n % len(peticiones):] + peticiones[:n % len(peticiones)], fin, latencias, errores)
+        for n in range(clientes)
+    ))
+    return latencias, errores
+
+
+def hilos_maximos(pid, detener, resultado):
+    while not detener.is_set():
+        try:
+            with open(f'/proc/{pid}/status') as estado:
+                hilos = next(int(linea.split()[1]) for linea in estado if linea.startswith('Threads:'))
+            resultado[0] = max(resultado[0], hilos)
+        except (OSError, StopIteration):
+            pass
+        time.sleep(0.05)
+
+
+def esperar(puerto, servidor):
+    import http.client
+    for _ in range(100):
+        if servidor.poll() is not None:
+            raise RuntimeError("El servidor terminó al iniciar.")
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=1)
+            conexion.request('GET', '/')
+            conexion.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("El servidor no respondió.")
+
+
+def ejecutar(nombre, vistas_async, args, rutas, cookie):
+    entorno = {**os.environ, 'VISTAS_ASYNC': '1' if vistas_async else '0'}
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'centro_medico.asgi:application', '--port', str(args.puerto),
+         '--no-access-log', '--log-level', 'warning', '--backlog', str(args.clientes * 2)],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL,
+    )
+    detener, hilos = threading.Event(), [0]
+    try:
+        esperar(args.puerto, servidor)
+        muestreo = threading.Thread(target=hilos_maximos, args=(servidor.pid, detener, hilos))
+        muestreo.start()
+        latencias, errores = asyncio.run(cargar(args.puerto, rutas, cookie, args.clientes, args.segundos))
+        detener.set()
+        muestreo.join()
+    finally:
+        servidor.terminate()
+        servidor.wait()
+    latencias.sort()
+    p50 = latencias[len(latencias) // 2] * 1000
+    p95 = latencias[int(len(latencias) * 0.95)] * 1000
+    print(f"{nombre:<20} {len(latencias) / args.segundos:>12.0f} {p50:>8.0f} {p95:>8.0f} {hilos[0]:>7} {len(errores):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--puerto', type=int, default=8766)
+    args = parser.parse_args()
+
+    cookie, rutas = poblar()
+    print(f"uvicorn, 1 proceso, {args.clientes} conexiones simultáneas, {args.segundos:.0f} s\n")
+    print(f"{'vistas':<20} {'peticiones/s':>12} {'p50 ms':>8} {'p95 ms':>8} {'hilos':>7} {'errores':>8}")
+    ejecutar('síncronas', False, args, rutas, cookie)
+    ejecutar('async', True, args, rutas, cookie)
+
+
+if __name__ == '__main__':
+    main()
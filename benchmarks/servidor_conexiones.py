@@ -0,0 +1,145 @@
+"""
+Peticiones por segundo de gunicorn con y sin conexiones persistentes.
+
+Crea una base temporal con un médico y su sesión, levanta gunicorn con
+``gunicorn.conf.py`` y, desde varios clientes con keep-alive, consulta
+durante unos segundos el sondeo de notificaciones (``/notificaciones/ajax/``:
+sesión, usuario y notificaciones). Lo hace primero con ``DB_CONN_MAX_AGE=0``
+(una conexión nueva por petición, como antes) y luego con las conexiones
+persistentes de la configuración:
+
+    python benchmarks/servidor_conexiones.py --clientes 8 --segundos 10
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+_TEMPORAL = tempfile.mkdtemp()
+os.environ['SQLITE_PATH'] = os.path.join(_TEMPORAL, 'benchmark.sqlite3')
+# Otra base: sin usuarios ni páginas cacheados de la real.
+os.environ['SESIONES_CACHE_DIR'] = os.path.join(_TEMPORAL, 'sesiones')
+os.environ['CACHE_COMPARTIDA_DIR'] = os.path.join(_TEMPORAL, 'compartida')
+os.environ['SCHEDULER_AUTOINICIO'] = '0'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.utils.module_loading import import_string  # noqa: E402
+
+from ficha_medica.models import Especialidad, Medico, Notificacion  # noqa: E402
+
+RUTA = '/notificaciones/ajax/'
+
+
+def poblar():
+    call_command('migrate', verbosity=0)
+    usuario = User.objects.create_user('bench-medico', password='bench')
+    Medico.objects.create(user=usuario, especialidad=Especialidad.objects.create(nombre='Benchmark'))
+    Notificacion.objects.bulk_create([Notificacion(usuario=usuario, mensaje=f"Aviso {n}") for n in range(5)])
+    sesion = import_string(f'{settings.SESSION_ENGINE}.SessionStore')()
+    sesion[SESSION_KEY] = str(usuario.pk)
+    sesion[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sesion[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    sesion.create()
+    return sesion.session_key
+
+
+def esperar(puerto, servidor):
+    for _ in range(100):
+        if servidor.poll() is not None:
+            raise RuntimeError("gunicorn terminó al iniciar.")
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=1)
+            conexion.request('GET', '/')
+            conexion.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn no respondió.")
+
+
+def cliente(puerto, cookie, fin, resultados):
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto)
+    cabeceras = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={cookie}'}
+    respuestas = errores = 0
+    while time.monotonic() < fin:
+        try:
+            conexion.request('GET', RUTA, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            # El worker se recicló (max_requests) o cerró el keep-alive: se reconecta.
+            conexion.close()
+            continue
+        if respuesta.status == 200:
+            respuestas += 1
+        else:
+            errores += 1
+        if respuesta.will_close:
+            conexion.close()
+    resultados.append((respuestas, errores))
+
+
+def ejecutar(nombre, conn_max_age, args, cookie):
+    entorno = {
+        **os.environ,
+        'DB_CONN_MAX_AGE': str(conn_max_age),
+        'PORT': str(args.puerto),
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_ACCESSLOG': '',
+        'GUNICORN_LOGLEVEL': 'warning',
+        'SCHEDULER_LOCK': os.path.join(os.path.dirname(os.environ['SQLITE_PATH']), 'scheduler.lock'),
+    }
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL,
+    )
+    try:
+        esperar(args.puerto, servidor)
+        resultados = []
+        fin = time.monotonic() + args.segundos
+        hilos = [threading.Thread(target=cliente, args=(args.puerto, cookie, fin, resultados)) for _ in range(args.clientes)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    finally:
+        servidor.terminate()
+        servidor.wait()
+    respuestas, errores = (sum(valores) for valores in zip(*resultados))
+    print(f"{nombre:<34} {respuestas / args.segundos:>12.0f} {errores:>8}")
+    return respuestas / args.segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    cookie = poblar()
+    print(f"{args.workers} workers gthread x {os.environ.get('GUNICORN_THREADS', '4')} hilos, "
+          f"{args.clientes} clientes, {args.segundos:.0f} s\n")
+    print(f"{'configuración':<34} {'peticiones/s':>12} {'errores':>8}")
+    base = ejecutar('CONN_MAX_AGE=0', 0, args, cookie)
+    persistente = ejecutar(f'CONN_MAX_AGE={settings.DB_CONN_MAX_AGE} + health checks', settings.DB_CONN_MAX_AGE, args, cookie)
+    print(f"\nMejora: {persistente / base:.2f}x peticiones por segundo.")
+
+
+if __name__ == '__main__':
+    main()
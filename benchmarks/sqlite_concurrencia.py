@@ -0,0 +1,130 @@
+"""
+Rendimiento de SQLite con escritores y lectores concurrentes.
+
+Crea una base temporal y lanza varios procesos (como los workers de
+gunicorn) que durante unos segundos mezclan lecturas con escrituras cortas:
+listados de cupos y notificaciones, y reservas de cupo con su notificación.
+Lo hace primero con la configuración por omisión (journal en modo ``delete``
+y ``BEGIN`` diferido) y luego con las ``OPTIONS`` de ``DATABASES``
+(``core/sqlite``). Informa operaciones por segundo y errores "database is
+locked":
+
+    python benchmarks/sqlite_concurrencia.py --procesos 8 --segundos 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import OperationalError, connection, connections, transaction  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from ficha_medica.models import Disponibilidad, Especialidad, Medico, Notificacion  # noqa: E402
+
+POR_OMISION = {'pragmas': {'journal_mode': 'delete', 'synchronous': 'full'}, 'transaction_mode': 'DEFERRED'}
+PROPORCION_ESCRITURAS = 0.2
+
+
+def poblar():
+    especialidad = Especialidad.objects.create(nombre='Benchmark')
+    usuarios = User.objects.bulk_create([User(username=f'bench{i}') for i in range(20)])
+    medicos = Medico.objects.bulk_create([Medico(user=u, especialidad=especialidad) for u in usuarios])
+    inicio = now()
+    Disponibilidad.objects.bulk_create(
+        [
+            Disponibilidad(medico=medico, fecha_disponible=inicio + timedelta(minutes=30 * n))
+            for medico in medicos
+            for n in range(2000)
+        ],
+        batch_size=2000,
+    )
+
+
+def trabajador(segundos, semilla, resultados):
+    azar = random.Random(semilla)
+    medicos = list(Medico.objects.values_list('id', 'user_id'))
+    cupos = list(Disponibilidad.objects.values_list('id', flat=True))
+    lecturas = escrituras = bloqueos = 0
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        medico_id, usuario_id = azar.choice(medicos)
+        try:
+            if azar.random() < PROPORCION_ESCRITURAS:
+                # Como crear_reserva: lee el cupo y luego escribe en la misma transacción.
+                cupo_id = azar.choice(cupos)
+                with transaction.atomic():
+                    cupo = Disponibilidad.objects.select_related('medico').get(id=cupo_id)
+                    cupo.ocupada = not cupo.ocupada
+                    cupo.save(update_fields=['ocupada'])
+                    Notificacion.objects.create(usuario_id=cupo.medico.user_id, mensaje="Reserva de prueba")
+                escrituras += 1
+            else:
+                list(Disponibilidad.objects.filter(medico_id=medico_id, ocupada=False, fecha_disponible__gte=now())[:50])
+                list(Notificacion.objects.filter(usuario_id=usuario_id).order_by('-id')[:20])
+                lecturas += 1
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            bloqueos += 1
+    connection.close()
+    resultados.put((lecturas, escrituras, bloqueos))
+
+
+def ejecutar(nombre, opciones, procesos, segundos):
+    connections.close_all()
+    connection.settings_dict['OPTIONS'] = opciones
+    with connection.cursor() as cursor:  # journal_mode persiste en el archivo: se fija antes de empezar
+        cursor.execute(f"PRAGMA journal_mode = {opciones['pragmas'].get('journal_mode') or 'delete'}")
+    connections.close_all()  # Cada proceso abre su propia conexión
+    resultados = multiprocessing.Queue()
+    hijos = [
+        multiprocessing.Process(target=trabajador, args=(segundos, semilla, resultados))
+        for semilla in range(procesos)
+    ]
+    for hijo in hijos:
+        hijo.start()
+    totales = [sum(valores) for valores in zip(*(resultados.get() for _ in hijos))]
+    for hijo in hijos:
+        hijo.join()
+    lecturas, escrituras, bloqueos = totales
+    print(f"{nombre:<24} {lecturas / segundos:>10.0f} {escrituras / segundos:>11.0f} {bloqueos:>9}")
+    return (lecturas + escrituras) / segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--segundos', type=float, default=10)
+    args = parser.parse_args()
+    multiprocessing.set_start_method('fork')
+
+    configuradas = dict(connection.settings_dict['OPTIONS'])
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    nombre_original = connection.settings_dict['NAME']
+    connection.settings_dict['OPTIONS'] = POR_OMISION
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        poblar()
+        print(f"{args.procesos} procesos, {args.segundos:.0f} s, {PROPORCION_ESCRITURAS:.0%} escrituras\n")
+        print(f"{'configuración':<24} {'lecturas/s':>10} {'escrituras/s':>11} {'bloqueos':>9}")
+        base = ejecutar('por omisión (delete)', POR_OMISION, args.procesos, args.segundos)
+        ajustada = ejecutar('core.sqlite (OPTIONS)', configuradas, args.procesos, args.segundos)
+        print(f"\nMejora: {ajustada / base:.1f}x operaciones por segundo.")
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+os.environ.setdefault('VISTAS_ASYNC', '1')
+# Bajo ASGI cada petición corre su código síncrono en un hilo propio: una
+# conexión persistente quedaría abierta en un hilo que no se reutiliza.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -48,13 +48,17 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',  # Primero: mide toda la cadena
+    'core.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.perfilado.PerfiladoMiddleware',  # Después de la autenticación: X-Perfilar solo para staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.PrimarioTrasEscrituraMiddleware',
 ]
 
 ROOT_URLCONF = 'centro_medico.urls'
@@ -80,13 +84,51 @@ WSGI_APPLICATION = 'centro_medico.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Backend SQLite propio (core/sqlite): aplica los PRAGMA al abrir cada conexión
+# y abre las transacciones con BEGIN IMMEDIATE. Un PRAGMA vacío deja el valor de SQLite.
+# db.sqlite3 se versiona ya en modo WAL, así que abrirla no modifica el archivo;
+# los -wal/-shm que crea SQLite están en .gitignore.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'normal'),
+    'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-65536'),  # Negativo: en KiB (64 MiB)
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'memory'),
+}
+
+# Conexiones persistentes: cada hilo de gunicorn reutiliza la suya durante
+# CONN_MAX_AGE segundos (0 = una por petición) y se comprueba antes de reutilizarla.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'core.sqlite',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+            'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
     }
 }
 
+# Réplica de solo lectura para listados, exportaciones y reportes (core/replicas.py).
+# Con SQLite se mantiene al día con manage.py sincronizar_replica (API de backup en línea).
+if os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'core.sqlite',
+        'NAME': os.environ['SQLITE_REPLICA_PATH'],
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pragmas': {**SQLITE_PRAGMAS, 'query_only': 'on'}},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Segundos en que las lecturas de quien acaba de escribir siguen en el primario (retraso máximo de la réplica).
+REPLICA_RETRASO_SEGUNDOS = int(os.environ.get('REPLICA_RETRASO_SEGUNDOS', '15'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,6 +174,115 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGOUT_REDIRECT_URL = '/'
 
+# Exportación de fichas en PDF
+# Renders por ficha reutilizados por la descarga individual y la exportación masiva.
+FICHA_PDF_CACHE_DIR = os.environ.get('FICHA_PDF_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'fichas_pdf'))
+# Fichas por PDF (historial y formato=pdf). La memoria del render crece con las páginas.
+PDF_MAX_FICHAS_DOCUMENTO = 1000
+# Procesos para la exportación masiva (None = uno por núcleo).
+EXPORTACION_PDF_PROCESOS = int(os.environ['EXPORTACION_PDF_PROCESOS']) if os.environ.get('EXPORTACION_PDF_PROCESOS') else None
+# Archivos generados por tareas en segundo plano.
+EXPORTACIONES_DIR = os.environ.get('EXPORTACIONES_DIR', os.path.join(BASE_DIR, 'cache', 'exportaciones'))
+
+# Cola de tareas en segundo plano (manage.py run_workers, que start.sh inicia junto a gunicorn)
+TAREAS_REINTENTO_BASE_SEGUNDOS = 10
+TAREAS_REINTENTO_MAX_SEGUNDOS = 600
+# Cada cuánto renueva el trabajador el latido de la tarea que ejecuta.
+TAREAS_LATIDO_SEGUNDOS = 30
+# Una tarea en curso sin latido por más tiempo (su trabajador murió) se reintenta.
+TAREAS_TIMEOUT_SEGUNDOS = 300
+# Días que se conservan las tareas terminadas (se purgan cada noche con el archivo).
+TAREAS_RETENCION_DIAS = 7
+# Los avisos programados que un trabajador toma con más atraso se descartan.
+NOTIFICACIONES_ATRASO_MAXIMO_SEGUNDOS = 60
+
+# Línea de tiempo de pacientes: cada página se cachea hasta que cambian sus datos.
+# El límite acota lo que tarda en reflejarse el paso de reservas futuras a pasadas.
+LINEA_TIEMPO_CACHE_SEGUNDOS = 300
+# Calendario mensual de disponibilidades (se invalida al cambiar un cupo del mes).
+CALENDARIO_CACHE_SEGUNDOS = 300
+# Minutos que un cupo liberado queda retenido para el paciente en espera al que se ofreció.
+LISTA_ESPERA_RETENCION_MINUTOS = 30
+
+# Archivo de cupos pasados (manage.py archivar_disponibilidades, cada noche):
+# los cupos sin reserva se eliminan y los reservados pasan a las tablas históricas.
+ARCHIVO_CUPOS_LIBRES_DIAS = 30
+ARCHIVO_RESERVAS_DIAS = 365
+
+# Endpoints JSON de sondeo en su versión async (ficha_medica/views_async.py). Lo activa centro_medico/asgi.py.
+VISTAS_ASYNC = os.environ.get('VISTAS_ASYNC', '0') == '1'
+
+# Métricas de Prometheus (core/metricas.py), expuestas en /metrics solo a estas IPs.
+# Cada proceso vuelca las suyas en METRICAS_DIR y /metrics suma las de todos.
+METRICAS_DIR = os.environ.get('METRICAS_DIR', os.path.join(BASE_DIR, 'cache', 'metricas'))
+METRICAS_INTERVALO_SEGUNDOS = 10
+METRICAS_IPS = os.environ.get('METRICAS_IPS', '127.0.0.1,::1').split(',')
+
+# Consultas lentas (core/consultas_lentas.py): las que superan el umbral se registran
+# con su origen y plan en CONSULTAS_LENTAS_LOG (manage.py reporte_consultas_lentas). 0 = desactivado.
+CONSULTAS_LENTAS_MS = float(os.environ.get('CONSULTAS_LENTAS_MS', '200'))
+CONSULTAS_LENTAS_LOG = os.environ.get('CONSULTAS_LENTAS_LOG', os.path.join(BASE_DIR, 'cache', 'consultas_lentas.jsonl'))
+
+# Perfilado a demanda (core/perfilado.py): fracción de peticiones y de trabajos del
+# scheduler que se perfilan (0 = solo las que pide un staff con X-Perfilar: 1 o ?perfilar=1).
+PERFILADO_MUESTREO = float(os.environ.get('PERFILADO_MUESTREO', '0'))
+PERFILADO_TAREAS_MUESTREO = float(os.environ.get('PERFILADO_TAREAS_MUESTREO', '0'))
+PERFILADO_DIR = os.environ.get('PERFILADO_DIR', os.path.join(BASE_DIR, 'cache', 'perfiles'))
+PERFILADO_MAX_ARCHIVOS = 500
+
+# Cachés. Las que deben verse desde todos los workers usan Redis si hay REDIS_URL y, si
+# no, archivos locales (un solo servidor); "memoria" solo sirve con un único proceso
+# (runserver, WEB_CONCURRENCY=1). "default" es local a cada proceso.
+# - "compartida": páginas de la línea de tiempo y del calendario, con sus versiones
+#   (ficha_medica/utils.py): una escritura en un worker las invalida en todos.
+# - "sesiones": las sesiones (core/sesiones.py, respaldadas en la base) y el usuario
+#   autenticado (core/autenticacion.py).
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_COMPARTIDA = os.environ.get('CACHE_COMPARTIDA', 'redis' if REDIS_URL else 'archivo')
+CACHE_COMPARTIDA_DIR = os.environ.get('CACHE_COMPARTIDA_DIR', os.path.join(BASE_DIR, 'cache', 'compartida'))
+SESIONES_CACHE = os.environ.get('SESIONES_CACHE', CACHE_COMPARTIDA)
+SESIONES_CACHE_DIR = os.environ.get('SESIONES_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'sesiones'))
+
+
+def _cache_compartida(tipo, directorio, prefijo):
+    return {
+        'redis': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL, 'KEY_PREFIX': prefijo},
+        'archivo': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directorio,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+        'memoria': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': prefijo},
+    }[tipo]
+
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'compartida': _cache_compartida(CACHE_COMPARTIDA, CACHE_COMPARTIDA_DIR, 'compartida'),
+    'sesiones': _cache_compartida(SESIONES_CACHE, SESIONES_CACHE_DIR, 'sesiones'),
+}
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'core.sesiones')
+SESSION_CACHE_ALIAS = 'sesiones'
+AUTHENTICATION_BACKENDS = [
+    'core.autenticacion.UsuarioCacheadoBackend',
+    # Las sesiones abiertas antes del backend cacheado guardan esta ruta; sin ella se cerrarían.
+    'django.contrib.auth.backends.ModelBackend',
+]
+USUARIO_CACHE_SEGUNDOS = 300
+
+# Registro de actividad (core/actividad.py): quién vio o modificó fichas y reservas.
+# Los eventos se acumulan en memoria (a lo más ACTIVIDAD_BUFFER por proceso) y se
+# insertan por lotes de ACTIVIDAD_LOTE o cada ACTIVIDAD_INTERVALO_SEGUNDOS.
+ACTIVIDAD_BUFFER = 10000
+ACTIVIDAD_LOTE = 200
+ACTIVIDAD_INTERVALO_SEGUNDOS = 5
+
+# Tareas periódicas (ficha_medica/scheduler.py). Se inician al cargar la app salvo
+# con SCHEDULER_AUTOINICIO=0; en producción las inicia manage.py run_workers.
+# El candado evita que dos procesos del mismo servidor las ejecuten a la vez.
+SCHEDULER_AUTOINICIO = os.environ.get('SCHEDULER_AUTOINICIO', '1') == '1'
+SCHEDULER_LOCK = os.environ.get('SCHEDULER_LOCK', os.path.join(BASE_DIR, 'cache', 'scheduler.lock'))
+
 # Configuración de autenticación personalizada
 AUTH_USER_MODEL = 'auth.User'
 USERNAME_FIELD = 'username'
@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from ficha_medica import views as ficha_medica_views
+from ficha_medica import views_async
 from django.contrib.auth import views as auth_views
+
+# Endpoints JSON de sondeo: versión async bajo ASGI (ficha_medica/views_async.py).
+vistas_api = views_async if settings.VISTAS_ASYNC else ficha_medica_views
  
 urlpatterns = [
     # Página principal (Inicio de sesión y redirección por rol)
@@ -22,6 +27,9 @@ urlpatterns = [
     path('reserva/crear/', ficha_medica_views.crear_reserva, name='crear_reserva'),
     path('crear-paciente/', ficha_medica_views.crear_paciente, name='crear_paciente'),
     path('pacientes/', ficha_medica_views.listar_pacientes, name='listar_pacientes'),
+    path('pacientes/importar/', ficha_medica_views.importar_pacientes, name='importar_pacientes'),
+    path('pacientes/importar/<int:tarea_id>/', ficha_medica_views.estado_importacion_pacientes, name='estado_importacion_pacientes'),
+    path('pacientes/importar/<int:tarea_id>/errores/', ficha_medica_views.reporte_importacion_pacientes, name='reporte_importacion_pacientes'),
     path('pacientes/modificar/<int:paciente_id>/', ficha_medica_views.modificar_paciente, name='modificar_paciente'),
     path('pacientes/eliminar/<int:paciente_id>/', ficha_medica_views.eliminar_paciente, name='eliminar_paciente'),
     path('reservas/modificar/<int:reserva_id>/', ficha_medica_views.modificar_reserva, name='modificar_reserva'),
@@ -37,15 +45,39 @@ urlpatterns = [
     path('disponibilidades/', ficha_medica_views.gestionar_disponibilidades, name='gestionar_disponibilidades'),
     path('disponibilidades/eliminar/<int:disponibilidad_id>/', ficha_medica_views.eliminar_disponibilidad, name='eliminar_disponibilidad'),
     path('marcar-notificacion-leida/<int:notificacion_id>/', ficha_medica_views.marcar_notificacion_leida, name='marcar_notificacion_leida'),
-    path('notificaciones/ajax/', ficha_medica_views.obtener_notificaciones, name='obtener_notificaciones'),
-    path('reservas/activas/', ficha_medica_views.obtener_reservas_activas, name='obtener_reservas_activas'),
+    path('notificaciones/ajax/', vistas_api.obtener_notificaciones, name='obtener_notificaciones'),
+    path('reservas/activas/', vistas_api.obtener_reservas_activas, name='obtener_reservas_activas'),
     path('modificar-disponibilidad/', ficha_medica_views.modificar_disponibilidad, name='modificar_disponibilidad'),
     path('ficha/<int:ficha_id>/pdf/', ficha_medica_views.generar_ficha_pdf, name='generar_ficha_pdf'),
+    path('api/lista_espera/', ficha_medica_views.api_lista_espera, name='api_lista_espera'),
+    path('api/lista_espera/<int:espera_id>/aceptar/', ficha_medica_views.api_lista_espera_aceptar, name='api_lista_espera_aceptar'),
+    path('api/lista_espera/<int:espera_id>/rechazar/', ficha_medica_views.api_lista_espera_rechazar, name='api_lista_espera_rechazar'),
+    path('api/medicos/<int:medico_id>/reprogramar/', ficha_medica_views.api_reprogramar_medico, name='api_reprogramar_medico'),
+    path('api/reportes/utilizacion/', ficha_medica_views.api_reporte_utilizacion, name='api_reporte_utilizacion'),
+    path('api/disponibilidades/calendario/', ficha_medica_views.api_calendario_disponibilidad, name='api_calendario_disponibilidad'),
+    path('api/medico/agenda/', ficha_medica_views.api_agenda_medico, name='api_agenda_medico'),
+    path('api/pacientes/<str:paciente_rut>/linea_tiempo/', ficha_medica_views.api_linea_tiempo_paciente, name='api_linea_tiempo_paciente'),
+    path('medico/fichas/historial/<str:paciente_rut>/pdf/', ficha_medica_views.generar_historial_pdf, name='generar_historial_pdf'),
+    path('fichas/exportar/pdf/', ficha_medica_views.exportar_fichas_pdf, name='exportar_fichas_pdf'),
+    path('fichas/exportar/pdf/<str:exportacion_id>/progreso/', ficha_medica_views.progreso_exportacion_pdf, name='progreso_exportacion_pdf'),
+    path('fichas/exportar/pdf/tarea/<int:tarea_id>/', ficha_medica_views.estado_exportacion_pdf, name='estado_exportacion_pdf'),
+    path('fichas/exportar/pdf/tarea/<int:tarea_id>/descargar/', ficha_medica_views.descargar_exportacion_pdf, name='descargar_exportacion_pdf'),
+
+    # Exportaciones (CSV/JSONL en streaming)
+    path('exportar/reservas/', ficha_medica_views.exportar_reservas, name='exportar_reservas'),
+    path('exportar/fichas/', ficha_medica_views.exportar_fichas, name='exportar_fichas'),
+    path('exportar/pacientes/', ficha_medica_views.exportar_pacientes, name='exportar_pacientes'),
 
     # APIs
-    path('api/medicos/', ficha_medica_views.api_medicos, name='api_medicos'),
-    path('api/disponibilidades/', ficha_medica_views.api_disponibilidades, name='api_disponibilidades'),
-    path('api/validar_rut/', ficha_medica_views.api_validar_rut, name='api_validar_rut'),
+    path('api/medicos/', vistas_api.api_medicos, name='api_medicos'),
+    path('api/disponibilidades/', vistas_api.api_disponibilidades, name='api_disponibilidades'),
+    path('api/validar_rut/', vistas_api.api_validar_rut, name='api_validar_rut'),
+    path('api/pacientes/buscar/', ficha_medica_views.api_buscar_pacientes, name='api_buscar_pacientes'),
+    path('api/fichas/buscar/', ficha_medica_views.api_buscar_fichas, name='api_buscar_fichas'),
+    path('api/validar_ruts/', ficha_medica_views.api_validar_ruts, name='api_validar_ruts'),
+
+    # Métricas de Prometheus
+    path('metrics', ficha_medica_views.metricas, name='metricas'),
 
     # Panel de administración
     path('admin/', admin.site.urls),
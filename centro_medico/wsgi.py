@@ -10,5 +10,5 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nombre_proyecto.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
 application = get_wsgi_application()
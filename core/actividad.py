@@ -0,0 +1,122 @@
+"""
+Registro de actividad de los usuarios (``core.models.UserActivity``).
+
+Las vistas de fichas y reservas anotan quién vio o modificó qué:
+``actividad_lectura`` decora las vistas de consulta y ``registrar_actividad``
+se llama donde se guarda un cambio. Anotar no escribe en la base. El evento,
+con su hora, va a un búfer circular en memoria de ``ACTIVIDAD_BUFFER``
+eventos. Un hilo de fondo por proceso los inserta con ``bulk_create`` al
+juntarse ``ACTIVIDAD_LOTE`` o cada ``ACTIVIDAD_INTERVALO_SEGUNDOS``.
+
+Si la base no da abasto y el búfer se llena, se descartan los eventos más
+antiguos. Un lote que falla por un error transitorio (``OperationalError``:
+base bloqueada, conexión caída) vuelve al búfer; si el error es permanente
+(por ejemplo, ``IntegrityError`` por un usuario eliminado) reintentarlo no
+lo arreglaría y se descarta. Los descartes se cuentan en la métrica
+``actividad_descartada_total``, por motivo. Al terminar un worker se insertan
+los pendientes (``vaciar``, desde ``gunicorn.conf.py`` y ``atexit``).
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections
+from django.utils.timezone import now
+
+from .metricas import contar
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+_condicion = threading.Condition()
+_escritura = threading.Lock()  # Un solo vaciado a la vez (el hilo y el cierre del proceso)
+_estado = {'pid': None, 'buffer': None}
+
+
+def _buffer():
+    """El búfer de este proceso; lo crea (también tras un fork) y arranca el hilo que lo vacía."""
+    if _estado['pid'] != os.getpid():
+        with _condicion:
+            if _estado['pid'] != os.getpid():
+                _estado['buffer'] = deque(maxlen=settings.ACTIVIDAD_BUFFER)
+                _estado['pid'] = os.getpid()
+                threading.Thread(target=_vaciar_periodicamente, daemon=True, name='actividad').start()
+                atexit.register(vaciar)
+    return _estado['buffer']
+
+
+def registrar_actividad(usuario, actividad):
+    """Anota una actividad de ``usuario``; se guarda en segundo plano."""
+    buffer = _buffer()
+    with _condicion:
+        if len(buffer) == buffer.maxlen:
+            contar('actividad_descartada_total', (('motivo', 'buffer_lleno'),))  # deque descarta el más antiguo
+        buffer.append((usuario.pk, actividad, now()))
+        if len(buffer) >= settings.ACTIVIDAD_LOTE:
+            _condicion.notify()
+
+
+def actividad_lectura(plantilla):
+    """
+    Anota ``plantilla``, completada con los argumentos de la URL, cuando la
+    vista responde con éxito (2xx) a un GET. Va después de ``role_required``.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            respuesta = vista(request, *args, **kwargs)
+            if request.method == 'GET' and 200 <= respuesta.status_code < 300:
+                registrar_actividad(request.user, plantilla.format(**kwargs))
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def _vaciar_periodicamente():
+    while True:
+        with _condicion:
+            _condicion.wait_for(
+                lambda: len(_estado['buffer']) >= settings.ACTIVIDAD_LOTE,
+                timeout=settings.ACTIVIDAD_INTERVALO_SEGUNDOS,
+            )
+        try:
+            vaciar()
+        except Exception:
+            logger.exception("Error al guardar el registro de actividad.")
+
+
+def vaciar():
+    """Inserta en la base los eventos pendientes de este proceso."""
+    if _estado['pid'] != os.getpid():
+        return
+    buffer = _estado['buffer']
+    with _escritura:
+        while True:
+            with _condicion:
+                lote = [buffer.popleft() for _ in range(min(len(buffer), settings.ACTIVIDAD_LOTE))]
+            if not lote:
+                return
+            close_old_connections()
+            try:
+                UserActivity.objects.bulk_create(
+                    [UserActivity(user_id=usuario_id, activity=actividad, timestamp=momento)
+                     for usuario_id, actividad, momento in lote]
+                )
+            except OperationalError as error:
+                # Vuelven al frente del búfer para el próximo intento, sin desplazar a los nuevos.
+                with _condicion:
+                    devueltos = lote[-(buffer.maxlen - len(buffer)):] if len(buffer) < buffer.maxlen else []
+                    buffer.extendleft(reversed(devueltos))
+                if len(lote) > len(devueltos):
+                    contar('actividad_descartada_total', (('motivo', 'error_base'),), len(lote) - len(devueltos))
+                logger.error(f"No se pudo guardar el registro de actividad ({len(lote)} eventos): {error}")
+                return
+            except DatabaseError as error:
+                contar('actividad_descartada_total', (('motivo', 'error_permanente'),), len(lote))
+                logger.error(f"Registro de actividad descartado ({len(lote)} eventos): {error}")
+                continue
+            contar('actividad_registrada_total', (), len(lote))
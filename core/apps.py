@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import autenticacion  # noqa: F401 (invalida el usuario cacheado al modificarlo)
+        from . import consultas_lentas, metricas  # noqa: F401 (miden las consultas de cada conexión nueva)
+        from .perfilado import instalar_perfilado_plantillas
+        instalar_perfilado_plantillas()
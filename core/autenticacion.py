@@ -0,0 +1,65 @@
+"""
+Usuario autenticado en caché.
+
+``UsuarioCacheadoBackend`` es el ``ModelBackend`` de Django, pero ``get_user``
+(que ``AuthenticationMiddleware`` llama en cada petición autenticada) toma el
+usuario de la caché de sesiones, con los nombres de sus grupos en
+``nombres_grupos``. Con eso, ``role_required`` (``tiene_rol``) no consulta la
+base. La entrada se borra al guardar o eliminar el usuario y al cambiar sus
+grupos, y en todo caso vence a los ``USUARIO_CACHE_SEGUNDOS``. La verificación del hash
+de sesión (cambio de contraseña) la sigue haciendo Django con el usuario
+cacheado.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .sesiones import CacheTolerante
+
+
+def _cache():
+    # Si la caché falla se lee el usuario de la base, como las sesiones.
+    return CacheTolerante(caches[settings.SESSION_CACHE_ALIAS])
+
+
+def _clave(usuario_id):
+    return f'auth_usuario:{usuario_id}'
+
+
+def invalidar_usuario(*usuario_ids):
+    _cache().delete_many([_clave(usuario_id) for usuario_id in usuario_ids])
+
+
+class UsuarioCacheadoBackend(ModelBackend):
+    def get_user(self, user_id):
+        usuario = _cache().get(_clave(user_id))
+        if usuario is None:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            usuario.nombres_grupos = frozenset(usuario.groups.values_list('name', flat=True))
+            _cache().set(_clave(user_id), usuario, settings.USUARIO_CACHE_SEGUNDOS)
+        return usuario if self.user_can_authenticate(usuario) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario_modificado(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_grupos_usuario(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidar_usuario(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear(): después ya no se sabe qué usuarios tenía el grupo.
+        instance._usuarios_antes_de_vaciar = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidar_usuario(*instance.__dict__.pop('_usuarios_antes_de_vaciar', []))
+    elif action.startswith('post_'):
+        invalidar_usuario(*pk_set)  # group.user_set.add(...): pk_set son usuarios
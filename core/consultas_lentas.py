@@ -0,0 +1,210 @@
+"""
+Registro de consultas lentas.
+
+Un ``execute_wrapper``, instalado en cada conexión al abrirse, mide cada
+consulta. Las que superan ``CONSULTAS_LENTAS_MS`` se registran en
+``CONSULTAS_LENTAS_LOG`` (una línea JSON por consulta) y en el logger de este
+módulo. Cada registro trae:
+
+- el origen: la vista (``ConsultasLentasMiddleware``), la tarea de la cola o
+  el trabajo del scheduler (``origen_consultas``);
+- una huella del SQL normalizado (sin literales y con las listas ``IN``
+  colapsadas), que agrupa las consultas iguales con distintos parámetros;
+- la primera vez que el proceso ve una huella, su ``EXPLAIN QUERY PLAN``.
+
+No se guardan los parámetros, porque pueden contener datos de pacientes.
+``manage.py reporte_consultas_lentas`` agrupa el archivo por huella.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+# Huellas ya explicadas en este proceso (acotado por si el SQL no se normaliza bien).
+MAX_EXPLICADAS = 10000
+
+_origen = ContextVar('origen_consultas', default=None)
+_explicadas = set()
+
+_LITERALES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),  # VALUES de bulk_create
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalizar_sql(sql):
+    for patron, reemplazo in _LITERALES:
+        sql = patron.sub(reemplazo, sql)
+    return sql.strip()
+
+
+def huella(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+@contextmanager
+def origen_consultas(origen):
+    """
+    Atribuye las consultas lentas del bloque a ``origen``: un nombre (tareas y
+    trabajos del scheduler) o la petición en curso.
+    """
+    token = _origen.set(origen)
+    try:
+        yield
+    finally:
+        _origen.reset(token)
+
+
+def _nombre_origen():
+    origen = _origen.get()
+    if origen is None or isinstance(origen, str):
+        return origen or 'sin_origen'
+    # Una petición: su vista, si ya se resolvió.
+    coincidencia = getattr(origen, 'resolver_match', None)
+    return f"vista:{coincidencia.view_name}" if coincidencia else f"ruta:{origen.path}"
+
+
+def _plan(conexion, sql, params, many):
+    if many:
+        params = next(iter(params), None)
+    prefijo = 'EXPLAIN QUERY PLAN ' if conexion.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        # Cursor del backend, sin execute_wrappers: no se mide ni reemplaza el resultado en curso.
+        cursor = conexion.create_cursor()
+        try:
+            cursor.execute(prefijo + sql, params)
+            return [str(fila[-1]) for fila in cursor.fetchall()]  # El detalle va en la última columna
+        finally:
+            cursor.close()
+    except Exception as error:
+        return [f"No se pudo obtener el plan: {error}"]
+
+
+def _registrar(conexion, sql, params, many, duracion):
+    normalizado = normalizar_sql(sql)
+    clave = huella(normalizado)
+    registro = {
+        'momento': now().isoformat(),
+        'huella': clave,
+        'ms': round(duracion * 1000, 2),
+        'origen': _nombre_origen(),
+        'base': conexion.alias,
+        'sql': normalizado,
+    }
+    if clave not in _explicadas and len(_explicadas) < MAX_EXPLICADAS:
+        _explicadas.add(clave)
+        registro['plan'] = _plan(conexion, sql, params, many)
+    logger.warning(f"Consulta lenta ({registro['ms']:.0f} ms) en {registro['origen']} [{clave}]: {normalizado[:300]}")
+    try:
+        os.makedirs(os.path.dirname(settings.CONSULTAS_LENTAS_LOG), exist_ok=True)
+        # Una sola escritura en modo append: las líneas de varios procesos no se mezclan.
+        with open(settings.CONSULTAS_LENTAS_LOG, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    except OSError as error:
+        logger.error(f"No se pudo escribir el registro de consultas lentas: {error}")
+
+
+def _medir(execute, sql, params, many, context):
+    inicio = time.perf_counter()
+    resultado = execute(sql, params, many, context)
+    duracion = time.perf_counter() - inicio
+    if settings.CONSULTAS_LENTAS_MS and duracion * 1000 >= settings.CONSULTAS_LENTAS_MS:
+        _registrar(context['connection'], sql, params, many, duracion)
+    return resultado
+
+
+@receiver(connection_created)
+def instalar_registro_consultas_lentas(sender, connection, **kwargs):
+    if _medir not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir)
+
+
+def resumen_consultas_lentas(ruta=None, desde=None, origen=None):
+    """
+    Agrupa el registro por huella, ordenado por tiempo total. ``desde`` (un
+    ``datetime`` con zona) y ``origen`` (texto contenido en el origen) filtran
+    los registros.
+    """
+    grupos = {}
+    try:
+        archivo = open(ruta or settings.CONSULTAS_LENTAS_LOG, encoding='utf-8')
+    except FileNotFoundError:
+        return []
+    with archivo:
+        for linea in archivo:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue  # Línea truncada (por ejemplo, si se llenó el disco)
+            if desde and datetime.fromisoformat(registro['momento']) < desde:
+                continue
+            if origen and origen not in registro['origen']:
+                continue
+            grupo = grupos.setdefault(registro['huella'], {
+                'huella': registro['huella'], 'sql': registro['sql'], 'veces': 0, 'total_ms': 0.0,
+                'maximo_ms': 0.0, 'origenes': Counter(), 'plan': None, 'ultima': registro['momento'],
+            })
+            grupo['veces'] += 1
+            grupo['total_ms'] += registro['ms']
+            grupo['maximo_ms'] = max(grupo['maximo_ms'], registro['ms'])
+            grupo['origenes'][registro['origen']] += 1
+            grupo['plan'] = registro.get('plan') or grupo['plan']
+            grupo['ultima'] = max(grupo['ultima'], registro['momento'])
+    for grupo in grupos.values():
+        grupo['promedio_ms'] = grupo['total_ms'] / grupo['veces']
+    return sorted(grupos.values(), key=lambda grupo: grupo['total_ms'], reverse=True)
+
+
+def _iterar_con_origen(request, contenido):
+    # El contenido en streaming se genera después de que el middleware retorna.
+    with origen_consultas(request):
+        yield from contenido
+
+
+def _con_origen(request, respuesta):
+    # Los FileResponse no consultan la base y así conservan el envío directo del archivo.
+    if respuesta.streaming and not respuesta.is_async and getattr(respuesta, 'file_to_stream', None) is None:
+        respuesta.streaming_content = _iterar_con_origen(request, respuesta.streaming_content)
+    return respuesta
+
+
+class ConsultasLentasMiddleware:
+    """Atribuye las consultas lentas de la petición a su vista."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with origen_consultas(request):
+            respuesta = self.get_response(request)
+        return _con_origen(request, respuesta)
+
+    async def __acall__(self, request):
+        with origen_consultas(request):
+            respuesta = await self.get_response(request)
+        return _con_origen(request, respuesta)
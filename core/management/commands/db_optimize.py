@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CHECKPOINTS = ('passive', 'full', 'restart', 'truncate')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mantenimiento de la base SQLite: ANALYZE y PRAGMA optimize (siempre), "
+        "checkpoint del WAL y, opcionalmente, VACUUM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--vacuum', action='store_true',
+                            help="Reescribe la base para recuperar espacio (bloquea las escrituras mientras dura).")
+        parser.add_argument('--checkpoint', choices=CHECKPOINTS, default='truncate',
+                            help="Modo de wal_checkpoint (por defecto truncate, que además vacía el archivo WAL).")
+
+    def _paso(self, cursor, sentencia):
+        inicio = time.perf_counter()
+        cursor.execute(sentencia)
+        resultado = cursor.fetchall()
+        self.stdout.write(f"{sentencia}: {time.perf_counter() - inicio:.2f} s")
+        return resultado
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'sqlite':
+            raise CommandError("db_optimize solo aplica a bases SQLite.")
+        ruta = str(conexion.settings_dict['NAME'])
+        tamano_inicial = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+
+        with conexion.cursor() as cursor:
+            self._paso(cursor, "ANALYZE")
+            self._paso(cursor, "PRAGMA optimize")
+            if options['vacuum']:
+                self._paso(cursor, "VACUUM")
+            bloqueado, paginas_wal, copiadas = self._paso(cursor, f"PRAGMA wal_checkpoint({options['checkpoint'].upper()})")[0]
+            modo = self._paso(cursor, "PRAGMA journal_mode")[0][0]
+
+        if bloqueado:
+            self.stdout.write(self.style.WARNING(
+                f"El checkpoint no pudo completarse por lectores activos ({copiadas} de {paginas_wal} páginas copiadas)."
+            ))
+        tamano_final = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Base optimizada (journal_mode={modo}): {tamano_inicial / 2**20:.1f} MiB -> {tamano_final / 2**20:.1f} MiB."
+        ))
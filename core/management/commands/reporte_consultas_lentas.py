@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import make_aware
+
+from core.consultas_lentas import resumen_consultas_lentas
+
+
+class Command(BaseCommand):
+    help = "Consultas lentas registradas, agrupadas por huella y ordenadas por tiempo total."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="Cantidad de consultas a mostrar.")
+        parser.add_argument('--desde', help="Solo registros desde este día (AAAA-MM-DD).")
+        parser.add_argument('--origen', help="Solo registros cuyo origen contenga este texto (por ejemplo, una vista).")
+        parser.add_argument('--archivo', help="Registro a leer (por defecto CONSULTAS_LENTAS_LOG).")
+        parser.add_argument('--sin-planes', action='store_true', help="No mostrar el EXPLAIN QUERY PLAN.")
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = make_aware(datetime.strptime(options['desde'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError("Formato de fecha inválido. Use el formato AAAA-MM-DD.")
+
+        grupos = resumen_consultas_lentas(options['archivo'], desde, options['origen'])
+        if not grupos:
+            self.stdout.write("No hay consultas lentas registradas.")
+            return
+        for posicion, grupo in enumerate(grupos[:options['top']], start=1):
+            origenes = ', '.join(f"{nombre} ({veces})" for nombre, veces in grupo['origenes'].most_common(3))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{posicion}. [{grupo['huella']}] total {grupo['total_ms'] / 1000:.2f} s, {grupo['veces']} veces, "
+                f"prom. {grupo['promedio_ms']:.0f} ms, máx. {grupo['maximo_ms']:.0f} ms"
+            ))
+            self.stdout.write(f"   Origen: {origenes}")
+            self.stdout.write(f"   Última: {grupo['ultima']}")
+            self.stdout.write(f"   SQL: {grupo['sql'][:500]}")
+            if grupo['plan'] and not options['sin_planes']:
+                self.stdout.write("   Plan:")
+                for paso in grupo['plan']:
+                    self.stdout.write(f"     {paso}")
+        if len(grupos) > options['top']:
+            self.stdout.write(f"\n({len(grupos) - options['top']} huellas más; use --top para verlas.)")
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replicas import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia la base SQLite primaria sobre la réplica con la API de backup en línea "
+        "(sin detener las escrituras). Con --intervalo se repite indefinidamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, help="Segundos entre copias; sin él se copia una vez.")
+        parser.add_argument('--paginas', type=int, default=-1,
+                            help="Páginas por paso (por defecto todas en uno; con WAL la copia no bloquea a los escritores).")
+
+    def copiar(self, origen, destino, paginas):
+        inicio = time.perf_counter()
+        with sqlite3.connect(origen) as primario, sqlite3.connect(destino) as replica:
+            primario.backup(replica, pages=paginas)
+        self.stdout.write(f"Réplica sincronizada en {time.perf_counter() - inicio:.2f} s.")
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError("No hay réplica configurada (variable de entorno SQLITE_REPLICA_PATH).")
+        origen = str(settings.DATABASES['default']['NAME'])
+        destino = str(settings.DATABASES[REPLICA_ALIAS]['NAME'])
+        while True:
+            self.copiar(origen, destino, options['paginas'])
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,310 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus.
+
+``MetricasMiddleware`` registra, por nombre de URL, la latencia, el estado y
+el tamaño de cada respuesta, además de cuántas consultas hizo la petición y
+cuánto tardaron. Las consultas se miden con un ``execute_wrapper`` que se
+instala en cada conexión al abrirse. Sus totales se acumulan en una variable
+de contexto, que también sigue a las vistas ``async`` en los hilos del ORM.
+``medir_tarea`` mide los trabajos del scheduler y las tareas de la cola.
+
+Cada hilo escribe en su propio fragmento de contadores, sin candados ni
+contención. Solo al exportar se suman los fragmentos del proceso. Como
+gunicorn tiene varios workers, cada proceso vuelca su resumen en
+``METRICAS_DIR/<pid>-<id>.json`` cada ``METRICAS_INTERVALO_SEGUNDOS`` y al
+terminar. ``/metrics`` suma todos esos archivos. Cuando un worker se recicla,
+el maestro de gunicorn pasa su archivo a ``acumulado.json``
+(``consolidar_proceso``), así los contadores no retroceden.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from glob import glob
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .consultas_lentas import origen_consultas
+
+PREFIJO = 'centro_medico_'
+LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TAMANO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+TAREAS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# nombre: (tipo, ayuda, límites de los buckets)
+METRICAS = {
+    'peticiones_total': ('counter', "Peticiones atendidas por vista, método y estado.", None),
+    'peticion_segundos': ('histogram', "Duración de la petición.", LATENCIA),
+    'respuesta_bytes': ('histogram', "Tamaño del cuerpo de la respuesta (sin streaming).", TAMANO),
+    'consultas_por_peticion': ('histogram', "Consultas a la base por petición.", CONSULTAS),
+    'consultas_segundos': ('histogram', "Tiempo total en la base por petición.", LATENCIA),
+    'tarea_programada_segundos': ('histogram', "Duración de los trabajos del scheduler.", TAREAS),
+    'tarea_programada_errores_total': ('counter', "Trabajos del scheduler que terminaron con error.", None),
+    'tarea_cola_segundos': ('histogram', "Duración de las tareas de la cola, por intento.", TAREAS),
+    'tarea_cola_errores_total': ('counter', "Intentos de tareas de la cola que terminaron con error.", None),
+    'actividad_registrada_total': ('counter', "Eventos de actividad guardados en la base.", None),
+    'actividad_descartada_total': ('counter', "Eventos de actividad descartados, por motivo.", None),
+}
+
+# [número de consultas, segundos] de la petición en curso.
+_consultas = ContextVar('metricas_consultas', default=None)
+
+
+class _Fragmento:
+    """Contadores de un hilo. Solo ese hilo los modifica."""
+
+    def __init__(self):
+        self.valores = {}
+
+    def sumar(self, nombre, etiquetas, valor=1):
+        clave = (nombre, etiquetas)
+        self.valores[clave] = self.valores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        limites = METRICAS[nombre][2]
+        clave = (nombre, etiquetas)
+        serie = self.valores.get(clave)
+        if serie is None:
+            serie = self.valores[clave] = [0] * (len(limites) + 3)  # buckets, +Inf, suma, cuenta
+        serie[bisect_left(limites, valor)] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+
+_local = threading.local()
+_fragmentos = []
+_proceso = {'pid': None, 'archivo': None}
+_inicio_proceso = threading.Lock()
+
+
+def _fragmento():
+    fragmento = getattr(_local, 'fragmento', None)
+    if fragmento is None or _proceso['pid'] != os.getpid():
+        _preparar_proceso()
+        fragmento = _local.fragmento = _Fragmento()
+        _fragmentos.append(fragmento)
+    return fragmento
+
+
+def _preparar_proceso():
+    """Una vez por proceso (también tras un fork): archivo propio y volcado periódico."""
+    with _inicio_proceso:
+        if _proceso['pid'] == os.getpid():
+            return
+        _fragmentos.clear()  # Los heredados del proceso padre no son de este
+        _proceso['pid'] = os.getpid()
+        _proceso['archivo'] = os.path.join(settings.METRICAS_DIR, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        threading.Thread(target=_volcar_periodicamente, daemon=True, name='metricas').start()
+
+
+def _volcar_periodicamente():
+    while True:
+        time.sleep(settings.METRICAS_INTERVALO_SEGUNDOS)
+        volcar()
+
+
+def _resumen():
+    """Suma de los fragmentos de este proceso."""
+    total = {}
+    for fragmento in list(_fragmentos):
+        for clave, valor in list(fragmento.valores.items()):
+            _acumular(total, clave, valor)
+    return total
+
+
+def _acumular(total, clave, valor):
+    if isinstance(valor, list):
+        actual = total.get(clave)
+        total[clave] = list(valor) if actual is None else [a + b for a, b in zip(actual, valor)]
+    else:
+        total[clave] = total.get(clave, 0) + valor
+
+
+def _escribir(ruta, resumen):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w') as archivo:
+        json.dump([[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in resumen.items()], archivo)
+    os.replace(temporal, ruta)
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as archivo:
+            filas = json.load(archivo)
+    except (OSError, ValueError):
+        return {}
+    return {(nombre, tuple(tuple(par) for par in etiquetas)): valor for nombre, etiquetas, valor in filas}
+
+
+def volcar():
+    """Escribe el resumen de este proceso en su archivo de ``METRICAS_DIR``."""
+    if _proceso['pid'] == os.getpid():
+        _escribir(_proceso['archivo'], _resumen())
+
+
+def consolidar_proceso(pid):
+    """Pasa los archivos del proceso ``pid`` (ya terminado) a ``acumulado.json``."""
+    archivos = glob(os.path.join(settings.METRICAS_DIR, f'{pid}-*.json'))
+    if not archivos:
+        return
+    acumulado_ruta = os.path.join(settings.METRICAS_DIR, 'acumulado.json')
+    acumulado = _leer(acumulado_ruta)
+    for ruta in archivos:
+        for clave, valor in _leer(ruta).items():
+            _acumular(acumulado, clave, valor)
+    _escribir(acumulado_ruta, acumulado)
+    for ruta in archivos:
+        os.remove(ruta)
+
+
+def limpiar():
+    """Borra los archivos de una ejecución anterior (al iniciar el servidor)."""
+    for ruta in glob(os.path.join(settings.METRICAS_DIR, '*.json')):
+        os.remove(ruta)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(etiquetas, extra=()):
+    pares = [*etiquetas, *extra]
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+def exposicion():
+    """Texto de Prometheus con las métricas de todos los procesos del servidor."""
+    volcar()
+    total = {}
+    for ruta in glob(os.path.join(settings.METRICAS_DIR, '*.json')):
+        for clave, valor in _leer(ruta).items():
+            _acumular(total, clave, valor)
+
+    lineas = []
+    for nombre, (tipo, ayuda, limites) in METRICAS.items():
+        series = sorted((etiquetas, valor) for (metrica, etiquetas), valor in total.items() if metrica == nombre)
+        if not series:
+            continue
+        lineas += [f'# HELP {PREFIJO}{nombre} {ayuda}', f'# TYPE {PREFIJO}{nombre} {tipo}']
+        for etiquetas, valor in series:
+            if tipo == 'counter':
+                lineas.append(f'{PREFIJO}{nombre}{_etiquetas(etiquetas)} {valor}')
+                continue
+            acumulado = 0
+            for limite, cuenta in zip([*limites, '+Inf'], valor):
+                acumulado += cuenta
+                lineas.append(f'{PREFIJO}{nombre}_bucket{_etiquetas(etiquetas, [("le", limite)])} {acumulado}')
+            lineas.append(f'{PREFIJO}{nombre}_sum{_etiquetas(etiquetas)} {valor[-2]}')
+            lineas.append(f'{PREFIJO}{nombre}_count{_etiquetas(etiquetas)} {valor[-1]}')
+    return '\n'.join(lineas) + '\n'
+
+
+def contar(nombre, etiquetas, valor=1):
+    """Suma ``valor`` al contador ``nombre`` (uno de ``METRICAS``) con esas etiquetas."""
+    _fragmento().sumar(nombre, etiquetas, valor)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    acumulado = _consultas.get()
+    if acumulado is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        acumulado[0] += 1
+        acumulado[1] += time.perf_counter() - inicio
+
+
+@receiver(connection_created)
+def instalar_medicion_consultas(sender, connection, **kwargs):
+    # Sin CONN_MAX_AGE el mismo objeto se reconecta en cada petición.
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+def _vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return 'sin_ruta'
+    return coincidencia.view_name or coincidencia.route
+
+
+def _registrar(request, respuesta, inicio, consultas):
+    duracion = time.perf_counter() - inicio
+    vista = _vista(request)
+    fragmento = _fragmento()
+    fragmento.sumar('peticiones_total', (('vista', vista), ('metodo', request.method), ('estado', respuesta.status_code)))
+    fragmento.observar('peticion_segundos', (('vista', vista), ('metodo', request.method)), duracion)
+    if not respuesta.streaming:
+        fragmento.observar('respuesta_bytes', (('vista', vista),), len(respuesta.content))
+    fragmento.observar('consultas_por_peticion', (('vista', vista),), consultas[0])
+    fragmento.observar('consultas_segundos', (('vista', vista),), consultas[1])
+    return respuesta
+
+
+class MetricasMiddleware:
+    """Latencia, estado, tamaño y consultas de cada petición, por nombre de URL. Va primero en ``MIDDLEWARE``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio, consultas = time.perf_counter(), [0, 0.0]
+        token = _consultas.set(consultas)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _consultas.reset(token)
+        return _registrar(request, respuesta, inicio, consultas)
+
+    async def __acall__(self, request):
+        inicio, consultas = time.perf_counter(), [0, 0.0]
+        token = _consultas.set(consultas)
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _consultas.reset(token)
+        return _registrar(request, respuesta, inicio, consultas)
+
+
+def medir_tarea(funcion, nombre=None, origen='scheduler'):
+    """
+    Registra la duración de un trabajo del scheduler (``origen='scheduler'``)
+    o de una tarea de la cola (``origen='tarea'``) y si terminó con error.
+    Sus consultas lentas quedan a nombre del trabajo.
+    """
+    nombre = nombre or funcion.__name__
+    etiquetas = (('tarea', nombre),)
+    metrica = 'tarea_programada' if origen == 'scheduler' else 'tarea_cola'
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            with origen_consultas(f"{origen}:{nombre}"):
+                return funcion(*args, **kwargs)
+        except Exception:
+            _fragmento().sumar(f'{metrica}_errores_total', etiquetas)
+            raise
+        finally:
+            _fragmento().observar(f'{metrica}_segundos', etiquetas, time.perf_counter() - inicio)
+    return envoltura
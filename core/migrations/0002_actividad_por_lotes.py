@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 02:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivity',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha y hora'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'timestamp'], name='core_userac_user_id_536d16_idx'),
+        ),
+    ]
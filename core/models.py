@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User  # Importar el modelo de usuario predeterminado de Django
+from django.utils import timezone
 
 class UserActivity(models.Model):
     """
@@ -7,7 +8,11 @@ class UserActivity(models.Model):
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="activities")
     activity = models.TextField(verbose_name="Descripción de la actividad")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Fecha y hora")
+    # La hora del evento, no la de la inserción: se guardan en lotes (core/actividad.py).
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Fecha y hora")
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'timestamp'])]
 
     def __str__(self):
         return f"{self.user.username} realizó: {self.activity} en {self.timestamp}"
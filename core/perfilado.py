@@ -0,0 +1,293 @@
+"""
+Perfilado de peticiones y trabajos a demanda.
+
+``PerfiladoMiddleware`` perfila una fracción ``PERFILADO_MUESTREO`` de las
+peticiones. Un usuario staff también puede pedirlo en una petición puntual,
+con la cabecera ``X-Perfilar: 1`` o el parámetro ``?perfilar=1``. Cubre todas
+las vistas, incluidas las que generan PDF. En las respuestas en streaming
+también se perfila la generación de cada bloque. ``perfilar_tarea`` hace lo
+mismo con los trabajos del scheduler y las tareas de la cola
+(``PERFILADO_TAREAS_MUESTREO``).
+
+Por cada perfil se guardan dos archivos en ``PERFILADO_DIR/<día>/``:
+
+- ``<nombre>.prof``: el volcado de cProfile (``python -m pstats``, snakeviz);
+- ``<nombre>.json``: el origen, la duración, las consultas (SQL normalizado y
+  sus tiempos), las plantillas renderizadas con su tiempo y las funciones
+  con más tiempo acumulado.
+
+Se conservan los ``PERFILADO_MAX_ARCHIVOS`` perfiles más recientes. Bajo
+ASGI, cProfile solo ve el hilo del bucle de eventos. Las consultas y las
+plantillas sí se miden también en los hilos del ORM.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+from glob import glob
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import base as plantillas
+from django.utils.timezone import localtime, now
+
+from .consultas_lentas import normalizar_sql
+
+logger = logging.getLogger(__name__)
+
+CABECERA = 'HTTP_X_PERFILAR'
+PARAMETRO = 'perfilar'
+# Funciones del resumen JSON, por tiempo acumulado.
+FUNCIONES_RESUMEN = 40
+
+_perfil_actual = ContextVar('perfil_actual', default=None)
+_hilo = threading.local()
+
+
+class Perfil:
+    """cProfile, consultas y plantillas de una petición o un trabajo."""
+
+    def __init__(self, origen):
+        self.origen = origen
+        self.perfilador = cProfile.Profile()
+        self.consultas = []
+        self.plantillas = []
+        self.momento = now()
+        self.segundos = 0.0
+        self._token = None
+        self._inicio = None
+        self._cprofile = False
+
+    def reanudar(self):
+        self._token = _perfil_actual.set(self)
+        self._inicio = time.perf_counter()
+        # Un solo cProfile por hilo: bajo ASGI dos peticiones perfiladas comparten el del bucle.
+        self._cprofile = not getattr(_hilo, 'perfilando', False)
+        if self._cprofile:
+            _hilo.perfilando = True
+            self.perfilador.enable()
+
+    def pausar(self):
+        if self._cprofile:
+            self.perfilador.disable()
+            _hilo.perfilando = False
+        self.segundos += time.perf_counter() - self._inicio
+        _perfil_actual.reset(self._token)
+
+    def _funciones(self):
+        estadisticas = pstats.Stats(self.perfilador, stream=io.StringIO())
+        filas = sorted(estadisticas.stats.items(), key=lambda item: item[1][3], reverse=True)[:FUNCIONES_RESUMEN]
+        return [
+            {
+                'funcion': f"{archivo}:{linea}({nombre})",
+                'llamadas': llamadas,
+                'propio_ms': round(propio * 1000, 2),
+                'acumulado_ms': round(acumulado * 1000, 2),
+            }
+            for (archivo, linea, nombre), (_, llamadas, propio, acumulado, _) in filas
+        ]
+
+    def guardar(self, **datos):
+        """Escribe el ``.prof`` y el ``.json``; devuelve el nombre del perfil."""
+        momento = localtime(self.momento)
+        origen = ''.join(c if c.isalnum() or c in '-_' else '_' for c in self.origen)[:60]
+        nombre = f"{momento:%H%M%S}-{origen}-{uuid.uuid4().hex[:8]}"
+        directorio = os.path.join(settings.PERFILADO_DIR, f"{momento:%Y-%m-%d}")
+        os.makedirs(directorio, exist_ok=True)
+        self.perfilador.dump_stats(os.path.join(directorio, f'{nombre}.prof'))
+        resumen = {
+            'origen': self.origen,
+            'momento': self.momento.isoformat(),
+            'duracion_ms': round(self.segundos * 1000, 2),
+            **datos,
+            'consultas': {
+                'total': len(self.consultas),
+                'total_ms': round(sum(ms for _, ms in self.consultas), 2),
+                'detalle': [{'sql': normalizar_sql(sql), 'ms': round(ms, 2)} for sql, ms in self.consultas],
+            },
+            'plantillas': [{'plantilla': plantilla, 'ms': round(ms, 2)} for plantilla, ms in self.plantillas],
+            'funciones': self._funciones(),
+        }
+        with open(os.path.join(directorio, f'{nombre}.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(resumen, archivo, ensure_ascii=False, indent=1)
+        _podar()
+        logger.info(f"Perfil guardado: {nombre} ({resumen['duracion_ms']:.0f} ms, {len(self.consultas)} consultas).")
+        return nombre
+
+
+def _podar():
+    perfiles = sorted(glob(os.path.join(settings.PERFILADO_DIR, '*', '*.json')), key=os.path.getmtime)
+    for ruta in perfiles[:max(len(perfiles) - settings.PERFILADO_MAX_ARCHIVOS, 0)]:
+        for archivo in (ruta, ruta[:-len('.json')] + '.prof'):
+            try:
+                os.remove(archivo)
+            except FileNotFoundError:
+                pass
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    perfil = _perfil_actual.get()
+    if perfil is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        perfil.consultas.append((sql, (time.perf_counter() - inicio) * 1000))
+
+
+@receiver(connection_created)
+def instalar_perfilado_consultas(sender, connection, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+_render_original = plantillas.Template.render
+
+
+def _render_medido(self, context):
+    perfil = _perfil_actual.get()
+    if perfil is None:
+        return _render_original(self, context)
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        perfil.plantillas.append((self.origin.template_name or self.name, (time.perf_counter() - inicio) * 1000))
+
+
+def instalar_perfilado_plantillas():
+    """Mide ``Template.render`` (también los ``include``) mientras haya un perfil activo."""
+    plantillas.Template.render = _render_medido
+
+
+def _pedido(request):
+    return request.META.get(CABECERA) == '1' or request.GET.get(PARAMETRO) == '1'
+
+
+def _es_staff(request):
+    usuario = getattr(request, 'user', None)
+    return usuario is not None and usuario.is_staff
+
+
+def _debe_perfilar(solicitado):
+    return _perfil_actual.get() is None and (solicitado or random.random() < settings.PERFILADO_MUESTREO)
+
+
+def _vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.view_name if coincidencia else 'sin_ruta'
+
+
+def _guardar_peticion(perfil, request, respuesta):
+    try:
+        return perfil.guardar(
+            vista=_vista(request),
+            ruta=request.path,  # Sin la query string: puede traer RUTs
+            metodo=request.method,
+            estado=respuesta.status_code,
+            usuario=getattr(getattr(request, 'user', None), 'pk', None),
+        )
+    except OSError as error:
+        logger.error(f"No se pudo guardar el perfil de {request.path}: {error}")
+
+
+def _iterar_perfilado(perfil, request, respuesta, contenido):
+    iterador = iter(contenido)
+    try:
+        while True:
+            perfil.reanudar()
+            try:
+                parte = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                perfil.pausar()
+            yield parte
+    finally:
+        _guardar_peticion(perfil, request, respuesta)
+
+
+def _terminar(perfil, request, respuesta, solicitado):
+    perfil.origen = _vista(request)
+    if respuesta.streaming and not respuesta.is_async and getattr(respuesta, 'file_to_stream', None) is None:
+        respuesta.streaming_content = _iterar_perfilado(perfil, request, respuesta, respuesta.streaming_content)
+        return respuesta
+    nombre = _guardar_peticion(perfil, request, respuesta)
+    if nombre and solicitado:
+        respuesta['X-Perfil'] = nombre
+    return respuesta
+
+
+class PerfiladoMiddleware:
+    """Perfila las peticiones muestreadas o pedidas por staff. Va después de ``AuthenticationMiddleware``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        solicitado = _pedido(request) and _es_staff(request)
+        if not _debe_perfilar(solicitado):
+            return self.get_response(request)
+        perfil = Perfil(request.path)
+        perfil.reanudar()
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            perfil.pausar()
+        return _terminar(perfil, request, respuesta, solicitado)
+
+    async def __acall__(self, request):
+        # request.user es perezoso: solo se carga (en un hilo) si la petición pide el perfil.
+        solicitado = _pedido(request) and await sync_to_async(_es_staff)(request)
+        if not _debe_perfilar(solicitado):
+            return await self.get_response(request)
+        perfil = Perfil(request.path)
+        perfil.reanudar()
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            perfil.pausar()
+        return await sync_to_async(_terminar)(perfil, request, respuesta, solicitado)
+
+
+def perfilar_tarea(funcion, nombre=None, origen='scheduler'):
+    """
+    Perfila una fracción ``PERFILADO_TAREAS_MUESTREO`` de las ejecuciones de
+    un trabajo del scheduler o de una tarea de la cola (``origen='tarea'``).
+    """
+    nombre = nombre or funcion.__name__
+    origen = f"{origen}-{nombre}"
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if _perfil_actual.get() is not None or random.random() >= settings.PERFILADO_TAREAS_MUESTREO:
+            return funcion(*args, **kwargs)
+        perfil = Perfil(origen)
+        perfil.reanudar()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            perfil.pausar()
+            try:
+                perfil.guardar(tarea=nombre)
+            except OSError as error:
+                logger.error(f"No se pudo guardar el perfil de {origen}: {error}")
+    return envoltura
@@ -0,0 +1,119 @@
+"""
+Lecturas en una réplica de la base de datos.
+
+Si ``DATABASES`` tiene el alias ``REPLICA_ALIAS`` (variable de entorno
+``SQLITE_REPLICA_PATH``), ``ReplicaRouter`` manda a la réplica las lecturas
+hechas dentro de ``leer_de_replica()``. Esas lecturas son las de las vistas
+marcadas con ``@lectura_replica`` (listados, exportaciones, reportes), los
+listados del administrador con ``LecturaReplicaAdmin`` y las tareas de
+análisis. Todo lo demás, y toda escritura, va a ``default``.
+
+La réplica puede ir unos segundos atrasada. Para que quien acaba de escribir
+(por ejemplo, al crear una reserva) vea su cambio, ``PrimarioTrasEscrituraMiddleware``
+deja una cookie tras cada petición que no es de solo lectura. Mientras esa
+cookie dure (``REPLICA_RETRASO_SEGUNDOS``), sus lecturas siguen en el
+primario.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+COOKIE_PRIMARIO = 'leer_primario'
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+# Nunca se leen de la réplica: la sesión y el usuario se validan contra el primario.
+APPS_SOLO_PRIMARIO = ('sessions',)
+
+_leer_de_replica = ContextVar('leer_de_replica', default=False)
+
+
+def replica_configurada():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def leer_de_replica(activo=True):
+    token = _leer_de_replica.set(activo and replica_configurada())
+    try:
+        yield
+    finally:
+        _leer_de_replica.reset(token)
+
+
+def _iterar_en_replica(contenido):
+    # El contenido en streaming se genera después de que la vista retorna.
+    with leer_de_replica():
+        yield from contenido
+
+
+def lectura_replica(vista):
+    """
+    La vista lee de la réplica en las peticiones de solo lectura, salvo que
+    el usuario haya escrito hace poco.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method not in METODOS_LECTURA or COOKIE_PRIMARIO in request.COOKIES:
+            return vista(request, *args, **kwargs)
+        with leer_de_replica():
+            respuesta = vista(request, *args, **kwargs)
+        if respuesta.streaming:
+            respuesta.streaming_content = _iterar_en_replica(respuesta.streaming_content)
+        return respuesta
+    return envoltura
+
+
+class LecturaReplicaAdmin:
+    """Mixin de ``ModelAdmin``: el listado (sin acciones) se lee de la réplica."""
+
+    def changelist_view(self, request, extra_context=None):
+        return lectura_replica(super().changelist_view)(request, extra_context)
+
+
+class PrimarioTrasEscrituraMiddleware:
+    """Tras una petición que escribe, fija las lecturas del usuario al primario por un tiempo."""
+
+    # Síncrono y asíncrono: bajo ASGI no obliga a pasar cada petición por un hilo.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._marcar(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._marcar(request, await self.get_response(request))
+
+    def _marcar(self, request, respuesta):
+        if replica_configurada() and request.method not in METODOS_LECTURA:
+            respuesta.set_cookie(
+                COOKIE_PRIMARIO, '1', max_age=settings.REPLICA_RETRASO_SEGUNDOS, httponly=True, samesite='Lax'
+            )
+        return respuesta
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _leer_de_replica.get() and model._meta.app_label not in APPS_SOLO_PRIMARIO:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambas bases tienen los mismos datos: los objetos leídos de la réplica se guardan en el primario.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # La réplica es una copia del primario (esquema incluido); no se migra por separado.
+        return db != REPLICA_ALIAS
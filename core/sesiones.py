@@ -0,0 +1,53 @@
+"""
+Sesiones en caché con respaldo en la base (``SESSION_ENGINE = 'core.sesiones'``).
+
+Es el ``cached_db`` de Django sobre la caché ``SESSION_CACHE_ALIAS``. Leer la
+sesión de una petición autenticada no consulta ``django_session`` mientras
+esté en caché, y la base solo se escribe cuando la sesión cambia. La caché
+tiene que ser compartida por todos los procesos del servidor (Redis o
+archivos, ver ``CACHES``): con una caché por proceso, un logout en un worker
+no se vería en los demás.
+
+Si la caché falla (por ejemplo, Redis caído), las sesiones siguen
+funcionando desde la base en vez de responder con error.
+"""
+import logging
+
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+logger = logging.getLogger(__name__)
+
+
+class CacheTolerante:
+    """Envuelve la caché de sesiones: un error cuenta como entrada ausente."""
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def _intentar(self, operacion, *args, por_defecto=None):
+        try:
+            return getattr(self._cache, operacion)(*args)
+        except Exception as error:
+            logger.warning(f"Caché de sesiones no disponible ({operacion}): {error}. Se usa la base.")
+            return por_defecto
+
+    def get(self, clave):
+        return self._intentar('get', clave)
+
+    def set(self, clave, valor, timeout):
+        self._intentar('set', clave, valor, timeout)
+
+    def delete(self, clave):
+        self._intentar('delete', clave)
+
+    def delete_many(self, claves):
+        self._intentar('delete_many', claves)
+
+    def __contains__(self, clave):
+        return self._intentar('has_key', clave, por_defecto=False)
+
+
+class SessionStore(CachedDBStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._cache = CacheTolerante(self._cache)
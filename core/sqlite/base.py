@@ -0,0 +1,60 @@
+"""
+Backend SQLite del proyecto (``ENGINE: 'core.sqlite'``).
+
+Es el backend de Django con dos opciones más en ``OPTIONS``:
+
+- ``pragmas``: ``PRAGMA`` que se aplican al abrir cada conexión. Por ejemplo
+  ``journal_mode=WAL``, con el que los lectores no bloquean al escritor ni
+  al revés; ``synchronous=NORMAL``, que con WAL sigue siendo seguro ante
+  caídas del proceso y evita un ``fsync`` por transacción; ``busy_timeout``,
+  ``mmap_size``, ``cache_size`` y ``temp_store``.
+- ``transaction_mode``: cómo se abre cada ``transaction.atomic()``
+  (``DEFERRED``, ``IMMEDIATE`` o ``EXCLUSIVE``). Con ``BEGIN`` a secas
+  (``DEFERRED``), una transacción que lee y luego escribe debe pasar de
+  lector a escritor. Si otro escritor se adelantó, SQLite responde
+  "database is locked" de inmediato, sin esperar ``busy_timeout``. Con
+  ``IMMEDIATE`` el bloqueo de escritura se toma al empezar, así que la
+  transacción espera su turno.
+"""
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# Los PRAGMA no admiten parámetros: solo se aceptan números o palabras clave.
+_NOMBRE_VALIDO = re.compile(r'[a-z_]+')
+_VALOR_VALIDO = re.compile(r'-?\d+|[A-Za-z_]+')
+MODOS_TRANSACCION = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def sentencias_pragma(pragmas):
+    """Sentencias ``PRAGMA`` de ``pragmas``, validadas. Los valores vacíos se omiten."""
+    sentencias = []
+    for nombre, valor in (pragmas or {}).items():
+        if valor is None or valor == '':
+            continue
+        if not _NOMBRE_VALIDO.fullmatch(nombre) or not _VALOR_VALIDO.fullmatch(str(valor)):
+            raise ImproperlyConfigured(f"PRAGMA inválido en OPTIONS['pragmas']: {nombre}={valor!r}")
+        sentencias.append(f"PRAGMA {nombre} = {valor}")
+    return sentencias
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = sentencias_pragma(params.pop('pragmas', None))
+        self.modo_transaccion = (params.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.modo_transaccion not in MODOS_TRANSACCION:
+            raise ImproperlyConfigured(
+                f"transaction_mode debe ser uno de: {', '.join(MODOS_TRANSACCION)}."
+            )
+        return params
+
+    def get_new_connection(self, conn_params):
+        conexion = super().get_new_connection(conn_params)
+        for sentencia in self.pragmas:
+            conexion.execute(sentencia)
+        return conexion
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.modo_transaccion}")
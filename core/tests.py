@@ -1,3 +1,150 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from collections import deque
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, override_settings
+
+from core import actividad, consultas_lentas
+from core.actividad import registrar_actividad, vaciar
+from core.autenticacion import UsuarioCacheadoBackend
+from core.consultas_lentas import huella, normalizar_sql, origen_consultas, resumen_consultas_lentas
+from core.metricas import _resumen
+from core.models import UserActivity
+
+
+def _descartados(motivo):
+    return _resumen().get(('actividad_descartada_total', (('motivo', motivo),)), 0)
+
+
+@override_settings(ACTIVIDAD_LOTE=2)
+class ActividadTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create(username='12345678-5')
+        # Búfer propio del test: sin el hilo de fondo, que vaciaría por su cuenta.
+        estado = mock.patch.dict(actividad._estado, pid=os.getpid(), buffer=deque(maxlen=3))
+        estado.start()
+        self.addCleanup(estado.stop)
+
+    def _registrar(self, *actividades):
+        for texto in actividades:
+            registrar_actividad(self.usuario, texto)
+
+    def _guardadas(self):
+        return list(UserActivity.objects.order_by('id').values_list('activity', flat=True))
+
+    def test_vaciar_guarda_todos_los_lotes(self):
+        self._registrar('a', 'b', 'c')
+        vaciar()
+        self.assertEqual(self._guardadas(), ['a', 'b', 'c'])
+        self.assertFalse(actividad._estado['buffer'])
+
+    def test_buffer_lleno_descarta_los_mas_antiguos(self):
+        antes = _descartados('buffer_lleno')
+        self._registrar('a', 'b', 'c', 'd')
+        self.assertEqual(_descartados('buffer_lleno'), antes + 1)
+        vaciar()
+        self.assertEqual(self._guardadas(), ['b', 'c', 'd'])
+
+    def test_error_transitorio_devuelve_el_lote(self):
+        self._registrar('a', 'b', 'c')
+        with mock.patch.object(UserActivity.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            vaciar()
+        self.assertEqual([evento[1] for evento in actividad._estado['buffer']], ['a', 'b', 'c'])
+
+        vaciar()
+        self.assertEqual(self._guardadas(), ['a', 'b', 'c'])
+
+    def test_error_permanente_descarta_el_lote_y_sigue(self):
+        antes = _descartados('error_permanente')
+        self._registrar('a', 'b', 'c')
+        bulk_create = UserActivity.objects.bulk_create
+        errores = [IntegrityError('FOREIGN KEY constraint failed')]
+
+        def falla_una_vez(objetos):
+            if errores:
+                raise errores.pop()
+            return bulk_create(objetos)
+
+        with mock.patch.object(UserActivity.objects, 'bulk_create', side_effect=falla_una_vez):
+            vaciar()
+        self.assertEqual(_descartados('error_permanente'), antes + 2)
+        self.assertEqual(self._guardadas(), ['c'])
+        self.assertFalse(actividad._estado['buffer'])
+
+
+@override_settings(CACHES={**settings.CACHES, 'sesiones': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UsuarioCacheadoTests(TestCase):
+    def setUp(self):
+        self.backend = UsuarioCacheadoBackend()
+        self.usuario = User.objects.create(username='12345678-5')
+        self.grupo = Group.objects.create(name='Recepcionista')
+
+    def _grupos(self):
+        return self.backend.get_user(self.usuario.pk).nombres_grupos
+
+    def test_usuario_cacheado_no_consulta_la_base(self):
+        self.assertEqual(self._grupos(), frozenset())
+        with self.assertNumQueries(0):
+            self.assertEqual(self._grupos(), frozenset())
+
+    def test_cambio_de_grupos_desde_el_usuario_invalida(self):
+        self._grupos()
+        self.usuario.groups.add(self.grupo)
+        self.assertEqual(self._grupos(), {'Recepcionista'})
+        self.usuario.groups.remove(self.grupo)
+        self.assertEqual(self._grupos(), frozenset())
+
+    def test_cambio_de_usuarios_desde_el_grupo_invalida(self):
+        self._grupos()
+        self.grupo.user_set.add(self.usuario)
+        self.assertEqual(self._grupos(), {'Recepcionista'})
+        self.grupo.user_set.clear()
+        self.assertEqual(self._grupos(), frozenset())
+
+    def test_guardar_el_usuario_invalida(self):
+        self.backend.get_user(self.usuario.pk)
+        User.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        self.assertIsNotNone(self.backend.get_user(self.usuario.pk))  # Aún cacheado
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.backend.get_user(self.usuario.pk))
+
+
+class ConsultasLentasTests(TestCase):
+    def test_normaliza_literales_y_listas(self):
+        sql = normalizar_sql("SELECT * FROM t WHERE rut = '1-9' AND id IN (1, 2, 3)\n  AND edad > 40.5")
+        self.assertEqual(sql, "SELECT * FROM t WHERE rut = ? AND id IN (...) AND edad > ?")
+        self.assertEqual(normalizar_sql("INSERT INTO t VALUES (%s, %s), (%s, %s)"), "INSERT INTO t VALUES (...)")
+        self.assertEqual(
+            huella(normalizar_sql("SELECT 1 FROM t WHERE id IN (%s)")),
+            huella(normalizar_sql("SELECT 1 FROM t WHERE id IN (%s, %s, %s)")),
+        )
+
+    def test_registra_por_huella_con_origen_y_un_solo_plan(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ruta = os.path.join(directorio.name, 'lentas.jsonl')
+        with override_settings(CONSULTAS_LENTAS_MS=1e-6, CONSULTAS_LENTAS_LOG=ruta), \
+                mock.patch.object(consultas_lentas, '_explicadas', set()), origen_consultas('tarea:prueba'):
+            User.objects.filter(username__in=['12345678-5']).count()
+            User.objects.filter(username__in=['11111111-1', '22222222-2']).count()
+
+        with open(ruta, encoding='utf-8') as archivo:
+            contenido = archivo.read()
+        registros = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertNotIn('12345678', contenido)  # Sin parámetros
+        self.assertEqual(len(registros), 2)
+        self.assertEqual(registros[0]['huella'], registros[1]['huella'])
+        self.assertEqual({registro['origen'] for registro in registros}, {'tarea:prueba'})
+        self.assertIn('IN (...)', registros[0]['sql'])
+        self.assertIn('plan', registros[0])
+        self.assertNotIn('plan', registros[1])
+
+        grupo, = resumen_consultas_lentas(ruta, origen='tarea:prueba')
+        self.assertEqual((grupo['huella'], grupo['veces']), (registros[0]['huella'], 2))
+        self.assertEqual(grupo['plan'], registros[0]['plan'])
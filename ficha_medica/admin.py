@@ -1,5 +1,15 @@
 from django.contrib import admin
-from .models import Paciente, Medico, FichaMedica, Recepcionista, Reserva, Especialidad, Disponibilidad
+from django.db.models import Q
+
+from core.replicas import LecturaReplicaAdmin
+
+from .busqueda import consulta_fts, ids_coincidentes, usa_fts
+from .duplicados import fusionar_pares
+from .utils import normalizar_texto, rango_prefijo, rut_a_digitos
+from .models import (
+    Paciente, Medico, FichaMedica, Recepcionista, Reserva, Especialidad, Disponibilidad, Tarea, PosibleDuplicado, ListaEspera,
+    DisponibilidadHistorica, ReservaHistorica,
+)
 
 # Configuración para Especialidad
 @admin.register(Especialidad)
@@ -10,12 +20,28 @@ class EspecialidadAdmin(admin.ModelAdmin):
 
 # Configuración para Paciente
 @admin.register(Paciente)
-class PacienteAdmin(admin.ModelAdmin):
+class PacienteAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
     list_display = ('rut', 'nombre', 'telefono', 'email')  # Campos visibles en la lista
     search_fields = ('rut', 'nombre', 'telefono', 'email')  # Campos para la barra de búsqueda
     list_filter = ('direccion',)  # Filtro por dirección
     ordering = ('nombre',)  # Orden por nombre
 
+    def get_search_results(self, request, queryset, search_term):
+        # Prefijos sobre columnas indexadas en vez de LIKE '%...%' en cuatro campos
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        filtro = Q()
+        if rut_a_digitos(termino):
+            filtro |= rango_prefijo('rut_digitos', rut_a_digitos(termino))
+        if normalizar_texto(termino):
+            filtro |= rango_prefijo('nombre_normalizado', normalizar_texto(termino))
+        if '@' in termino:
+            filtro |= Q(email__iexact=termino)
+        if termino.isdigit():
+            filtro |= Q(telefono=termino)
+        return queryset.filter(filtro), False
+
 # Configuración para Médico
 @admin.register(Medico)
 class MedicoAdmin(admin.ModelAdmin):
@@ -34,13 +60,25 @@ class MedicoAdmin(admin.ModelAdmin):
 
 # Configuración para Ficha Médica
 @admin.register(FichaMedica)
-class FichaMedicaAdmin(admin.ModelAdmin):
+class FichaMedicaAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
     list_display = ('paciente', 'medico', 'fecha_creacion', 'diagnostico')  # Campos visibles
     search_fields = ('paciente__rut', 'paciente__nombre', 'medico__user__username', 'diagnostico')  # Campos de búsqueda
     list_filter = ('fecha_creacion', 'medico')  # Filtros por fecha de creación y médico
     date_hierarchy = 'fecha_creacion'  # Barra de navegación por fecha
     ordering = ('-fecha_creacion',)  # Orden descendente por fecha de creación
 
+    def get_search_fields(self, request):
+        # Con FTS5 el texto clínico se busca en el índice, no con LIKE '%...%'.
+        if usa_fts():
+            return tuple(campo for campo in self.search_fields if campo != 'diagnostico')
+        return self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        resultados, duplicados = super().get_search_results(request, queryset, search_term)
+        if search_term and usa_fts() and consulta_fts(search_term):
+            resultados |= queryset.filter(id__in=ids_coincidentes(search_term))
+        return resultados, duplicados
+
 # Configuración para Recepcionista
 @admin.register(Recepcionista)
 class RecepcionistaAdmin(admin.ModelAdmin):
@@ -59,7 +97,7 @@ class RecepcionistaAdmin(admin.ModelAdmin):
 
 # Configuración para Reserva
 @admin.register(Reserva)
-class ReservaAdmin(admin.ModelAdmin):
+class ReservaAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
     list_display = ('paciente', 'medico', 'fecha_reserva', 'motivo')  # Campos visibles
     search_fields = ('paciente__nombre', 'paciente__rut', 'medico__user__username', 'motivo')  # Campos de búsqueda
     list_filter = ('fecha_reserva__fecha_disponible', 'medico')  # Filtros por fecha y médico
@@ -71,7 +109,62 @@ class ReservaAdmin(admin.ModelAdmin):
     get_fecha_reserva.short_description = 'Fecha de Reserva'
 
 @admin.register(Disponibilidad)
-class DisponibilidadAdmin(admin.ModelAdmin):
+class DisponibilidadAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
     list_display = ('medico', 'fecha_disponible')  # Mostrar campos relevantes en la tabla
     list_filter = ('medico', 'fecha_disponible')  # Agregar filtros
     search_fields = ('medico__user__first_name', 'medico__user__last_name')
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'estado', 'intentos', 'creada', 'espera_ms', 'duracion_ms', 'trabajador')
+    list_filter = ('estado', 'nombre')
+    search_fields = ('nombre',)
+    ordering = ('-creada',)
+
+
+@admin.register(PosibleDuplicado)
+class PosibleDuplicadoAdmin(admin.ModelAdmin):
+    list_display = ('paciente', 'duplicado', 'puntaje', 'motivo', 'descartado', 'detectado')
+    list_filter = ('descartado', 'motivo')
+    list_select_related = ('paciente', 'duplicado')
+    ordering = ('-puntaje',)
+    actions = ['fusionar', 'descartar']
+
+    @admin.action(description="Fusionar pacientes seleccionados (se conserva el más antiguo)")
+    def fusionar(self, request, queryset):
+        resultado = fusionar_pares(queryset.filter(descartado=False).values_list('paciente_id', 'duplicado_id'))
+        self.message_user(
+            request,
+            f"Pacientes eliminados: {resultado['eliminados']}, fichas reasignadas: {resultado['fichas']}, "
+            f"reservas reasignadas: {resultado['reservas']}.",
+        )
+
+    @admin.action(description="Descartar (no son la misma persona)")
+    def descartar(self, request, queryset):
+        queryset.update(descartado=True)
+
+
+@admin.register(ListaEspera)
+class ListaEsperaAdmin(admin.ModelAdmin):
+    list_display = ('paciente', 'especialidad', 'medico', 'desde', 'hasta', 'estado', 'creada', 'oferta_expira')
+    list_filter = ('estado', 'especialidad')
+    list_select_related = ('paciente', 'especialidad', 'medico__user')
+    search_fields = ('paciente__nombre', 'paciente__rut')
+    raw_id_fields = ('paciente', 'disponibilidad')
+    ordering = ('creada',)
+
+
+@admin.register(ReservaHistorica)
+class ReservaHistoricaAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
+    list_display = ('paciente', 'medico', 'fecha_reserva', 'motivo')
+    list_select_related = ('paciente', 'medico__user', 'fecha_reserva')
+    search_fields = ('paciente__nombre', 'paciente__rut')
+    raw_id_fields = ('paciente', 'fecha_reserva', 'recepcionista')
+    ordering = ('-fecha_reserva__fecha_disponible',)
+
+
+@admin.register(DisponibilidadHistorica)
+class DisponibilidadHistoricaAdmin(LecturaReplicaAdmin, admin.ModelAdmin):
+    list_display = ('medico', 'fecha_disponible')
+    list_filter = ('medico',)
+    date_hierarchy = 'fecha_disponible'
@@ -0,0 +1,97 @@
+"""
+Mantenimiento del modelo de lectura ``AgendaMedico``.
+
+Cada reserva tiene una fila con el médico, el día local, la hora, el nombre
+del paciente y el motivo. El panel del médico y ``api_agenda_medico`` leen un
+día completo con una consulta sobre el índice ``(medico, dia, hora)``. Las
+señales de ``Reserva``, ``Disponibilidad`` y ``Paciente`` mantienen la tabla
+al día. Las operaciones masivas que no emiten señales (importación, fusión
+de duplicados) llaman directamente a estas funciones.
+"""
+from django.db.models import Case, Value, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.timezone import localtime
+
+from .models import AgendaMedico, Disponibilidad, Paciente, Reserva
+
+TAMANO_LOTE = 500
+CAMPOS = ('medico', 'paciente', 'dia', 'hora', 'paciente_nombre', 'motivo')
+
+
+def _entrada(reserva):
+    hora = reserva.fecha_reserva.fecha_disponible
+    return AgendaMedico(
+        reserva_id=reserva.id,
+        medico_id=reserva.medico_id,
+        paciente_id=reserva.paciente_id,
+        dia=localtime(hora).date(),
+        hora=hora,
+        paciente_nombre=reserva.paciente.nombre,
+        motivo=reserva.motivo,
+    )
+
+
+def sincronizar_agenda(reservas):
+    """Crea o actualiza (un upsert por lote) las entradas de ``reservas``."""
+    AgendaMedico.objects.bulk_create(
+        [_entrada(reserva) for reserva in reservas],
+        batch_size=TAMANO_LOTE,
+        update_conflicts=True,
+        unique_fields=['reserva'],
+        update_fields=list(CAMPOS),
+    )
+
+
+def reconstruir_agenda(reservas=None):
+    """Regenera la agenda de ``reservas`` (por defecto, de todas)."""
+    reservas = Reserva.objects.all() if reservas is None else reservas
+    lote = []
+    for reserva in reservas.select_related('paciente', 'fecha_reserva').iterator(chunk_size=TAMANO_LOTE):
+        lote.append(reserva)
+        if len(lote) >= TAMANO_LOTE:
+            sincronizar_agenda(lote)
+            lote = []
+    sincronizar_agenda(lote)
+
+
+def actualizar_pacientes_agenda(destino, nombres):
+    """
+    Ajusta las entradas tras cambios masivos en pacientes. ``destino`` asigna
+    a cada id de paciente el id que debe quedar (o el mismo) y ``nombres`` da
+    el nombre vigente de cada id de destino.
+    """
+    ids = list(destino)
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = ids[inicio:inicio + TAMANO_LOTE]
+        AgendaMedico.objects.filter(paciente_id__in=lote).update(
+            paciente_id=Case(*[When(paciente_id=i, then=Value(destino[i])) for i in lote]),
+            paciente_nombre=Case(*[When(paciente_id=i, then=Value(nombres[destino[i]])) for i in lote]),
+        )
+
+
+def agenda_del_dia(medico, dia, desde=None):
+    """Entradas de ``medico`` en ``dia`` (opcionalmente desde una hora), por hora."""
+    entradas = AgendaMedico.objects.filter(medico=medico, dia=dia)
+    if desde is not None:
+        entradas = entradas.filter(hora__gte=desde)
+    return list(entradas.order_by('hora'))
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_agenda_reserva(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sincronizar_agenda([instance])
+
+
+@receiver(post_save, sender=Disponibilidad)
+def actualizar_agenda_disponibilidad(sender, instance, raw=False, created=False, **kwargs):
+    # La hora puede haberse asignado como texto (modificar_disponibilidad), así que se relee.
+    if not raw and not created:
+        reconstruir_agenda(Reserva.objects.filter(fecha_reserva=instance))
+
+
+@receiver(post_save, sender=Paciente)
+def actualizar_agenda_paciente(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        AgendaMedico.objects.filter(paciente_id=instance.pk).update(paciente_nombre=instance.nombre)
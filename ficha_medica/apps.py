@@ -5,5 +5,10 @@ class FichaMedicaConfig(AppConfig):
     name = 'ficha_medica'
 
     def ready(self):
-        from .scheduler import iniciar_scheduler
-        iniciar_scheduler()
+        from django.utils.module_loading import autodiscover_modules
+        from . import agenda, busqueda, calendario, linea_tiempo, lista_espera, pdf  # noqa: F401 (registran receptores de señales)
+        autodiscover_modules('tareas')
+        from django.conf import settings
+        if settings.SCHEDULER_AUTOINICIO:
+            from .scheduler import iniciar_scheduler_unico
+            iniciar_scheduler_unico()
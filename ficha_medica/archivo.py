@@ -0,0 +1,110 @@
+"""
+Limpieza y archivo de cupos pasados.
+
+``Disponibilidad`` y ``Reserva`` deben tener solo el horizonte activo, porque
+las consultas de cupos, el calendario y los filtros del administrador las
+recorren. Se hacen dos pasadas, ambas por lotes acotados de ids
+(``id > último``, con una transacción corta por lote), para no bloquear la
+base:
+
+1. los cupos sin reserva con más de ``ARCHIVO_CUPOS_LIBRES_DIAS`` se
+   eliminan;
+2. los cupos con reserva con más de ``ARCHIVO_RESERVAS_DIAS`` pasan, junto con
+   su reserva, a ``DisponibilidadHistorica`` y ``ReservaHistorica``. Estas
+   tablas tienen las mismas columnas y conservan los ids.
+
+Los resúmenes de utilización se calculan desde las tablas activas. Por eso
+nunca se toca un día que ``estadisticas.actualizar_resumenes`` todavía
+podría recalcular, y sin resúmenes consolidados no se archiva nada.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import get_default_timezone, localtime, make_aware, now
+
+from .estadisticas import DIAS_REPROCESO
+from .models import AgendaMedico, Disponibilidad, DisponibilidadHistorica, Reserva, ReservaHistorica, ResumenDiario
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+
+
+def limite_archivo(dias):
+    """
+    Inicio del día antes del cual se puede limpiar: hace ``dias`` días, pero
+    nunca dentro de los días que el reporte aún recalcula. ``None`` si todavía
+    no hay resúmenes.
+    """
+    ultimo = ResumenDiario.objects.aggregate(ultimo=Max('dia'))['ultimo']
+    if ultimo is None:
+        return None
+    dia = min(localtime(now()).date() - timedelta(days=dias), ultimo - timedelta(days=DIAS_REPROCESO))
+    return make_aware(datetime.combine(dia, time.min), get_default_timezone())
+
+
+def _lotes_ids(consulta, lote):
+    """Ids de ``consulta`` en lotes crecientes, releyendo desde el último id en cada vuelta."""
+    ultimo = 0
+    while True:
+        ids = list(consulta.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return
+        yield ids
+        ultimo = ids[-1]
+
+
+def _copias(modelo_historico, filas):
+    campos = [campo.attname for campo in modelo_historico._meta.concrete_fields]
+    return [modelo_historico(**{campo: getattr(fila, campo) for campo in campos}) for fila in filas]
+
+
+def eliminar_cupos_vencidos(limite, lote=TAMANO_LOTE):
+    """Elimina los cupos sin reserva anteriores a ``limite``. Devuelve cuántos."""
+    total = 0
+    for ids in _lotes_ids(Disponibilidad.objects.filter(fecha_disponible__lt=limite, reserva__isnull=True), lote):
+        with transaction.atomic():
+            _, borrados = Disponibilidad.objects.filter(id__in=ids, reserva__isnull=True).delete()
+        total += borrados.get(Disponibilidad._meta.label, 0)
+    return total
+
+
+def archivar_reservas(limite, lote=TAMANO_LOTE):
+    """
+    Traslada a las tablas históricas los cupos anteriores a ``limite`` y sus
+    reservas. Devuelve ``(cupos, reservas)`` archivados.
+    """
+    cupos_total = reservas_total = 0
+    for ids in _lotes_ids(Disponibilidad.objects.filter(fecha_disponible__lt=limite), lote):
+        with transaction.atomic():
+            cupos = list(Disponibilidad.objects.filter(id__in=ids))
+            reservas = list(Reserva.objects.filter(fecha_reserva_id__in=ids))
+            DisponibilidadHistorica.objects.bulk_create(_copias(DisponibilidadHistorica, cupos))
+            ReservaHistorica.objects.bulk_create(_copias(ReservaHistorica, reservas))
+            AgendaMedico.objects.filter(reserva_id__in=[reserva.id for reserva in reservas]).delete()
+            Reserva.objects.filter(id__in=[reserva.id for reserva in reservas]).delete()
+            Disponibilidad.objects.filter(id__in=ids).delete()
+        cupos_total += len(cupos)
+        reservas_total += len(reservas)
+    return cupos_total, reservas_total
+
+
+def archivar_disponibilidades(lote=TAMANO_LOTE):
+    """Ejecuta la limpieza y el archivo con los plazos de la configuración."""
+    resultado = {'cupos_eliminados': 0, 'cupos_archivados': 0, 'reservas_archivadas': 0}
+    limite = limite_archivo(settings.ARCHIVO_CUPOS_LIBRES_DIAS)
+    if limite is None:
+        logger.info("Sin resúmenes consolidados: no se archivan cupos.")
+        return resultado
+    resultado['cupos_eliminados'] = eliminar_cupos_vencidos(limite, lote)
+    resultado['cupos_archivados'], resultado['reservas_archivadas'] = archivar_reservas(
+        limite_archivo(settings.ARCHIVO_RESERVAS_DIAS), lote
+    )
+    logger.info(
+        f"Cupos eliminados: {resultado['cupos_eliminados']}, archivados: {resultado['cupos_archivados']} "
+        f"(con {resultado['reservas_archivadas']} reservas)."
+    )
+    return resultado
@@ -0,0 +1,169 @@
+"""
+Búsquedas de fichas médicas y pacientes.
+
+Fichas: en SQLite se usa la tabla FTS5 ``ficha_medica_fichamedica_fts`` (ver
+la migración 0009), con ranking BM25, prefijos (``neumo*``), plegado de
+acentos y fragmentos resaltados. En otros motores se recurre a ``icontains``.
+
+Pacientes: búsqueda incremental (typeahead) por prefijo sobre las columnas
+indexadas ``rut_digitos`` y ``nombre_normalizado``, con un índice de
+trigramas como respaldo para nombres mal escritos.
+"""
+import math
+import re
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from .models import FichaMedica, Paciente, PacienteTrigrama
+from .utils import normalizar_texto, rango_prefijo, rut_a_digitos, trigramas
+
+TABLA_FTS = 'ficha_medica_fichamedica_fts'
+CAMPOS = ('diagnostico', 'tratamiento', 'observaciones')
+# Peso de cada columna en el ranking BM25 (el diagnóstico es lo más relevante).
+PESOS = (10.0, 5.0, 1.0)
+# Marcadores que no aparecen en texto normal; se reemplazan por <mark> tras escapar.
+_INICIO, _FIN = '\x02', '\x03'
+
+_termino = re.compile(r'(\w+)(\*?)', re.UNICODE)
+
+
+def usa_fts():
+    return connection.vendor == 'sqlite'
+
+
+def consulta_fts(texto):
+    """
+    Convierte el texto ingresado en una consulta FTS5 segura: cada palabra se
+    cita (así los operadores de FTS5 no se interpretan) y las terminadas en
+    ``*`` se buscan por prefijo. Todas las palabras deben aparecer.
+    """
+    terminos = [
+        f'"{palabra}"{"*" if prefijo else ""}'
+        for palabra, prefijo in _termino.findall(texto or '')
+    ]
+    return ' '.join(terminos)
+
+
+def ids_coincidentes(texto):
+    """
+    Expresión para filtrar un queryset de fichas por texto completo, por
+    ejemplo ``FichaMedica.objects.filter(id__in=ids_coincidentes('tos'))``.
+    """
+    return RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [consulta_fts(texto)])
+
+
+def _fragmento(texto):
+    return escape(texto or '').replace(_INICIO, '<mark>').replace(_FIN, '</mark>')
+
+
+def buscar_fichas(texto, medico_id=None, limite=20, desplazamiento=0):
+    """
+    Fichas que coinciden con ``texto``, de la más a la menos relevante.
+
+    Devuelve una lista de ``(ficha, fragmentos)``, donde ``fragmentos`` es un
+    diccionario con el extracto HTML (coincidencias en ``<mark>``) de cada
+    campo en que se encontró el texto.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+
+    if not usa_fts():
+        filtro = Q()
+        for palabra, _ in _termino.findall(texto):
+            filtro &= Q(diagnostico__icontains=palabra) | Q(tratamiento__icontains=palabra) | Q(observaciones__icontains=palabra)
+        fichas = FichaMedica.objects.filter(filtro).select_related('paciente', 'medico__user')
+        if medico_id:
+            fichas = fichas.filter(medico_id=medico_id)
+        return [(ficha, {}) for ficha in fichas.order_by('-fecha_creacion')[desplazamiento:desplazamiento + limite]]
+
+    fragmentos_sql = ', '.join(
+        f"snippet({TABLA_FTS}, {indice}, '{_INICIO}', '{_FIN}', '…', 16)" for indice in range(len(CAMPOS))
+    )
+    sql = (
+        f"SELECT {TABLA_FTS}.rowid, {fragmentos_sql} FROM {TABLA_FTS} "
+        f"JOIN ficha_medica_fichamedica ficha ON ficha.id = {TABLA_FTS}.rowid "
+        f"WHERE {TABLA_FTS} MATCH %s {'AND ficha.medico_id = %s' if medico_id else ''} "
+        f"ORDER BY bm25({TABLA_FTS}, {', '.join(str(peso) for peso in PESOS)}) LIMIT %s OFFSET %s"
+    )
+    parametros = [consulta] + ([medico_id] if medico_id else []) + [limite, desplazamiento]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        filas = cursor.fetchall()
+
+    fichas = FichaMedica.objects.select_related('paciente', 'medico__user').in_bulk([fila[0] for fila in filas])
+    resultados = []
+    for ficha_id, *extractos in filas:
+        if ficha_id not in fichas:  # Eliminada entre ambas consultas.
+            continue
+        fragmentos = {
+            campo: _fragmento(extracto)
+            for campo, extracto in zip(CAMPOS, extractos)
+            if extracto and _INICIO in extracto
+        }
+        resultados.append((fichas[ficha_id], fragmentos))
+    return resultados
+
+
+# Fracción mínima de trigramas de la consulta que debe compartir un nombre.
+UMBRAL_TRIGRAMAS = 0.5
+
+
+def indexar_trigramas(pacientes):
+    """Regenera los trigramas de ``pacientes`` (ya guardados) en bloque."""
+    ids = [paciente.pk for paciente in pacientes]
+    PacienteTrigrama.objects.filter(paciente_id__in=ids).delete()
+    PacienteTrigrama.objects.bulk_create(
+        [
+            PacienteTrigrama(paciente_id=paciente.pk, trigrama=trigrama)
+            for paciente in pacientes for trigrama in trigramas(paciente.nombre)
+        ],
+        batch_size=5000,
+    )
+
+
+@receiver(post_save, sender=Paciente)
+def actualizar_trigramas_paciente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_trigramas([instance])
+
+
+def buscar_pacientes(texto, limite=10):
+    """
+    Pacientes para un cuadro de búsqueda incremental.
+
+    Si el texto contiene dígitos se trata como RUT (con o sin puntos y guion)
+    y se busca por prefijo. Si no, se busca por prefijo del nombre sin
+    acentos y, si faltan resultados, por similitud de trigramas.
+    """
+    if re.search(r'\d', texto or ''):
+        digitos = rut_a_digitos(texto)
+        return list(Paciente.objects.filter(rango_prefijo('rut_digitos', digitos)).order_by('rut_digitos')[:limite])
+
+    normalizado = normalizar_texto(texto)
+    if not normalizado:
+        return []
+    encontrados = list(
+        Paciente.objects.filter(rango_prefijo('nombre_normalizado', normalizado)).order_by('nombre_normalizado')[:limite]
+    )
+    if len(encontrados) >= limite or len(normalizado) < 3:
+        return encontrados
+
+    buscados = trigramas(normalizado)
+    similares = (
+        PacienteTrigrama.objects.filter(trigrama__in=buscados)
+        .exclude(paciente_id__in=[paciente.id for paciente in encontrados])
+        .values('paciente_id')
+        .annotate(coincidencias=Count('id'))
+        .filter(coincidencias__gte=math.ceil(len(buscados) * UMBRAL_TRIGRAMAS))
+        .order_by('-coincidencias')
+        .values_list('paciente_id', flat=True)[:limite - len(encontrados)]
+    )
+    similares = list(similares)
+    pacientes = Paciente.objects.in_bulk(similares)
+    return encontrados + [pacientes[paciente_id] for paciente_id in similares if paciente_id in pacientes]
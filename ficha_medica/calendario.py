@@ -0,0 +1,111 @@
+"""
+Resumen mensual de disponibilidades para el calendario de recepción.
+
+Los cupos libres y ocupados de cada día del mes se cuentan con un solo
+``GROUP BY`` sobre ``Disponibilidad``, truncando la fecha al día en la zona
+horaria local (America/Santiago). Así un cupo a las 22:00 hora de Chile cae
+en su día y no en el siguiente en UTC. El conteo se cachea por mes en la
+caché compartida y se invalida cuando cambia algún cupo de ese mes. Como no
+depende de la hora, los cupos que ya pasaron se descuentan al leer.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import get_default_timezone, localdate, localtime, make_aware, now
+
+from .models import Disponibilidad
+from .utils import cache_compartida, invalidar_cache, version_cache
+
+
+def _limites_mes(anio, mes):
+    zona = get_default_timezone()
+    inicio = make_aware(datetime(anio, mes, 1), zona)
+    fin = make_aware(datetime(anio + mes // 12, mes % 12 + 1, 1), zona)
+    return inicio, fin
+
+
+def _cupos(inicio, fin, medico_id, especialidad_id):
+    cupos = Disponibilidad.objects.filter(fecha_disponible__gte=inicio, fecha_disponible__lt=fin)
+    if medico_id:
+        cupos = cupos.filter(medico_id=medico_id)
+    if especialidad_id:
+        cupos = cupos.filter(medico__especialidad_id=especialidad_id)
+    return cupos
+
+
+def _conteos_mes(anio, mes, medico_id, especialidad_id):
+    """Conteo por día sin depender de la hora: ``libres`` incluye los cupos ya pasados."""
+    dias = (
+        _cupos(*_limites_mes(anio, mes), medico_id, especialidad_id)
+        .annotate(dia=TruncDate('fecha_disponible', tzinfo=get_default_timezone()))
+        .values('dia')
+        .annotate(libres=Count('id', filter=Q(ocupada=False)), ocupadas=Count('id', filter=Q(ocupada=True)))
+        .order_by('dia')
+    )
+    return [{'fecha': dia['dia'].isoformat(), 'libres': dia['libres'], 'ocupadas': dia['ocupadas']} for dia in dias]
+
+
+def _descontar_pasados(dias, medico_id, especialidad_id):
+    """
+    Deja en ``libres`` solo los cupos que aún no pasaron: los días anteriores
+    a hoy quedan en cero y el de hoy se vuelve a contar desde ahora.
+    """
+    hoy = localdate()
+    texto_hoy = hoy.isoformat()
+    resultado = []
+    for dia in dias:
+        if dia['fecha'] < texto_hoy:
+            dia = {**dia, 'libres': 0}
+        elif dia['fecha'] == texto_hoy and dia['libres']:
+            manana = make_aware(datetime.combine(hoy + timedelta(days=1), time.min), get_default_timezone())
+            libres = _cupos(now(), manana, medico_id, especialidad_id).filter(ocupada=False).count()
+            dia = {**dia, 'libres': libres}
+        resultado.append(dia)
+    return resultado
+
+
+def disponibilidad_mensual(anio, mes, medico_id=None, especialidad_id=None):
+    """
+    Lista de ``{'fecha', 'libres', 'ocupadas'}`` por cada día del mes que
+    tiene cupos. ``libres`` cuenta solo los cupos que aún no pasaron.
+    """
+    return _descontar_pasados(_conteos_mes(anio, mes, medico_id, especialidad_id), medico_id, especialidad_id)
+
+
+def disponibilidad_mensual_cacheada(anio, mes, medico_id=None, especialidad_id=None):
+    """
+    Igual que ``disponibilidad_mensual``, pero el conteo del mes sale de la
+    caché compartida; los cupos pasados se descuentan en cada lectura.
+    """
+    cache = cache_compartida()
+    clave_mes = f"{anio:04d}-{mes:02d}"
+    clave = f"calendario:{clave_mes}:{version_cache('calendario', clave_mes)}:{medico_id or ''}:{especialidad_id or ''}"
+    conteos = cache.get(clave)
+    if conteos is None:
+        conteos = _conteos_mes(anio, mes, medico_id, especialidad_id)
+        cache.set(clave, conteos, settings.CALENDARIO_CACHE_SEGUNDOS)
+    return _descontar_pasados(conteos, medico_id, especialidad_id)
+
+
+def invalidar_calendario(*fechas):
+    """Invalida los meses de ``fechas`` (``datetime`` o texto como el que guarda ``modificar_disponibilidad``)."""
+    meses = set()
+    for fecha in fechas:
+        if isinstance(fecha, str):
+            fecha = parse_datetime(fecha)
+            if fecha is None:
+                continue
+            fecha = make_aware(fecha, get_default_timezone()) if fecha.tzinfo is None else fecha
+        meses.add(localtime(fecha).strftime('%Y-%m'))
+    if meses:
+        invalidar_cache('calendario', *meses)
+
+
+@receiver([post_save, post_delete], sender=Disponibilidad)
+def invalidar_por_disponibilidad(sender, instance, **kwargs):
+    invalidar_calendario(instance.fecha_disponible)
@@ -0,0 +1,259 @@
+"""
+Cola local de tareas en segundo plano respaldada por la tabla ``Tarea``.
+
+No requiere un broker externo: las vistas encolan con ``encolar`` y los
+procesos lanzados por ``manage.py run_workers`` reclaman y ejecutan las tareas.
+Las funciones se registran con el decorador ``tarea``; los módulos
+``<app>.tareas`` se cargan automáticamente al iniciar Django.
+"""
+import contextvars
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils.timezone import now
+
+from core.metricas import medir_tarea
+from core.perfilado import perfilar_tarea
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+_tarea_actual = contextvars.ContextVar('tarea_actual', default=None)
+
+
+class TareaNoRegistrada(Exception):
+    pass
+
+
+def tarea(nombre=None, max_intentos=3, archivos=None):
+    """
+    Registra una función como tarea encolable. Sus argumentos deben ser
+    serializables en JSON, ya que se guardan en la base de datos.
+
+    ``archivos`` recibe los mismos argumentos que la tarea y devuelve las rutas
+    de los archivos que usa o genera; ``purgar_tareas_terminadas`` los elimina
+    junto con la tarea.
+    """
+    def decorador(funcion):
+        funcion.nombre_tarea = nombre or f"{funcion.__module__}.{funcion.__name__}"
+        funcion.max_intentos = max_intentos
+        funcion.archivos = archivos
+        _registro[funcion.nombre_tarea] = funcion
+        return funcion
+    return decorador
+
+
+def obtener_funcion(nombre):
+    try:
+        return _registro[nombre]
+    except KeyError:
+        raise TareaNoRegistrada(f"No hay una tarea registrada con el nombre '{nombre}'.")
+
+
+def encolar(funcion, ejecutar_despues=None, **argumentos):
+    """
+    Crea una tarea pendiente para ``funcion`` (la función registrada o su
+    nombre) y la devuelve sin esperar a que se ejecute.
+    """
+    funcion = obtener_funcion(funcion) if isinstance(funcion, str) else funcion
+    return Tarea.objects.create(
+        nombre=funcion.nombre_tarea,
+        argumentos=argumentos,
+        max_intentos=funcion.max_intentos,
+        ejecutar_despues=ejecutar_despues or now(),
+    )
+
+
+def reportar_progreso(**datos):
+    """
+    Guarda en ``resultado`` el avance de la tarea en ejecución, para que las
+    vistas puedan consultarlo mientras corre. Fuera de una tarea no hace nada.
+    """
+    tarea_id = _tarea_actual.get()
+    if tarea_id is not None:
+        Tarea.objects.filter(id=tarea_id).update(resultado=datos)
+
+
+def nombre_trabajador(indice=0):
+    return f"{socket.gethostname()}:{indice}"
+
+
+def reclamar_tarea(trabajador):
+    """
+    Marca como ``en_curso`` la siguiente tarea pendiente y la devuelve, o
+    ``None`` si no hay ninguna lista.
+
+    En motores con ``SELECT ... FOR UPDATE SKIP LOCKED`` se usa ese bloqueo.
+    En SQLite, que serializa las escrituras, se reclama con un ``UPDATE``
+    condicionado al estado: solo un trabajador puede pasar la fila de
+    pendiente a en curso, y el resto prueba con la siguiente candidata.
+    """
+    momento = now()
+    pendientes = Tarea.objects.filter(estado=Tarea.PENDIENTE, ejecutar_despues__lte=momento)
+    cambios = {
+        'estado': Tarea.EN_CURSO,
+        'trabajador': trabajador,
+        'iniciada': momento,
+        'latido': momento,
+        'intentos': F('intentos') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            tarea_id = (
+                pendientes.select_for_update(skip_locked=True)
+                .order_by('ejecutar_despues', 'id')
+                .values_list('id', flat=True)
+                .first()
+            )
+            if tarea_id is None:
+                return None
+            Tarea.objects.filter(id=tarea_id).update(**cambios)
+        return Tarea.objects.get(id=tarea_id)
+
+    candidatas = pendientes.order_by('ejecutar_despues', 'id').values_list('id', flat=True)[:10]
+    for tarea_id in candidatas:
+        if Tarea.objects.filter(id=tarea_id, estado=Tarea.PENDIENTE).update(**cambios):
+            return Tarea.objects.get(id=tarea_id)
+    return None
+
+
+def _espera_reintento(intentos):
+    """Backoff exponencial con variación aleatoria, acotado por configuración."""
+    base = settings.TAREAS_REINTENTO_BASE_SEGUNDOS * 2 ** (intentos - 1)
+    return min(base, settings.TAREAS_REINTENTO_MAX_SEGUNDOS) * random.uniform(0.8, 1.2)
+
+
+def _mantener_latido(tarea_id, terminada):
+    """
+    Renueva ``latido`` cada ``TAREAS_LATIDO_SEGUNDOS`` hasta que se active
+    ``terminada``. Corre en su propio hilo, con su propia conexión.
+    """
+    try:
+        while not terminada.wait(settings.TAREAS_LATIDO_SEGUNDOS):
+            try:
+                Tarea.objects.filter(id=tarea_id, estado=Tarea.EN_CURSO).update(latido=now())
+            except DatabaseError:
+                logger.warning(f"No se pudo renovar el latido de la tarea #{tarea_id}.", exc_info=True)
+    finally:
+        connection.close()
+
+
+def ejecutar_tarea(tarea):
+    """
+    Ejecuta una tarea ya reclamada y registra su resultado y tiempos, también
+    en las métricas y el perfilado por muestreo (core/metricas.py,
+    core/perfilado.py). Mientras corre, un hilo renueva su latido para que no
+    se considere abandonada.
+    """
+    inicio = time.perf_counter()
+    campos = {}
+    if tarea.intentos == 1:
+        campos['espera_ms'] = (tarea.iniciada - tarea.creada).total_seconds() * 1000
+    terminada = threading.Event()
+    latido = threading.Thread(target=_mantener_latido, args=(tarea.id, terminada), name=f"latido-{tarea.id}", daemon=True)
+    latido.start()
+    token = _tarea_actual.set(tarea.id)
+    try:
+        funcion = obtener_funcion(tarea.nombre)
+        funcion = medir_tarea(perfilar_tarea(funcion, tarea.nombre, 'tarea'), tarea.nombre, 'tarea')
+        resultado = funcion(**tarea.argumentos)
+    except Exception:
+        duracion = (time.perf_counter() - inicio) * 1000
+        campos.update(duracion_ms=duracion, error=traceback.format_exc())
+        if tarea.intentos < tarea.max_intentos:
+            espera = _espera_reintento(tarea.intentos)
+            campos.update(estado=Tarea.PENDIENTE, ejecutar_despues=now() + timedelta(seconds=espera))
+            logger.warning(f"Tarea {tarea} falló (intento {tarea.intentos}); se reintentará en {espera:.0f} s.")
+        else:
+            campos.update(estado=Tarea.FALLIDA, terminada=now())
+            logger.error(f"Tarea {tarea} falló definitivamente tras {tarea.intentos} intentos.")
+    else:
+        duracion = (time.perf_counter() - inicio) * 1000
+        campos.update(estado=Tarea.COMPLETADA, terminada=now(), duracion_ms=duracion, resultado=resultado, error='')
+        logger.info(f"Tarea {tarea} completada en {duracion:.1f} ms.")
+    finally:
+        _tarea_actual.reset(token)
+        terminada.set()
+        latido.join()
+    # Si la tarea se dio por abandonada y otro trabajador la reclamó, este
+    # resultado ya no corresponde al intento vigente y se descarta.
+    Tarea.objects.filter(id=tarea.id, estado=Tarea.EN_CURSO, intentos=tarea.intentos).update(**campos)
+
+
+def recuperar_tareas_abandonadas():
+    """
+    Devuelve a pendientes las tareas en curso cuyo latido lleva más de
+    ``TAREAS_TIMEOUT_SEGUNDOS`` sin renovarse, es decir, las de un trabajador
+    que murió. Las que siguen ejecutándose, por largas que sean, no se tocan.
+    """
+    limite = now() - timedelta(seconds=settings.TAREAS_TIMEOUT_SEGUNDOS)
+    abandonadas = Tarea.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True, iniciada__lt=limite),  # Reclamadas antes del latido
+        estado=Tarea.EN_CURSO,
+    )
+    error = 'El trabajador dejó de responder durante la ejecución.'
+    recuperadas = abandonadas.filter(intentos__lt=F('max_intentos')).update(estado=Tarea.PENDIENTE, error=error)
+    abandonadas.update(estado=Tarea.FALLIDA, terminada=now(), error=error)
+    return recuperadas
+
+
+def purgar_tareas_terminadas(dias=None):
+    """
+    Elimina las tareas completadas o fallidas hace más de ``dias``
+    (``TAREAS_RETENCION_DIAS``), junto con sus archivos.
+    """
+    limite = now() - timedelta(days=settings.TAREAS_RETENCION_DIAS if dias is None else dias)
+    terminadas = Tarea.objects.filter(estado__in=[Tarea.COMPLETADA, Tarea.FALLIDA], terminada__lt=limite)
+    con_archivos = [nombre for nombre, funcion in _registro.items() if funcion.archivos]
+    for nombre, argumentos in terminadas.filter(nombre__in=con_archivos).values_list('nombre', 'argumentos').iterator():
+        for ruta in _registro[nombre].archivos(**argumentos):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+    eliminadas, _ = terminadas.delete()
+    return eliminadas
+
+
+def procesar_tareas(trabajador, detener, intervalo=1.0):
+    """
+    Bucle de un trabajador: ejecuta tareas hasta que ``detener`` (un
+    ``threading.Event`` o ``multiprocessing.Event``) quede activado.
+    """
+    ultima_recuperacion = 0.0
+    while not detener.is_set():
+        if time.monotonic() - ultima_recuperacion > settings.TAREAS_TIMEOUT_SEGUNDOS / 2:
+            recuperar_tareas_abandonadas()
+            ultima_recuperacion = time.monotonic()
+        tarea_reclamada = reclamar_tarea(trabajador)
+        if tarea_reclamada is None:
+            detener.wait(intervalo)
+            continue
+        ejecutar_tarea(tarea_reclamada)
+
+
+def resumen_tareas():
+    """Conteos por estado y tiempos promedio y máximo por nombre de tarea."""
+    return list(
+        Tarea.objects.values('nombre').annotate(
+            pendientes=Count('id', filter=Q(estado=Tarea.PENDIENTE)),
+            en_curso=Count('id', filter=Q(estado=Tarea.EN_CURSO)),
+            completadas=Count('id', filter=Q(estado=Tarea.COMPLETADA)),
+            fallidas=Count('id', filter=Q(estado=Tarea.FALLIDA)),
+            espera_promedio_ms=Avg('espera_ms'),
+            duracion_promedio_ms=Avg('duracion_ms', filter=Q(estado=Tarea.COMPLETADA)),
+            duracion_maxima_ms=Max('duracion_ms'),
+        ).order_by('nombre')
+    )
@@ -0,0 +1,231 @@
+"""
+Detección y fusión de pacientes duplicados.
+
+Los pacientes solo se comparan dentro de bloques que comparten una clave:
+nombre fonético, fecha de nacimiento o teléfono. Cada clave se recorre en
+streaming, ordenada por su columna indexada. Dentro de un bloque se calcula
+con numpy el puntaje de todos los pares de una vez. El puntaje combina el
+coseno entre los bigramas de los nombres, la coincidencia posición a posición
+de los RUT (que detecta dígitos mal tipeados) y la igualdad de fecha de
+nacimiento y teléfono. Así el costo crece con el tamaño de los bloques y no
+con el cuadrado del número de pacientes.
+"""
+import logging
+from itertools import groupby
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from .agenda import actualizar_pacientes_agenda
+from .linea_tiempo import invalidar_linea_tiempo
+from .models import FichaMedica, ListaEspera, Paciente, PosibleDuplicado, Reserva, ReservaHistorica
+
+logger = logging.getLogger(__name__)
+
+# Campos de Paciente usados como claves de bloqueo.
+CLAVES_BLOQUEO = ('nombre_fonetico', 'fecha_nacimiento', 'telefono')
+# Pesos del puntaje combinado (suman 1).
+PESO_NOMBRE, PESO_RUT, PESO_FECHA, PESO_TELEFONO = 0.6, 0.25, 0.1, 0.05
+UMBRAL = 0.75
+# Los bloques más grandes se comparan por ventanas solapadas, ordenadas por RUT.
+TAMANO_VENTANA = 1000
+TAMANO_LOTE = 5000
+# Ids por UPDATE al fusionar; cada uno usa tres parámetros en la consulta.
+TAMANO_LOTE_FUSION = 300
+LARGO_RUT = 9
+# Un par necesita un RUT con a lo más estos dígitos distintos, o la misma fecha de nacimiento.
+MAX_DIGITOS_RUT_DISTINTOS = 2
+CAMPOS_COMPLETABLES = ('fecha_nacimiento', 'direccion', 'telefono', 'email')
+
+_CAMPOS = ('id', 'rut_digitos', 'nombre_normalizado', 'fecha_nacimiento', 'telefono')
+
+
+def _bigramas(texto):
+    relleno = f" {texto} "
+    return [relleno[i:i + 2] for i in range(len(relleno) - 1)]
+
+
+def _vectores_nombres(nombres):
+    """Conteos de bigramas de cada nombre, normalizados a largo 1 (una fila por nombre)."""
+    vocabulario = {}
+    filas, columnas = [], []
+    for fila, nombre in enumerate(nombres):
+        for bigrama in _bigramas(nombre):
+            filas.append(fila)
+            columnas.append(vocabulario.setdefault(bigrama, len(vocabulario)))
+    matriz = np.zeros((len(nombres), max(len(vocabulario), 1)), dtype=np.float32)
+    np.add.at(matriz, (filas, columnas), 1)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return matriz / np.where(normas == 0, 1, normas)
+
+
+def _codigos(valores):
+    """Un entero por valor distinto, o -1 si el valor está vacío."""
+    codigos = {}
+    return np.array([codigos.setdefault(valor, len(codigos)) if valor else -1 for valor in valores])
+
+
+def _coincidencias(valores):
+    """Matrices de pares con ambos valores presentes y de pares con el mismo valor."""
+    codigos = _codigos(valores)
+    disponible = (codigos[:, None] >= 0) & (codigos[None, :] >= 0)
+    return disponible, disponible & (codigos[:, None] == codigos[None, :])
+
+
+def puntajes(filas):
+    """
+    Matriz simétrica con el puntaje de similitud (0 a 1) entre cada par de
+    ``filas``, tuplas con ``id, rut_digitos, nombre_normalizado,
+    fecha_nacimiento, telefono``. Si a uno de los dos le falta la fecha o el
+    teléfono, ese criterio no cuenta ni a favor ni en contra.
+
+    El nombre por sí solo no basta (homónimos): los pares cuyo RUT difiere en
+    más de ``MAX_DIGITOS_RUT_DISTINTOS`` dígitos y que no tienen la misma fecha
+    de nacimiento quedan con puntaje 0.
+    """
+    _, ruts, nombres, fechas, telefonos = zip(*filas)
+    vectores = _vectores_nombres(nombres)
+    # Alineados a la derecha, para que el dígito verificador quede en la misma columna.
+    digitos = np.array([list(rut.rjust(LARGO_RUT)[-LARGO_RUT:].encode()) for rut in ruts], dtype=np.uint8)
+    digitos_iguales = (digitos[:, None, :] == digitos[None, :, :]).sum(axis=2)
+    con_fecha, misma_fecha = _coincidencias(fechas)
+    con_telefono, mismo_telefono = _coincidencias(telefonos)
+    suma = (
+        PESO_NOMBRE * (vectores @ vectores.T) + PESO_RUT * digitos_iguales / LARGO_RUT
+        + PESO_FECHA * misma_fecha + PESO_TELEFONO * mismo_telefono
+    )
+    pesos = PESO_NOMBRE + PESO_RUT + PESO_FECHA * con_fecha + PESO_TELEFONO * con_telefono
+    respaldado = (digitos_iguales >= LARGO_RUT - MAX_DIGITOS_RUT_DISTINTOS) | misma_fecha
+    return np.where(respaldado, suma / pesos, 0)
+
+
+def _pares_bloque(filas, umbral):
+    paso = TAMANO_VENTANA // 2
+    for inicio in range(0, max(len(filas) - paso, 1), paso):
+        ventana = filas[inicio:inicio + TAMANO_VENTANA]
+        matriz = puntajes(ventana)
+        for i, j in zip(*np.nonzero(np.triu(matriz >= umbral, k=1))):
+            yield ventana[i][0], ventana[j][0], float(matriz[i, j])
+
+
+def _bloques(clave):
+    consulta = Paciente.objects.filter(**{f'{clave}__isnull': False})
+    if clave != 'fecha_nacimiento':
+        consulta = consulta.exclude(**{clave: ''})
+    filas = consulta.order_by(clave, 'rut_digitos').values_list(clave, *_CAMPOS).iterator(chunk_size=TAMANO_LOTE)
+    for _, grupo in groupby(filas, key=lambda fila: fila[0]):
+        grupo = [fila[1:] for fila in grupo]
+        if len(grupo) > 1:
+            yield grupo
+
+
+def detectar_duplicados(umbral=UMBRAL):
+    """
+    Recorre todos los pacientes y devuelve ``{(id_menor, id_mayor): (puntaje,
+    clave)}`` con los pares cuyo puntaje alcanza ``umbral``.
+    """
+    pares = {}
+    for clave in CLAVES_BLOQUEO:
+        bloques = 0
+        for filas in _bloques(clave):
+            bloques += 1
+            for a, b, puntaje in _pares_bloque(filas, umbral):
+                pares.setdefault((min(a, b), max(a, b)), (puntaje, clave))
+        logger.info(f"Clave {clave}: {bloques} bloques comparados, {len(pares)} pares acumulados.")
+    return pares
+
+
+def guardar_duplicados(pares):
+    """
+    Reemplaza los posibles duplicados pendientes por ``pares`` (el resultado
+    de ``detectar_duplicados``). Los pares ya descartados no se vuelven a crear.
+    """
+    with transaction.atomic():
+        PosibleDuplicado.objects.filter(descartado=False).delete()
+        descartados = set(PosibleDuplicado.objects.values_list('paciente_id', 'duplicado_id'))
+        PosibleDuplicado.objects.bulk_create(
+            [
+                PosibleDuplicado(paciente_id=a, duplicado_id=b, puntaje=puntaje, motivo=clave)
+                for (a, b), (puntaje, clave) in pares.items()
+                if (a, b) not in descartados
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+
+
+def agrupar_pares(pares):
+    """Agrupa pares de ids en conjuntos conexos, cada uno ordenado de menor a mayor id."""
+    padre = {}
+
+    def raiz(x):
+        padre.setdefault(x, x)
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    for a, b in pares:
+        raiz_a, raiz_b = raiz(a), raiz(b)
+        if raiz_a != raiz_b:
+            padre[max(raiz_a, raiz_b)] = min(raiz_a, raiz_b)
+    grupos = {}
+    for x in padre:
+        grupos.setdefault(raiz(x), []).append(x)
+    return [sorted(grupo) for grupo in grupos.values()]
+
+
+def fusionar(grupos):
+    """
+    Fusiona cada grupo de pacientes (listas de ``Paciente``, el que se
+    conserva primero). Las fichas, reservas y solicitudes de lista de espera
+    de los duplicados pasan al principal con un ``UPDATE ... CASE`` por lote.
+    Al principal se le completan los datos que le falten y luego se eliminan
+    los duplicados.
+
+    Los ``UPDATE`` masivos no emiten señales ``post_save``, así que la agenda
+    de los médicos y la caché de la línea de tiempo se actualizan aquí.
+    """
+    destino, nombres = {}, {}
+    completados, modificados = set(), {}
+    for principal, *duplicados in grupos:
+        nombres[principal.pk] = principal.nombre
+        for duplicado in duplicados:
+            if duplicado.pk == principal.pk:
+                continue
+            destino[duplicado.pk] = principal.pk
+            for campo in CAMPOS_COMPLETABLES:
+                if not getattr(principal, campo) and getattr(duplicado, campo):
+                    setattr(principal, campo, getattr(duplicado, campo))
+                    completados.add(campo)
+                    modificados[principal.pk] = principal
+
+    resultado = {'fichas': 0, 'reservas': 0, 'eliminados': 0}
+    ids = list(destino)
+    with transaction.atomic():
+        for inicio in range(0, len(ids), TAMANO_LOTE_FUSION):
+            lote = ids[inicio:inicio + TAMANO_LOTE_FUSION]
+            nuevo_paciente = Case(*[When(paciente_id=i, then=Value(destino[i])) for i in lote])
+            resultado['fichas'] += FichaMedica.objects.filter(paciente_id__in=lote).update(paciente_id=nuevo_paciente)
+            resultado['reservas'] += Reserva.objects.filter(paciente_id__in=lote).update(paciente_id=nuevo_paciente)
+            ReservaHistorica.objects.filter(paciente_id__in=lote).update(paciente_id=nuevo_paciente)
+            # Sin reasignarlas se borrarían en cascada y un cupo ofrecido quedaría retenido sin reserva.
+            ListaEspera.objects.filter(paciente_id__in=lote).update(paciente_id=nuevo_paciente)
+            _, eliminados = Paciente.objects.filter(id__in=lote).delete()
+            resultado['eliminados'] += eliminados.get(Paciente._meta.label, 0)
+        if modificados:
+            Paciente.objects.bulk_update(list(modificados.values()), sorted(completados), batch_size=TAMANO_LOTE_FUSION)
+        actualizar_pacientes_agenda(destino, nombres)
+    invalidar_linea_tiempo(*set(destino.values()))
+    return resultado
+
+
+def fusionar_pares(pares):
+    """
+    Fusiona en bloque los pares de ids indicados. En cada grupo conexo se
+    conserva el paciente más antiguo, es decir, el de menor id.
+    """
+    grupos = agrupar_pares(pares)
+    pacientes = Paciente.objects.in_bulk([i for grupo in grupos for i in grupo])
+    grupos = [[pacientes[i] for i in grupo if i in pacientes] for grupo in grupos]
+    return fusionar([grupo for grupo in grupos if len(grupo) > 1])
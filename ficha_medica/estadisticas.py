@@ -0,0 +1,204 @@
+"""
+Reportes de utilización por médico y especialidad.
+
+Cada noche, ``actualizar_resumenes`` consolida en ``ResumenDiario`` los datos
+de cada médico por día: cupos ofrecidos, reservas, atenciones, inasistencias
+y fichas. Las columnas se leen con ``values_list``, con la fecha truncada al
+día local en la base de datos. Se agregan con numpy (``bincount``, ``isin``)
+sin instanciar modelos ni recorrer las filas en Python. Los reportes por
+semana o mes se calculan sobre esa tabla, que tiene una fila por médico y
+día, así que cinco años son unas decenas de miles de filas.
+
+No hay registro explícito de asistencia. Una reserva pasada cuenta como
+atendida si el mismo médico creó una ficha para ese paciente el mismo día.
+Si no, cuenta como inasistencia.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.functions import TruncDate
+from django.utils.timezone import get_default_timezone, localtime, make_aware, now
+
+from .models import Disponibilidad, Especialidad, FichaMedica, Medico, Reserva, ResumenDiario
+
+logger = logging.getLogger(__name__)
+
+# Días ya consolidados que se recalculan en cada corrida (fichas tardías, reservas modificadas).
+DIAS_REPROCESO = 7
+# Días calculados a la vez; acota la memoria usada.
+DIAS_POR_BLOQUE = 92
+METRICAS = ('cupos', 'reservados', 'atendidas', 'inasistencias', 'fichas')
+PERIODOS = ('semana', 'mes')
+AGRUPACIONES = ('medico', 'especialidad')
+
+
+def _columnas(consulta, campo_fecha, *campos):
+    """Arreglos numpy ``(dias, *campos)`` de ``consulta``, con la fecha como día local."""
+    filas = (
+        consulta.annotate(dia_local=TruncDate(campo_fecha, tzinfo=get_default_timezone()))
+        .order_by()
+        .values_list('dia_local', *campos)
+    )
+    columnas = list(zip(*filas)) or [()] * (len(campos) + 1)
+    return (np.array(columnas[0], dtype='datetime64[D]'), *(np.array(c, dtype=np.int64) for c in columnas[1:]))
+
+
+def _consolidar_bloque(desde, hasta, hoy):
+    """Recalcula los resúmenes de ``desde`` a ``hasta`` (ambos inclusive)."""
+    zona = get_default_timezone()
+    # Intervalo semiabierto: la medianoche siguiente a ``hasta`` cae fuera del bloque.
+    inicio_bloque = make_aware(datetime.combine(desde, time.min), zona)
+    fin_bloque = make_aware(datetime.combine(hasta + timedelta(days=1), time.min), zona)
+    medicos, especialidades = (np.array(c, dtype=np.int64) for c in zip(*Medico.objects.order_by('id').values_list('id', 'especialidad_id')))
+    inicio = np.datetime64(desde, 'D')
+    total_dias = (hasta - desde).days + 1
+
+    def claves(dias, medico_ids):
+        # Índice plano (día, médico) para agrupar con bincount.
+        return (dias - inicio).astype(np.int64) * len(medicos) + np.searchsorted(medicos, medico_ids)
+
+    def contar(claves_filas):
+        return np.bincount(claves_filas, minlength=total_dias * len(medicos))
+
+    dias, medico_ids = _columnas(Disponibilidad.objects.filter(fecha_disponible__gte=inicio_bloque, fecha_disponible__lt=fin_bloque), 'fecha_disponible', 'medico_id')
+    cupos = contar(claves(dias, medico_ids))
+
+    dias, medico_ids, pacientes = _columnas(
+        Reserva.objects.filter(
+            fecha_reserva__fecha_disponible__gte=inicio_bloque, fecha_reserva__fecha_disponible__lt=fin_bloque,
+        ),
+        'fecha_reserva__fecha_disponible', 'medico_id', 'paciente_id',
+    )
+    claves_reservas = claves(dias, medico_ids)
+    pasadas = dias < np.datetime64(hoy, 'D')
+
+    dias, medico_ids, pacientes_fichas = _columnas(
+        FichaMedica.objects.filter(fecha_creacion__gte=inicio_bloque, fecha_creacion__lt=fin_bloque, medico__isnull=False),
+        'fecha_creacion', 'medico_id', 'paciente_id',
+    )
+    claves_fichas = claves(dias, medico_ids)
+
+    # Una reserva está atendida si hay una ficha con el mismo (día, médico, paciente).
+    base = int(max(pacientes.max(initial=0), pacientes_fichas.max(initial=0))) + 1
+    atendidas = np.isin(claves_reservas * base + pacientes, claves_fichas * base + pacientes_fichas)
+
+    totales = np.stack([
+        cupos,
+        contar(claves_reservas),
+        contar(claves_reservas[atendidas]),
+        contar(claves_reservas[pasadas & ~atendidas]),
+        contar(claves_fichas),
+    ])
+    indices = np.flatnonzero(totales.any(axis=0))
+    resumenes = [
+        ResumenDiario(
+            dia=desde + timedelta(days=int(indice // len(medicos))),
+            medico_id=int(medicos[indice % len(medicos)]),
+            especialidad_id=int(especialidades[indice % len(medicos)]),
+            **dict(zip(METRICAS, (int(valor) for valor in totales[:, indice]))),
+        )
+        for indice in indices
+    ]
+    with transaction.atomic():
+        ResumenDiario.objects.filter(dia__range=(desde, hasta)).delete()
+        ResumenDiario.objects.bulk_create(resumenes, batch_size=2000)
+    return len(resumenes)
+
+
+def actualizar_resumenes(desde=None, hasta=None):
+    """
+    Consolida los días de ``desde`` a ``hasta``. Por defecto ``hasta`` es
+    ayer y ``desde`` es el último día consolidado menos ``DIAS_REPROCESO``,
+    o el primer cupo registrado si aún no hay resúmenes.
+    Devuelve el número de filas escritas.
+    """
+    hoy = localtime(now()).date()
+    hasta = hasta or hoy - timedelta(days=1)
+    ultimo = ResumenDiario.objects.aggregate(ultimo=Max('dia'))['ultimo']
+    if ultimo and desde is not None:
+        # Los cupos y reservas más antiguos pueden estar ya archivados (archivo.py): se conservan sus resúmenes.
+        archivados = hoy - timedelta(days=settings.ARCHIVO_CUPOS_LIBRES_DIAS)
+        if desde < archivados:
+            logger.warning(f"Los días anteriores al {archivados} pueden estar archivados y no se recalculan.")
+            desde = archivados
+    if desde is None:
+        if ultimo:
+            desde = ultimo - timedelta(days=DIAS_REPROCESO)
+        else:
+            primero = Disponibilidad.objects.aggregate(primero=Min('fecha_disponible'))['primero']
+            if primero is None:
+                return 0
+            desde = localtime(primero).date()
+    if not Medico.objects.exists():
+        return 0
+
+    filas = 0
+    while desde <= hasta:
+        fin = min(desde + timedelta(days=DIAS_POR_BLOQUE - 1), hasta)
+        filas += _consolidar_bloque(desde, fin, hoy)
+        desde = fin + timedelta(days=1)
+    logger.info(f"Resúmenes diarios actualizados hasta {hasta}: {filas} filas.")
+    return filas
+
+
+def _dividir(numerador, denominador):
+    return np.round(np.divide(numerador, denominador, out=np.zeros(len(numerador)), where=denominador > 0), 4)
+
+
+def reporte_utilizacion(desde, hasta, periodo='semana', agrupacion='medico'):
+    """
+    Totales y tasas de ``desde`` a ``hasta`` por ``periodo`` (``'semana'``,
+    que empieza el lunes, o ``'mes'``) y por médico o especialidad.
+    """
+    filas = ResumenDiario.objects.filter(dia__range=(desde, hasta)).values_list(
+        'dia', 'medico_id' if agrupacion == 'medico' else 'especialidad_id', *METRICAS
+    )
+    datos = np.array(list(filas), dtype=object).reshape(-1, 2 + len(METRICAS))
+    if not len(datos):
+        return []
+    dias = datos[:, 0].astype('datetime64[D]')
+    entidades = datos[:, 1].astype(np.int64)
+    valores = datos[:, 2:].astype(np.int64)
+
+    if periodo == 'semana':
+        # El 1970-01-01 fue jueves: (días + 3) % 7 es 0 los lunes.
+        inicios = dias - (dias.astype(np.int64) + 3) % 7
+    else:
+        inicios = dias.astype('datetime64[M]').astype('datetime64[D]')
+    # Clave entera (inicio del periodo, entidad), ordenable con un solo np.unique.
+    base = int(entidades.max()) + 1
+    grupos, inversa = np.unique(inicios.astype(np.int64) * base + entidades, return_inverse=True)
+    totales = np.zeros((len(grupos), len(METRICAS)), dtype=np.int64)
+    np.add.at(totales, inversa.reshape(-1), valores)
+    cupos, reservados, atendidas, inasistencias, fichas = totales.T
+    grupos = np.stack([grupos // base, grupos % base])
+
+    ocupacion = _dividir(reservados, cupos)
+    tasa_inasistencia = _dividir(inasistencias, atendidas + inasistencias)
+    fichas_por_reserva = _dividir(fichas, reservados)
+
+    if agrupacion == 'medico':
+        nombres = {
+            medico.id: f"{medico.user.first_name} {medico.user.last_name}"
+            for medico in Medico.objects.select_related('user').filter(id__in=grupos[1].tolist())
+        }
+    else:
+        nombres = dict(Especialidad.objects.filter(id__in=grupos[1].tolist()).values_list('id', 'nombre'))
+
+    formato = '%Y-%m-%d' if periodo == 'semana' else '%Y-%m'
+    return [
+        {
+            'periodo': np.datetime64(int(inicio), 'D').astype(datetime).strftime(formato),
+            f'{agrupacion}_id': int(entidad),
+            'nombre': nombres.get(int(entidad)),
+            **dict(zip(METRICAS, (int(valor) for valor in totales[i]))),
+            'ocupacion': float(ocupacion[i]),
+            'tasa_inasistencia': float(tasa_inasistencia[i]),
+            'fichas_por_reserva': float(fichas_por_reserva[i]),
+        }
+        for i, (inicio, entidad) in enumerate(grupos.T)
+    ]
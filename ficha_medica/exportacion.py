@@ -0,0 +1,174 @@
+"""
+Exportación en streaming de reservas, fichas médicas y pacientes a CSV o JSONL.
+
+Las filas se leen con ``values_list(...).iterator(chunk_size=...)`` (sin crear
+instancias de modelos) y se codifican y, opcionalmente, comprimen con gzip a
+medida que se producen, así que la memoria usada no depende del número de filas.
+Las reservas incluyen las ya archivadas (``ReservaHistorica``, ver archivo.py)
+con un ``UNION ALL``.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.timezone import localtime
+
+from .models import FichaMedica, Paciente, Reserva, ReservaHistorica
+
+TAMANO_LOTE = 2000
+# Tamaño aproximado de cada bloque entregado al cliente.
+TAMANO_BLOQUE = 64 * 1024
+
+FORMATOS = ('csv', 'jsonl')
+
+# Columnas exportadas por modelo: (nombre en el archivo, campo de values_list).
+COLUMNAS = {
+    'reservas': [
+        ('id', 'id'),
+        ('fecha', 'fecha_reserva__fecha_disponible'),
+        ('paciente_rut', 'paciente__rut'),
+        ('paciente_nombre', 'paciente__nombre'),
+        ('medico_id', 'medico_id'),
+        ('medico_nombre', 'medico__user__first_name'),
+        ('medico_apellido', 'medico__user__last_name'),
+        ('especialidad', 'especialidad__nombre'),
+        ('motivo', 'motivo'),
+    ],
+    'fichas': [
+        ('id', 'id'),
+        ('fecha_creacion', 'fecha_creacion'),
+        ('paciente_rut', 'paciente__rut'),
+        ('paciente_nombre', 'paciente__nombre'),
+        ('medico_id', 'medico_id'),
+        ('medico_nombre', 'medico__user__first_name'),
+        ('medico_apellido', 'medico__user__last_name'),
+        ('especialidad', 'medico__especialidad__nombre'),
+        ('diagnostico', 'diagnostico'),
+        ('tratamiento', 'tratamiento'),
+        ('observaciones', 'observaciones'),
+    ],
+    'pacientes': [
+        ('id', 'id'),
+        ('rut', 'rut'),
+        ('nombre', 'nombre'),
+        ('fecha_nacimiento', 'fecha_nacimiento'),
+        ('direccion', 'direccion'),
+        ('telefono', 'telefono'),
+        ('email', 'email'),
+    ],
+}
+
+
+def _filtrar(consulta, campo_fecha, campo_especialidad, desde, hasta, medico_id, especialidad_id):
+    if desde:
+        consulta = consulta.filter(**{f'{campo_fecha}__date__gte': desde})
+    if hasta:
+        consulta = consulta.filter(**{f'{campo_fecha}__date__lte': hasta})
+    if medico_id:
+        consulta = consulta.filter(medico_id=medico_id)
+    if especialidad_id:
+        consulta = consulta.filter(**{campo_especialidad: especialidad_id})
+    return consulta
+
+
+def _reservas(modelo, *filtros):
+    return _filtrar(modelo.objects.all(), 'fecha_reserva__fecha_disponible', 'especialidad_id', *filtros)
+
+
+def consulta_exportacion(modelo, desde=None, hasta=None, medico_id=None, especialidad_id=None):
+    """
+    Queryset ordenado con los filtros de la exportación. Las fechas son
+    ``date`` inclusivas; para pacientes, los filtros seleccionan a quienes
+    tienen reservas (activas o archivadas) que los cumplen.
+    """
+    filtros = (desde, hasta, medico_id, especialidad_id)
+    if modelo == 'reservas':
+        return (
+            _reservas(Reserva, *filtros).union(_reservas(ReservaHistorica, *filtros), all=True)
+            .order_by('fecha_reserva__fecha_disponible', 'id')
+        )
+    if modelo == 'fichas':
+        return _filtrar(
+            FichaMedica.objects.all(), 'fecha_creacion', 'medico__especialidad_id', *filtros
+        ).order_by('fecha_creacion', 'id')
+    if modelo == 'pacientes':
+        consulta = Paciente.objects.all()
+        if any(filtros):
+            consulta = consulta.filter(
+                Q(id__in=_reservas(Reserva, *filtros).values('paciente_id'))
+                | Q(id__in=_reservas(ReservaHistorica, *filtros).values('paciente_id'))
+            )
+        return consulta.order_by('id')
+    raise ValueError(f"Modelo de exportación desconocido: {modelo}")
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return localtime(valor).isoformat()
+    return valor
+
+
+class _Eco:
+    """Pseudo archivo para ``csv.writer``: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _lineas(modelo, consulta, formato):
+    nombres = [nombre for nombre, _ in COLUMNAS[modelo]]
+    campos = [campo for _, campo in COLUMNAS[modelo]]
+    filas = consulta.values_list(*campos).iterator(chunk_size=TAMANO_LOTE)
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(nombres)
+        for fila in filas:
+            yield escritor.writerow([_valor(valor) for valor in fila])
+    else:
+        for fila in filas:
+            registro = dict(zip(nombres, (_valor(valor) for valor in fila)))
+            yield json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def generar_exportacion(modelo, consulta, formato='csv', comprimir=False):
+    """
+    Generador de bloques de bytes con la exportación de ``consulta``.
+
+    Las líneas se agrupan en bloques de unos 64 KB y, si ``comprimir`` es
+    verdadero, se comprimen con gzip de forma incremental.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+    compresor = zlib.compressobj(wbits=31) if comprimir else None  # wbits=31: formato gzip
+    pendiente = []
+    tamano = 0
+    for linea in _lineas(modelo, consulta, formato):
+        datos = linea.encode('utf-8')
+        pendiente.append(datos)
+        tamano += len(datos)
+        if tamano >= TAMANO_BLOQUE:
+            bloque = b''.join(pendiente)
+            pendiente.clear()
+            tamano = 0
+            if compresor:
+                bloque = compresor.compress(bloque)
+            if bloque:
+                yield bloque
+    bloque = b''.join(pendiente)
+    if compresor:
+        bloque = compresor.compress(bloque) + compresor.flush()
+    if bloque:
+        yield bloque
+
+
+def nombre_archivo(modelo, formato, comprimir=False):
+    return f"{modelo}.{formato}{'.gz' if comprimir else ''}"
+
+
+def tipo_contenido(formato, comprimir=False):
+    if comprimir:
+        return 'application/gzip'
+    return 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson; charset=utf-8'
@@ -0,0 +1,105 @@
+"""
+Exportación masiva de fichas médicas en PDF.
+
+Los PDFs se generan en paralelo en un ``ProcessPoolExecutor`` (un proceso por
+núcleo por defecto) y se van agregando a un ZIP que se transmite a medida que
+se arma. Cada ficha pasa por ``ruta_pdf_cacheado``, así que los renders que ya
+existen en disco se reutilizan sin volver a generarlos.
+"""
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .models import FichaMedica
+from .pdf import datos_ficha, ruta_pdf_cacheado
+
+TAMANO_LOTE_CONSULTA = 500
+
+
+def fichas_para_exportar(paciente=None, desde=None, hasta=None):
+    """
+    Fichas a exportar, filtradas por paciente y/o rango de fechas de creación
+    (``desde`` y ``hasta`` son fechas, ambas inclusive).
+    """
+    fichas = FichaMedica.objects.select_related('paciente', 'medico__user')
+    if paciente is not None:
+        fichas = fichas.filter(paciente=paciente)
+    if desde:
+        fichas = fichas.filter(fecha_creacion__date__gte=desde)
+    if hasta:
+        fichas = fichas.filter(fecha_creacion__date__lte=hasta)
+    return fichas.order_by('paciente__rut', 'fecha_creacion')
+
+
+class _SalidaZip:
+    """
+    Destino de escritura no posicionable para ``zipfile``: acumula lo escrito
+    hasta que el generador lo retira con ``vaciar``.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _nombre_en_zip(datos):
+    return f"{datos['rut']}/ficha_{datos['id']}.pdf"
+
+
+def generar_zip(fichas, total=None, progreso=None, procesos=None):
+    """
+    Generador que produce los bytes de un ZIP con un PDF por ficha.
+
+    ``fichas`` es un queryset (se recorre con ``iterator``). Se mantienen como
+    máximo unas pocas fichas en vuelo por proceso, por lo que la memoria no
+    crece con el número de fichas. ``progreso(hechas, total)`` se llama tras
+    agregar cada PDF.
+    """
+    procesos = procesos or settings.EXPORTACION_PDF_PROCESOS or os.cpu_count() or 1
+    directorio = str(settings.FICHA_PDF_CACHE_DIR)
+    salida = _SalidaZip()
+    hechas = 0
+    pendientes = deque()
+    executor = ProcessPoolExecutor(max_workers=procesos)
+    try:
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+            def agregar_siguiente():
+                nonlocal hechas
+                datos, futuro = pendientes.popleft()
+                archivo_zip.write(futuro.result(), arcname=_nombre_en_zip(datos))
+                hechas += 1
+                if progreso:
+                    progreso(hechas, total)
+
+            for ficha in fichas.iterator(chunk_size=TAMANO_LOTE_CONSULTA):
+                datos = datos_ficha(ficha)
+                pendientes.append((datos, executor.submit(ruta_pdf_cacheado, datos, directorio)))
+                if len(pendientes) >= procesos * 4:
+                    agregar_siguiente()
+                    yield salida.vaciar()
+            while pendientes:
+                agregar_siguiente()
+                yield salida.vaciar()
+        # Directorio central del ZIP, escrito al cerrar el archivo.
+        yield salida.vaciar()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
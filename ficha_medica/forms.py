@@ -11,7 +11,7 @@ def validar_rut(rut):
     """
     Valida que el RUT esté en el formato correcto (12345678-9).
     """
-    if not re.match(r'^\d{7,8}-\d{1}$', rut):
+    if not re.match(r'^\d{7,8}-[\dkK]$', rut):
         raise ValidationError("El RUT debe estar en el formato 12345678-9.")
     return rut
 
@@ -0,0 +1,184 @@
+"""
+Importación masiva de pacientes desde CSV.
+
+El archivo se lee en streaming y se procesa por lotes: cada lote se valida en
+memoria (el RUT se normaliza y se verifica su dígito verificador), se consulta
+con un solo ``rut IN (...)`` qué RUTs ya existen, se insertan los nuevos con
+``bulk_create`` y se actualizan con ``bulk_update`` los que cambiaron. Las
+filas inválidas se informan sin detener la importación.
+"""
+import csv
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .agenda import actualizar_pacientes_agenda
+from .busqueda import indexar_trigramas
+from .linea_tiempo import invalidar_linea_tiempo
+from .models import Paciente
+from .utils import normalizar_rut
+
+# Con lotes de este tamaño la consulta IN (hasta dos RUTs por fila) queda bajo el límite de variables de SQLite.
+TAMANO_LOTE = 500
+CAMPOS = ('nombre', 'fecha_nacimiento', 'direccion', 'telefono', 'email')
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+
+def _fecha(valor):
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValidationError(f"Fecha de nacimiento inválida: {valor}.")
+
+
+def validar_fila(fila):
+    """
+    Valida y normaliza una fila del CSV. Devuelve ``(rut, datos, errores)``
+    donde ``datos`` contiene solo los campos con valor.
+    """
+    errores = []
+    rut = (fila.get('rut') or '').strip()
+    try:
+        rut = normalizar_rut(rut)
+    except ValidationError as e:
+        errores.extend(e.messages)
+
+    datos = {}
+    for campo in CAMPOS:
+        valor = (fila.get(campo) or '').strip()
+        if not valor:
+            continue
+        try:
+            if campo == 'fecha_nacimiento':
+                valor = _fecha(valor)
+            elif campo == 'telefono' and not valor.isdigit():
+                raise ValidationError("El teléfono solo debe contener números.")
+            elif campo == 'email':
+                validate_email(valor)
+        except ValidationError as e:
+            errores.extend(e.messages)
+            continue
+        datos[campo] = valor
+
+    if 'nombre' not in datos:
+        errores.append("El nombre es obligatorio.")
+    return rut, datos, errores
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = 0
+        self.actualizados = 0
+        self.sin_cambios = 0
+        self.errores = []  # (número de fila, rut, mensaje)
+
+    def agregar_error(self, numero, rut, mensaje):
+        self.errores.append((numero, rut, mensaje))
+
+    def como_dict(self):
+        return {
+            'creados': self.creados,
+            'actualizados': self.actualizados,
+            'sin_cambios': self.sin_cambios,
+            'errores': len(self.errores),
+        }
+
+
+def _guardar_uno_a_uno(nuevos, modificados, resultado):
+    """Respaldo cuando el lote falla por integridad: aísla las filas culpables."""
+    for filas, contador in ((nuevos, 'creados'), (modificados, 'actualizados')):
+        for numero, paciente in filas:
+            try:
+                with transaction.atomic():
+                    paciente.save()
+            except IntegrityError as e:
+                resultado.agregar_error(numero, paciente.rut, f"Error al guardar el paciente: {e}")
+            else:
+                setattr(resultado, contador, getattr(resultado, contador) + 1)
+
+
+def _procesar_lote(lote, resultado, actualizar):
+    ruts = [rut for _, rut, _ in lote]
+    # Se incluye la variante con k minúscula por si fue guardada así (como en api_validar_ruts).
+    buscados = ruts + [rut.lower() for rut in ruts if rut.endswith('K')]
+    existentes = {paciente.rut.upper(): paciente for paciente in Paciente.objects.filter(rut__in=buscados)}
+    nuevos, modificados = [], []
+    for numero, rut, datos in lote:
+        paciente = existentes.get(rut)
+        if paciente is None:
+            nuevos.append((numero, Paciente(rut=rut, **datos)))
+        elif actualizar and any(getattr(paciente, campo) != valor for campo, valor in datos.items()):
+            for campo, valor in datos.items():
+                setattr(paciente, campo, valor)
+            modificados.append((numero, paciente))
+        else:
+            resultado.sin_cambios += 1
+
+    for _, paciente in nuevos + modificados:
+        paciente.actualizar_campos_busqueda()
+    try:
+        with transaction.atomic():
+            creados = Paciente.objects.bulk_create([paciente for _, paciente in nuevos])
+            if creados and creados[0].pk is None:
+                # Motores sin RETURNING en inserciones masivas no asignan la clave.
+                creados = list(Paciente.objects.filter(rut__in=[paciente.rut for paciente in creados]))
+            if modificados:
+                Paciente.objects.bulk_update(
+                    [paciente for _, paciente in modificados], CAMPOS + Paciente.CAMPOS_BUSQUEDA
+                )
+            indexar_trigramas(creados + [paciente for _, paciente in modificados])
+            actualizar_pacientes_agenda(
+                {paciente.pk: paciente.pk for _, paciente in modificados},
+                {paciente.pk: paciente.nombre for _, paciente in modificados},
+            )
+    except IntegrityError:
+        # Otro proceso creó alguno de los RUTs entre la consulta y la inserción.
+        _guardar_uno_a_uno(nuevos, modificados, resultado)
+    else:
+        # bulk_update no emite post_save (la agenda ya se actualizó dentro de la transacción).
+        invalidar_linea_tiempo(*[paciente.pk for _, paciente in modificados])
+        resultado.creados += len(nuevos)
+        resultado.actualizados += len(modificados)
+
+
+def importar_pacientes(archivo, tamano_lote=TAMANO_LOTE, actualizar=True):
+    """
+    Importa pacientes desde ``archivo`` (texto CSV con encabezado que incluya
+    al menos ``rut`` y ``nombre``). Con ``actualizar`` los pacientes existentes
+    cuyos datos difieren se actualizan; sin él se dejan como están.
+    """
+    resultado = ResultadoImportacion()
+    lector = csv.DictReader(archivo)
+    if not lector.fieldnames or not {'rut', 'nombre'} <= set(lector.fieldnames):
+        raise ValidationError("El archivo debe tener un encabezado con las columnas 'rut' y 'nombre'.")
+
+    vistos = set()
+    lote = []
+    # La fila 1 es el encabezado.
+    for numero, fila in enumerate(lector, start=2):
+        rut, datos, errores = validar_fila(fila)
+        if not errores and rut in vistos:
+            errores.append("RUT repetido en el archivo.")
+        if errores:
+            for mensaje in errores:
+                resultado.agregar_error(numero, rut, mensaje)
+            continue
+        vistos.add(rut)
+        lote.append((numero, rut, datos))
+        if len(lote) >= tamano_lote:
+            _procesar_lote(lote, resultado, actualizar)
+            lote = []
+    if lote:
+        _procesar_lote(lote, resultado, actualizar)
+    return resultado
+
+
+def escribir_reporte_errores(resultado, destino):
+    """Escribe en ``destino`` (archivo de texto) un CSV con una fila por error."""
+    escritor = csv.writer(destino)
+    escritor.writerow(['fila', 'rut', 'error'])
+    escritor.writerows(resultado.errores)
@@ -0,0 +1,235 @@
+"""
+Línea de tiempo de un paciente: fichas y reservas en un solo historial, con
+conteos y médicos tratantes.
+
+Cada página usa siempre las mismas cuatro consultas, sin importar cuántos
+eventos o médicos tenga el paciente:
+
+1. el paciente, con los conteos como subconsultas anotadas;
+2. la página de fichas (``select_related`` de médico, usuario y especialidad);
+3. la página de reservas: un ``UNION ALL`` de las activas y las ya archivadas
+   (``ReservaHistorica``, ver archivo.py), que conservan sus ids;
+4. los médicos tratantes, con sus conteos también anotados.
+
+Las fichas y reservas se mezclan en Python. La paginación usa un cursor
+``(fecha, tipo, id)`` en vez de un desplazamiento, así que avanzar de página
+no obliga a recorrer las anteriores. Cada página se cachea con la versión del
+paciente, que se invalida cuando cambian sus fichas, sus reservas o sus datos.
+Versión y páginas están en la caché compartida por todos los workers.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import localtime, now
+
+from .models import FichaMedica, Medico, Paciente, Reserva, ReservaHistorica
+from .utils import cache_compartida, invalidar_cache, version_cache
+
+LIMITE_MAXIMO = 100
+# Columnas de cada reserva en la página (las mismas en Reserva y ReservaHistorica).
+CAMPOS_RESERVA = (
+    'id', 'fecha_reserva__fecha_disponible', 'medico__user__first_name', 'medico__user__last_name',
+    'especialidad__nombre', 'motivo',
+)
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(fecha, tipo, identificador):
+    datos = json.dumps([fecha.isoformat(), tipo, identificador])
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, tipo, identificador = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fecha = datetime.fromisoformat(fecha)
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor inválido.")
+    if tipo not in ('ficha', 'reserva') or not isinstance(identificador, int) or fecha.tzinfo is None:
+        raise CursorInvalido("Cursor inválido.")
+    return fecha, tipo, identificador
+
+
+def _contar(modelo, campo, **filtros):
+    """Subconsulta correlacionada con las filas de ``modelo`` que apuntan a la fila externa."""
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(**{campo: OuterRef('pk')}, **filtros)
+            .order_by().values(campo).annotate(n=Count('pk')).values('n')[:1]
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def _filtro_cursor(campo_fecha, tipo, cursor):
+    """
+    Eventos anteriores al cursor en el orden descendente ``(fecha, tipo, id)``
+    (con ``'ficha' < 'reserva'`` para desempatar eventos a la misma hora).
+    """
+    if cursor is None:
+        return Q()
+    fecha, tipo_cursor, identificador = cursor
+    anteriores = Q(**{f'{campo_fecha}__lt': fecha})
+    if tipo == tipo_cursor:
+        return anteriores | Q(**{campo_fecha: fecha, 'id__lt': identificador})
+    if tipo < tipo_cursor:
+        return anteriores | Q(**{campo_fecha: fecha})
+    return anteriores
+
+
+def _nombre_medico(medico):
+    if medico is None:
+        return None
+    return f"{medico.user.first_name} {medico.user.last_name}"
+
+
+def _evento_ficha(ficha):
+    return {
+        'tipo': 'ficha',
+        'id': ficha.id,
+        'fecha': localtime(ficha.fecha_creacion).isoformat(),
+        'medico': _nombre_medico(ficha.medico),
+        'especialidad': ficha.medico.especialidad.nombre if ficha.medico else None,
+        'diagnostico': ficha.diagnostico,
+        'tratamiento': ficha.tratamiento,
+        'observaciones': ficha.observaciones,
+    }
+
+
+def _evento_reserva(reserva):
+    identificador, fecha, nombre, apellido, especialidad, motivo = reserva
+    return {
+        'tipo': 'reserva',
+        'id': identificador,
+        'fecha': localtime(fecha).isoformat(),
+        'medico': f"{nombre} {apellido}",
+        'especialidad': especialidad,
+        'motivo': motivo,
+    }
+
+
+def linea_tiempo(paciente_id, cursor=None, limite=20):
+    """
+    Diccionario con los datos y conteos del paciente, sus médicos tratantes y
+    hasta ``limite`` eventos (del más reciente al más antiguo) anteriores a
+    ``cursor``. ``siguiente`` es el cursor de la página siguiente o ``None``.
+    Lanza ``Paciente.DoesNotExist`` o ``CursorInvalido``.
+    """
+    posicion = decodificar_cursor(cursor) if cursor else None
+    paciente = Paciente.objects.annotate(
+        total_fichas=_contar(FichaMedica, 'paciente'),
+        total_reservas=_contar(Reserva, 'paciente') + _contar(ReservaHistorica, 'paciente'),
+        reservas_futuras=_contar(Reserva, 'paciente', fecha_reserva__fecha_disponible__gte=now()),
+        ultima_ficha=Subquery(
+            FichaMedica.objects.filter(paciente=OuterRef('pk')).order_by().values('paciente')
+            .annotate(ultima=Max('fecha_creacion')).values('ultima')[:1]
+        ),
+    ).get(id=paciente_id)
+
+    fichas = list(
+        FichaMedica.objects.filter(Q(paciente_id=paciente_id) & _filtro_cursor('fecha_creacion', 'ficha', posicion))
+        .select_related('medico__user', 'medico__especialidad')
+        .order_by('-fecha_creacion', '-id')[:limite + 1]
+    )
+    filtro_reservas = Q(paciente_id=paciente_id) & _filtro_cursor('fecha_reserva__fecha_disponible', 'reserva', posicion)
+    reservas = list(
+        Reserva.objects.filter(filtro_reservas).values_list(*CAMPOS_RESERVA)
+        .union(ReservaHistorica.objects.filter(filtro_reservas).values_list(*CAMPOS_RESERVA), all=True)
+        .order_by('-fecha_reserva__fecha_disponible', '-id')[:limite + 1]
+    )
+    medicos = (
+        Medico.objects.filter(
+            Q(id__in=FichaMedica.objects.filter(paciente_id=paciente_id).values('medico_id'))
+            | Q(id__in=Reserva.objects.filter(paciente_id=paciente_id).values('medico_id'))
+            | Q(id__in=ReservaHistorica.objects.filter(paciente_id=paciente_id).values('medico_id'))
+        )
+        .select_related('user', 'especialidad')
+        .annotate(
+            fichas_paciente=_contar(FichaMedica, 'medico', paciente_id=paciente_id),
+            reservas_paciente=(
+                _contar(Reserva, 'medico', paciente_id=paciente_id)
+                + _contar(ReservaHistorica, 'medico', paciente_id=paciente_id)
+            ),
+        )
+        .order_by('user__last_name', 'user__first_name')
+    )
+
+    eventos = heapq.merge(
+        (((ficha.fecha_creacion, 'ficha', ficha.id), ficha) for ficha in fichas),
+        (((reserva[1], 'reserva', reserva[0]), reserva) for reserva in reservas),
+        key=lambda evento: evento[0],
+        reverse=True,
+    )
+    pagina = [evento for _, evento in zip(range(limite + 1), eventos)]
+    siguiente = None
+    if len(pagina) > limite:
+        (fecha, tipo, identificador), _ = pagina[limite - 1]
+        siguiente = codificar_cursor(fecha, tipo, identificador)
+
+    return {
+        'paciente': {
+            'id': paciente.id,
+            'rut': paciente.rut,
+            'nombre': paciente.nombre,
+            'edad': paciente.edad,
+            'telefono': paciente.telefono,
+            'email': paciente.email,
+        },
+        'conteos': {
+            'fichas': paciente.total_fichas,
+            'reservas': paciente.total_reservas,
+            'reservas_futuras': paciente.reservas_futuras,
+            'ultima_ficha': localtime(paciente.ultima_ficha).isoformat() if paciente.ultima_ficha else None,
+        },
+        'medicos': [
+            {
+                'id': medico.id,
+                'nombre': _nombre_medico(medico),
+                'especialidad': medico.especialidad.nombre,
+                'fichas': medico.fichas_paciente,
+                'reservas': medico.reservas_paciente,
+            }
+            for medico in medicos
+        ],
+        'eventos': [
+            _evento_ficha(evento) if tipo == 'ficha' else _evento_reserva(evento)
+            for (_, tipo, _), evento in pagina[:limite]
+        ],
+        'siguiente': siguiente,
+    }
+
+
+def linea_tiempo_cacheada(paciente_id, cursor=None, limite=20):
+    cache = cache_compartida()  # La invalidación debe llegar a todos los workers
+    clave = f"linea_tiempo:{paciente_id}:{version_cache('paciente', paciente_id)}:{cursor or ''}:{limite}"
+    datos = cache.get(clave)
+    if datos is None:
+        datos = linea_tiempo(paciente_id, cursor, limite)
+        cache.set(clave, datos, settings.LINEA_TIEMPO_CACHE_SEGUNDOS)
+    return datos
+
+
+def invalidar_linea_tiempo(*pacientes_ids):
+    invalidar_cache('paciente', *pacientes_ids)
+
+
+@receiver([post_save, post_delete], sender=FichaMedica)
+@receiver([post_save, post_delete], sender=Reserva)
+def invalidar_por_evento(sender, instance, **kwargs):
+    invalidar_linea_tiempo(instance.paciente_id)
+
+
+@receiver([post_save, post_delete], sender=Paciente)
+def invalidar_por_paciente(sender, instance, **kwargs):
+    invalidar_linea_tiempo(instance.pk)
@@ -0,0 +1,158 @@
+"""
+Lista de espera y asignación de cupos liberados.
+
+Cada vez que un cupo futuro queda libre (se elimina o se mueve una reserva,
+expira una oferta o se crea un cupo nuevo), ``ofrecer_cupo`` busca al primer
+paciente en espera que lo acepte. El criterio es la misma especialidad, el
+mismo médico o ninguno preferido, y la hora del cupo dentro de su ventana.
+La búsqueda recorre el índice parcial ``lista_espera_activa``, que solo tiene
+las solicitudes en espera ordenadas por llegada. Se detiene en la primera que
+calza, sin recorrer la lista completa.
+
+El cupo se retiene marcándolo como ocupado con un ``UPDATE`` condicionado.
+La solicitud se reclama igual que las tareas de la cola. Así, dos
+liberaciones simultáneas nunca ofrecen el mismo cupo ni a la misma persona.
+Si la oferta no se acepta a tiempo, ``expirar_ofertas`` libera el cupo y la
+solicitud vuelve a la lista. Aceptar y liberar son ``UPDATE`` condicionados
+sobre la oferta vigente, así que solo uno de los dos gana.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.timezone import localtime, now
+
+from .calendario import invalidar_calendario
+from .cola import encolar
+from .models import Disponibilidad, ListaEspera, Reserva
+
+logger = logging.getLogger(__name__)
+
+# Solicitudes revisadas por cupo antes de desistir (la mayoría calza en las primeras).
+MAX_CANDIDATAS = 50
+
+
+def _notificar_recepcion(mensaje):
+    # Una notificación por recepcionista: la crea un trabajador de la cola.
+    usuarios = list(User.objects.filter(groups__name='Recepcionista', is_active=True).values_list('id', flat=True))
+    if usuarios:
+        encolar('notificar_usuarios', usuarios=usuarios, mensaje=mensaje)
+
+
+def ofrecer_cupo(disponibilidad_id):
+    """
+    Ofrece el cupo al primer paciente en espera que le sirva y lo retiene.
+    Devuelve la solicitud ofrecida o ``None``.
+    """
+    cupo = Disponibilidad.objects.select_related('medico').filter(
+        id=disponibilidad_id, ocupada=False, fecha_disponible__gt=now()
+    ).first()
+    if cupo is None:
+        return None
+
+    candidatas = (
+        ListaEspera.objects.filter(
+            estado=ListaEspera.ESPERANDO,
+            especialidad_id=cupo.medico.especialidad_id,
+            desde__lte=cupo.fecha_disponible,
+            hasta__gte=cupo.fecha_disponible,
+        )
+        .filter(Q(medico__isnull=True) | Q(medico_id=cupo.medico_id))
+        .exclude(disponibilidad_id=cupo.id)  # Ya la dejó pasar
+        .order_by('creada')
+        .values_list('id', flat=True)[:MAX_CANDIDATAS]
+    )
+    expira = now() + timedelta(minutes=settings.LISTA_ESPERA_RETENCION_MINUTOS)
+    for espera_id in candidatas:
+        with transaction.atomic():
+            if not Disponibilidad.objects.filter(id=cupo.id, ocupada=False).update(ocupada=True):
+                return None  # Otro proceso tomó el cupo.
+            reclamada = ListaEspera.objects.filter(id=espera_id, estado=ListaEspera.ESPERANDO).update(
+                estado=ListaEspera.OFRECIDA, disponibilidad=cupo, oferta_expira=expira
+            )
+            if not reclamada:
+                transaction.set_rollback(True)  # Otro cupo se la ofreció antes; se prueba con la siguiente.
+                continue
+        espera = ListaEspera.objects.select_related('paciente').get(id=espera_id)
+        invalidar_calendario(cupo.fecha_disponible)
+        _notificar_recepcion(
+            f"Cupo liberado ofrecido a {espera.paciente.nombre} ({espera.paciente.rut}) para el "
+            f"{localtime(cupo.fecha_disponible).strftime('%d/%m/%Y %H:%M')}. "
+            f"Retenido hasta las {localtime(expira).strftime('%H:%M')}."
+        )
+        logger.info(f"Cupo {cupo.id} ofrecido a la solicitud de espera {espera_id}.")
+        return espera
+    return None
+
+
+def _liberar(espera, estado, **condiciones):
+    """
+    Devuelve el cupo retenido por ``espera`` y la deja en ``estado``, solo si
+    la oferta sigue vigente para ese cupo (y cumple ``condiciones``). Si otro
+    proceso la aceptó o liberó antes, no toca el cupo y devuelve ``False``.
+    """
+    with transaction.atomic():
+        liberada = ListaEspera.objects.filter(
+            id=espera.id, estado=ListaEspera.OFRECIDA, disponibilidad=espera.disponibilidad_id, **condiciones
+        ).update(estado=estado, oferta_expira=None)
+        if liberada != 1:
+            return False
+        cupo = espera.disponibilidad
+        if cupo is not None:
+            # save() y no update(): la señal post_save lo ofrece a la siguiente solicitud.
+            cupo.ocupada = False
+            cupo.save(update_fields=['ocupada'])
+    return True
+
+
+def aceptar_oferta(espera, recepcionista=None):
+    """Convierte la oferta vigente (no vencida) en una reserva y la devuelve."""
+    with transaction.atomic():
+        vigente = ListaEspera.objects.filter(
+            id=espera.id, estado=ListaEspera.OFRECIDA, disponibilidad=espera.disponibilidad_id, oferta_expira__gt=now()
+        )
+        if not vigente.update(estado=ListaEspera.ASIGNADA):
+            raise ValueError("La solicitud no tiene una oferta vigente.")
+        cupo = espera.disponibilidad
+        return Reserva.objects.create(
+            paciente=espera.paciente,
+            especialidad=espera.especialidad,
+            medico=cupo.medico,
+            fecha_reserva=cupo,
+            motivo=espera.motivo,
+            recepcionista=recepcionista,
+        )
+
+
+def rechazar_oferta(espera, cancelar=False):
+    """
+    Libera el cupo ofrecido. La solicitud vuelve a la lista con su prioridad
+    (sin volver a recibir ese cupo) o, con ``cancelar``, sale de ella.
+    """
+    if not _liberar(espera, ListaEspera.CANCELADA if cancelar else ListaEspera.ESPERANDO):
+        raise ValueError("La solicitud no tiene una oferta vigente.")
+
+
+def expirar_ofertas():
+    """
+    Libera los cupos de las ofertas vencidas y cierra las solicitudes cuya
+    ventana ya pasó. Se ejecuta periódicamente desde el scheduler.
+    """
+    momento = now()
+    vencidas = ListaEspera.objects.filter(estado=ListaEspera.OFRECIDA, oferta_expira__lt=momento).select_related('disponibilidad')
+    for espera in vencidas:
+        # La condición se repite en el UPDATE: la oferta pudo aceptarse después de leerla.
+        _liberar(espera, ListaEspera.ESPERANDO, oferta_expira__lt=momento)
+    ListaEspera.objects.filter(estado=ListaEspera.ESPERANDO, hasta__lt=momento).update(estado=ListaEspera.EXPIRADA)
+
+
+@receiver(post_save, sender=Disponibilidad)
+def ofrecer_cupo_liberado(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.ocupada:
+        cupo_id = instance.pk
+        transaction.on_commit(lambda: ofrecer_cupo(cupo_id))
@@ -0,0 +1,25 @@
+import argparse
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from ficha_medica.estadisticas import actualizar_resumenes
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("Formato de fecha inválido. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Consolida los resúmenes diarios de utilización (por defecto, desde la última corrida hasta ayer)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help="Primer día a recalcular (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=_fecha, help="Último día a recalcular (AAAA-MM-DD).")
+
+    def handle(self, *args, **options):
+        filas = actualizar_resumenes(desde=options['desde'], hasta=options['hasta'])
+        self.stdout.write(self.style.SUCCESS(f"Resúmenes actualizados: {filas} filas."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ficha_medica.archivo import TAMANO_LOTE, archivar_disponibilidades
+
+
+class Command(BaseCommand):
+    help = "Elimina los cupos pasados sin reserva y archiva los reservados con sus reservas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Cupos por transacción.")
+
+    def handle(self, *args, **options):
+        resultado = archivar_disponibilidades(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Cupos eliminados: {resultado['cupos_eliminados']}, cupos archivados: {resultado['cupos_archivados']}, "
+            f"reservas archivadas: {resultado['reservas_archivadas']}."
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ficha_medica.duplicados import UMBRAL, detectar_duplicados, fusionar_pares, guardar_duplicados
+
+
+class Command(BaseCommand):
+    help = "Busca pacientes probablemente duplicados y los deja para revisión en el administrador."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--umbral', type=float, default=UMBRAL,
+                            help="Puntaje mínimo (0 a 1) para considerar un par como duplicado.")
+        parser.add_argument('--fusionar', action='store_true',
+                            help="Fusionar de inmediato los pares encontrados en vez de guardarlos.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        pares = detectar_duplicados(umbral=options['umbral'])
+        self.stdout.write(f"{len(pares)} posibles duplicados en {time.perf_counter() - inicio:.1f} s.")
+        if options['fusionar']:
+            resultado = fusionar_pares(pares)
+            self.stdout.write(self.style.SUCCESS(
+                f"Pacientes eliminados: {resultado['eliminados']}, fichas reasignadas: {resultado['fichas']}, "
+                f"reservas reasignadas: {resultado['reservas']}."
+            ))
+        else:
+            guardar_duplicados(pares)
+            self.stdout.write(self.style.SUCCESS("Posibles duplicados guardados para revisión."))
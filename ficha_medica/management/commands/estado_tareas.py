@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ficha_medica.cola import resumen_tareas
+
+
+def _ms(valor):
+    return f"{valor:.1f}" if valor is not None else "-"
+
+
+class Command(BaseCommand):
+    help = "Muestra el estado de la cola de tareas y los tiempos por tipo de tarea."
+
+    def handle(self, *args, **options):
+        filas = resumen_tareas()
+        if not filas:
+            self.stdout.write("No hay tareas registradas.")
+            return
+        self.stdout.write(
+            f"{'Tarea':<30} {'Pend.':>6} {'Curso':>6} {'OK':>7} {'Error':>6} "
+            f"{'Espera ms':>10} {'Prom. ms':>10} {'Máx. ms':>10}"
+        )
+        for fila in filas:
+            self.stdout.write(
+                f"{fila['nombre']:<30} {fila['pendientes']:>6} {fila['en_curso']:>6} {fila['completadas']:>7} "
+                f"{fila['fallidas']:>6} {_ms(fila['espera_promedio_ms']):>10} "
+                f"{_ms(fila['duracion_promedio_ms']):>10} {_ms(fila['duracion_maxima_ms']):>10}"
+            )
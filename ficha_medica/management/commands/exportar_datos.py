@@ -0,0 +1,43 @@
+import argparse
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ficha_medica.exportacion import COLUMNAS, FORMATOS, consulta_exportacion, generar_exportacion
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida: {valor}. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Exporta reservas, fichas o pacientes a CSV o JSONL, en streaming y opcionalmente comprimido con gzip."
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(COLUMNAS))
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Comprimir la salida con gzip.")
+        parser.add_argument('--salida', help="Archivo de salida (por defecto, la salida estándar).")
+        parser.add_argument('--desde', type=_fecha, help="Fecha inicial (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=_fecha, help="Fecha final (AAAA-MM-DD).")
+        parser.add_argument('--medico', type=int, help="ID del médico.")
+        parser.add_argument('--especialidad', type=int, help="ID de la especialidad.")
+
+    def handle(self, *args, **options):
+        consulta = consulta_exportacion(
+            options['modelo'], desde=options['desde'], hasta=options['hasta'],
+            medico_id=options['medico'], especialidad_id=options['especialidad'],
+        )
+        bloques = generar_exportacion(options['modelo'], consulta, formato=options['formato'], comprimir=options['gzip'])
+        if options['salida']:
+            with open(options['salida'], 'wb') as salida:
+                for bloque in bloques:
+                    salida.write(bloque)
+        else:
+            for bloque in bloques:
+                sys.stdout.buffer.write(bloque)
+            sys.stdout.buffer.flush()
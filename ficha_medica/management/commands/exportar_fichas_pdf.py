@@ -0,0 +1,46 @@
+import argparse
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ficha_medica.exportacion_pdf import fichas_para_exportar, generar_zip
+from ficha_medica.models import Paciente
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida: {valor}. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Exporta fichas médicas a un ZIP con un PDF por ficha, generados en paralelo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Ruta del archivo ZIP a generar.")
+        parser.add_argument('--rut', help="RUT del paciente.")
+        parser.add_argument('--desde', type=_fecha, help="Fecha de creación inicial (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=_fecha, help="Fecha de creación final (AAAA-MM-DD).")
+        parser.add_argument('--procesos', type=int, help="Procesos de render (por defecto, uno por núcleo).")
+
+    def handle(self, *args, **options):
+        paciente = None
+        if options['rut']:
+            try:
+                paciente = Paciente.objects.get(rut=options['rut'])
+            except Paciente.DoesNotExist:
+                raise CommandError(f"No se encontró un paciente con RUT {options['rut']}.")
+
+        fichas = fichas_para_exportar(paciente=paciente, desde=options['desde'], hasta=options['hasta'])
+        total = fichas.count()
+        paso = max(total // 20, 1)
+
+        def progreso(hechas, total):
+            if hechas % paso == 0 or hechas == total:
+                self.stdout.write(f"{hechas}/{total} fichas exportadas")
+
+        with open(options['salida'], 'wb') as salida:
+            for bloque in generar_zip(fichas, total=total, progreso=progreso, procesos=options['procesos']):
+                salida.write(bloque)
+        self.stdout.write(self.style.SUCCESS(f"Exportación completada: {options['salida']} ({total} fichas)"))
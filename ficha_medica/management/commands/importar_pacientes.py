@@ -0,0 +1,33 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ficha_medica.importacion import TAMANO_LOTE, escribir_reporte_errores, importar_pacientes
+
+
+class Command(BaseCommand):
+    help = "Importa pacientes desde un CSV (rut, nombre, fecha_nacimiento, direccion, telefono, email)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del CSV a importar (UTF-8).")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas por lote.")
+        parser.add_argument('--reporte', help="Ruta del CSV donde escribir las filas con errores.")
+        parser.add_argument('--no-actualizar', action='store_true',
+                            help="No modificar los pacientes que ya existen.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8-sig') as archivo:
+                resultado = importar_pacientes(
+                    archivo, tamano_lote=options['lote'], actualizar=not options['no_actualizar']
+                )
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        if options['reporte']:
+            with open(options['reporte'], 'w', newline='', encoding='utf-8') as reporte:
+                escribir_reporte_errores(resultado, reporte)
+        resumen = resultado.como_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"Creados: {resumen['creados']}, actualizados: {resumen['actualizados']}, "
+            f"sin cambios: {resumen['sin_cambios']}, filas con errores: {resumen['errores']}."
+        ))
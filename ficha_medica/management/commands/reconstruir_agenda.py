@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ficha_medica.agenda import reconstruir_agenda
+from ficha_medica.models import AgendaMedico, Reserva
+
+
+class Command(BaseCommand):
+    help = "Regenera la agenda precalculada de los médicos a partir de las reservas."
+
+    def handle(self, *args, **options):
+        reconstruir_agenda()
+        self.stdout.write(self.style.SUCCESS(
+            f"Agenda regenerada: {AgendaMedico.objects.count()} entradas para {Reserva.objects.count()} reservas."
+        ))
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import localtime, make_aware
+
+from ficha_medica.models import Medico
+from ficha_medica.reprogramacion import DESTINOS, PlanDesactualizado, aplicar_reprogramacion, planificar_reprogramacion
+
+
+def _fecha(valor):
+    try:
+        return make_aware(datetime.strptime(valor, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError("Formato de fecha inválido. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Reprograma las reservas de un médico que no podrá atender en un rango de fechas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('medico_id', type=int)
+        parser.add_argument('--desde', required=True, help="Primer día sin atención (AAAA-MM-DD).")
+        parser.add_argument('--hasta', required=True, help="Último día sin atención (AAAA-MM-DD).")
+        parser.add_argument('--destino', choices=DESTINOS, default='especialidad',
+                            help="Otros médicos de la especialidad o cupos del mismo médico fuera del rango.")
+        parser.add_argument('--aplicar', action='store_true',
+                            help="Ejecutar el plan (por defecto solo se muestra).")
+
+    def handle(self, *args, **options):
+        try:
+            medico = Medico.objects.select_related('user').get(id=options['medico_id'])
+        except Medico.DoesNotExist:
+            raise CommandError("Médico no encontrado.")
+        inicio = _fecha(options['desde'])
+        fin = _fecha(options['hasta']) + timedelta(days=1) - timedelta(microseconds=1)
+
+        plan = planificar_reprogramacion(medico, inicio, fin, options['destino'])
+        for a in plan['asignaciones']:
+            self.stdout.write(
+                f"{a['paciente']}: {localtime(a['fecha_origen']):%d/%m/%Y %H:%M} -> "
+                f"{localtime(a['fecha_destino']):%d/%m/%Y %H:%M} (médico {a['medico_destino']})"
+            )
+        for a in plan['sin_cupo']:
+            self.stdout.write(self.style.WARNING(f"{a['paciente']}: {localtime(a['fecha_origen']):%d/%m/%Y %H:%M} sin cupo disponible"))
+        if not options['aplicar']:
+            self.stdout.write(f"{len(plan['asignaciones'])} reservas a reprogramar. Use --aplicar para ejecutar el plan.")
+            return
+        try:
+            resultado = aplicar_reprogramacion(medico, inicio, fin, plan)
+        except PlanDesactualizado as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reservas reprogramadas: {resultado['reprogramadas']}, sin cupo: {resultado['sin_cupo']}, "
+            f"cupos retirados: {resultado['cupos_retirados']}."
+        ))
@@ -0,0 +1,69 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.metricas import volcar
+from ficha_medica.cola import nombre_trabajador, procesar_tareas
+from ficha_medica.scheduler import iniciar_scheduler_unico
+
+
+def _trabajador(indice, detener, intervalo):
+    import django
+    django.setup()  # Necesario si el proceso se creó con 'spawn'.
+    # Los procesos hijos ignoran Ctrl+C; el proceso principal coordina la salida.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        procesar_tareas(nombre_trabajador(indice), detener, intervalo=intervalo)
+    finally:
+        connections.close_all()
+        volcar()  # Métricas de las tareas (/metrics lee el archivo de cada proceso)
+
+
+def _interrumpir(signum, frame):
+    # SIGTERM se trata igual que Ctrl+C. No se activa el evento desde el
+    # manejador: hacerlo mientras se espera en él bloquearía el proceso.
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = "Inicia procesos trabajadores que ejecutan las tareas encoladas en la base de datos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=2, help="Número de procesos trabajadores.")
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help="Segundos de espera cuando no hay tareas pendientes.")
+        parser.add_argument('--sin-scheduler', action='store_true',
+                            help="No iniciar aquí el scheduler de tareas periódicas.")
+
+    def handle(self, *args, **options):
+        detener = multiprocessing.Event()
+        # Las conexiones abiertas no deben heredarse entre procesos.
+        connections.close_all()
+        procesos = [
+            # No son daemon: una tarea puede crear su propio pool de procesos.
+            multiprocessing.Process(target=_trabajador, args=(indice, detener, options['intervalo']))
+            for indice in range(options['procesos'])
+        ]
+        for proceso in procesos:
+            proceso.start()
+        self.stdout.write(f"{len(procesos)} trabajadores iniciados. Ctrl+C para detener.")
+        # Este proceso vive lo mismo que el servicio (los workers de gunicorn se
+        # reciclan). Se inicia después de crear los trabajadores para que no
+        # hereden el candado.
+        if not options['sin_scheduler'] and iniciar_scheduler_unico():
+            self.stdout.write("Scheduler de tareas periódicas iniciado.")
+
+        signal.signal(signal.SIGTERM, _interrumpir)
+        try:
+            while any(proceso.is_alive() for proceso in procesos):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        detener.set()
+        self.stdout.write("Deteniendo trabajadores (se termina la tarea en curso)...")
+        for proceso in procesos:
+            proceso.join()
+        self.stdout.write(self.style.SUCCESS("Trabajadores detenidos."))
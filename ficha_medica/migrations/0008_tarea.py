@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0007_alter_medico_telefono_alter_paciente_telefono_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=3)),
+                ('ejecutar_despues', models.DateTimeField(default=django.utils.timezone.now)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('espera_ms', models.FloatField(blank=True, null=True)),
+                ('duracion_ms', models.FloatField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'indexes': [models.Index(fields=['estado', 'ejecutar_despues'], name='ficha_medic_estado_1fffa8_idx')],
+            },
+        ),
+    ]
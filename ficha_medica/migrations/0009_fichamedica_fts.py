@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# Índice de texto completo (SQLite FTS5) sobre las fichas médicas. Es una tabla
+# de contenido externo: guarda solo el índice y se mantiene sincronizada con
+# triggers, por lo que también refleja cambios hechos con update() o SQL directo.
+# 'remove_diacritics 2' pliega los acentos; 'prefix' acelera las búsquedas por prefijo.
+CREAR = [
+    """
+    CREATE VIRTUAL TABLE ficha_medica_fichamedica_fts USING fts5(
+        diagnostico, tratamiento, observaciones,
+        content='ficha_medica_fichamedica', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER ficha_medica_fichamedica_fts_ai AFTER INSERT ON ficha_medica_fichamedica BEGIN
+        INSERT INTO ficha_medica_fichamedica_fts(rowid, diagnostico, tratamiento, observaciones)
+        VALUES (new.id, new.diagnostico, new.tratamiento, new.observaciones);
+    END
+    """,
+    """
+    CREATE TRIGGER ficha_medica_fichamedica_fts_ad AFTER DELETE ON ficha_medica_fichamedica BEGIN
+        INSERT INTO ficha_medica_fichamedica_fts(ficha_medica_fichamedica_fts, rowid, diagnostico, tratamiento, observaciones)
+        VALUES ('delete', old.id, old.diagnostico, old.tratamiento, old.observaciones);
+    END
+    """,
+    """
+    CREATE TRIGGER ficha_medica_fichamedica_fts_au
+    AFTER UPDATE OF diagnostico, tratamiento, observaciones ON ficha_medica_fichamedica BEGIN
+        INSERT INTO ficha_medica_fichamedica_fts(ficha_medica_fichamedica_fts, rowid, diagnostico, tratamiento, observaciones)
+        VALUES ('delete', old.id, old.diagnostico, old.tratamiento, old.observaciones);
+        INSERT INTO ficha_medica_fichamedica_fts(rowid, diagnostico, tratamiento, observaciones)
+        VALUES (new.id, new.diagnostico, new.tratamiento, new.observaciones);
+    END
+    """,
+    "INSERT INTO ficha_medica_fichamedica_fts(ficha_medica_fichamedica_fts) VALUES ('rebuild')",
+]
+
+ELIMINAR = [
+    "DROP TRIGGER IF EXISTS ficha_medica_fichamedica_fts_ai",
+    "DROP TRIGGER IF EXISTS ficha_medica_fichamedica_fts_ad",
+    "DROP TRIGGER IF EXISTS ficha_medica_fichamedica_fts_au",
+    "DROP TABLE IF EXISTS ficha_medica_fichamedica_fts",
+]
+
+
+def _ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        # En otros motores la búsqueda usa el filtro icontains de respaldo.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sentencia in sentencias:
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0008_tarea'),
+    ]
+
+    operations = [
+        migrations.RunPython(_ejecutar(CREAR), _ejecutar(ELIMINAR)),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ficha_medica.utils import normalizar_texto, rut_a_digitos, trigramas
+
+
+def poblar_campos_busqueda(apps, schema_editor):
+    Paciente = apps.get_model('ficha_medica', 'Paciente')
+    PacienteTrigrama = apps.get_model('ficha_medica', 'PacienteTrigrama')
+    lote = []
+    for paciente in Paciente.objects.only('id', 'rut', 'nombre').iterator(chunk_size=2000):
+        paciente.rut_digitos = rut_a_digitos(paciente.rut)
+        paciente.nombre_normalizado = normalizar_texto(paciente.nombre)[:100]
+        lote.append(paciente)
+        if len(lote) >= 2000:
+            _guardar_lote(Paciente, PacienteTrigrama, lote)
+            lote = []
+    _guardar_lote(Paciente, PacienteTrigrama, lote)
+
+
+def _guardar_lote(Paciente, PacienteTrigrama, lote):
+    Paciente.objects.bulk_update(lote, ['rut_digitos', 'nombre_normalizado'])
+    PacienteTrigrama.objects.bulk_create(
+        PacienteTrigrama(paciente_id=paciente.id, trigrama=trigrama)
+        for paciente in lote for trigrama in trigramas(paciente.nombre)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0009_fichamedica_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='nombre_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='rut_digitos',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.CreateModel(
+            name='PacienteTrigrama',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigrama', models.CharField(max_length=3)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='ficha_medica.paciente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigrama', 'paciente'], name='ficha_medic_trigram_7176f0_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_campos_busqueda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ficha_medica.utils import clave_fonetica
+
+
+def poblar_nombre_fonetico(apps, schema_editor):
+    Paciente = apps.get_model('ficha_medica', 'Paciente')
+    lote = []
+    for paciente in Paciente.objects.only('id', 'nombre').iterator(chunk_size=2000):
+        paciente.nombre_fonetico = clave_fonetica(paciente.nombre)[:100]
+        lote.append(paciente)
+        if len(lote) >= 2000:
+            Paciente.objects.bulk_update(lote, ['nombre_fonetico'])
+            lote = []
+    Paciente.objects.bulk_update(lote, ['nombre_fonetico'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0010_busqueda_pacientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosibleDuplicado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.FloatField()),
+                ('motivo', models.CharField(max_length=50)),
+                ('descartado', models.BooleanField(default=False)),
+                ('detectado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Posible duplicado',
+                'verbose_name_plural': 'Posibles duplicados',
+            },
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='nombre_fonetico',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['fecha_nacimiento'], name='ficha_medic_fecha_n_af61d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['telefono'], name='ficha_medic_telefon_a92709_idx'),
+        ),
+        migrations.AddField(
+            model_name='posibleduplicado',
+            name='duplicado',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ficha_medica.paciente'),
+        ),
+        migrations.AddField(
+            model_name='posibleduplicado',
+            name='paciente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posibles_duplicados', to='ficha_medica.paciente'),
+        ),
+        migrations.AddConstraint(
+            model_name='posibleduplicado',
+            constraint=models.UniqueConstraint(fields=('paciente', 'duplicado'), name='posible_duplicado_unico'),
+        ),
+        migrations.RunPython(poblar_nombre_fonetico, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.timezone import localtime
+
+
+def poblar_agenda(apps, schema_editor):
+    Reserva = apps.get_model('ficha_medica', 'Reserva')
+    AgendaMedico = apps.get_model('ficha_medica', 'AgendaMedico')
+    lote = []
+    reservas = Reserva.objects.select_related('paciente', 'fecha_reserva').iterator(chunk_size=2000)
+    for reserva in reservas:
+        hora = reserva.fecha_reserva.fecha_disponible
+        lote.append(AgendaMedico(
+            reserva_id=reserva.id, medico_id=reserva.medico_id, paciente_id=reserva.paciente_id,
+            dia=localtime(hora).date(), hora=hora, paciente_nombre=reserva.paciente.nombre, motivo=reserva.motivo,
+        ))
+        if len(lote) >= 2000:
+            AgendaMedico.objects.bulk_create(lote)
+            lote = []
+    AgendaMedico.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0011_duplicados_pacientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgendaMedico',
+            fields=[
+                ('reserva', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='agenda', serialize=False, to='ficha_medica.reserva')),
+                ('dia', models.DateField()),
+                ('hora', models.DateTimeField()),
+                ('paciente_nombre', models.CharField(max_length=100)),
+                ('motivo', models.TextField()),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agenda', to='ficha_medica.medico')),
+                ('paciente', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ficha_medica.paciente')),
+            ],
+            options={
+                'verbose_name': 'Entrada de agenda',
+                'verbose_name_plural': 'Agenda de médicos',
+                'indexes': [models.Index(fields=['medico', 'dia', 'hora'], name='ficha_medic_medico__af4282_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_agenda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0012_agenda_medico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='disponibilidad',
+            index=models.Index(fields=['fecha_disponible'], name='ficha_medic_fecha_d_5f2c6c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disponibilidad',
+            index=models.Index(fields=['medico', 'fecha_disponible'], name='ficha_medic_medico__3bc3c3_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0013_indices_disponibilidad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('cupos', models.PositiveIntegerField(default=0)),
+                ('reservados', models.PositiveIntegerField(default=0)),
+                ('atendidas', models.PositiveIntegerField(default=0)),
+                ('inasistencias', models.PositiveIntegerField(default=0)),
+                ('fichas', models.PositiveIntegerField(default=0)),
+                ('especialidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='ficha_medica.especialidad')),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='ficha_medica.medico')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'indexes': [models.Index(fields=['dia'], name='ficha_medic_dia_b3452f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(fields=('medico', 'dia'), name='resumen_diario_unico'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0014_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListaEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateTimeField()),
+                ('hasta', models.DateTimeField()),
+                ('motivo', models.TextField()),
+                ('estado', models.CharField(choices=[('esperando', 'Esperando'), ('ofrecida', 'Cupo ofrecido'), ('asignada', 'Asignada'), ('cancelada', 'Cancelada'), ('expirada', 'Expirada')], default='esperando', max_length=10)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('oferta_expira', models.DateTimeField(blank=True, null=True)),
+                ('disponibilidad', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ficha_medica.disponibilidad')),
+                ('especialidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ficha_medica.especialidad')),
+                ('medico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ficha_medica.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='ficha_medica.paciente')),
+            ],
+            options={
+                'verbose_name': 'Lista de espera',
+                'verbose_name_plural': 'Lista de espera',
+                'indexes': [models.Index(condition=models.Q(('estado', 'esperando')), fields=['especialidad', 'creada'], name='lista_espera_activa'), models.Index(fields=['estado', 'oferta_expira'], name='ficha_medic_estado_011104_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ficha_medica', '0015_lista_espera'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisponibilidadHistorica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_disponible', models.DateTimeField()),
+                ('ocupada', models.BooleanField(default=False)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ficha_medica.medico')),
+            ],
+            options={
+                'verbose_name': 'Disponibilidad histórica',
+                'verbose_name_plural': 'Disponibilidades históricas',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReservaHistorica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('motivo', models.TextField()),
+                ('especialidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ficha_medica.especialidad')),
+                ('fecha_reserva', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='ficha_medica.disponibilidadhistorica')),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ficha_medica.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_historicas', to='ficha_medica.paciente')),
+                ('recepcionista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reserva histórica',
+                'verbose_name_plural': 'Reservas históricas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='disponibilidadhistorica',
+            index=models.Index(fields=['medico', 'fecha_disponible'], name='ficha_medic_medico__aa8dd7_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ficha_medica', '0016_archivo_historico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarea',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
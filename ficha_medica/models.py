@@ -3,6 +3,7 @@ from django.contrib.auth.models import User, Group
 from datetime import date
 from django.utils.timezone import localtime, now
 from django.core.validators import RegexValidator
+from .utils import clave_fonetica, normalizar_texto, rut_a_digitos
 
 class Paciente(models.Model):
     rut = models.CharField(max_length=12, unique=True)  # Ejemplo: 12345678-9
@@ -22,14 +23,37 @@ class Paciente(models.Model):
         ]
     )
     email = models.EmailField(blank=True, null=True)
+    # Columnas derivadas e indexadas para la búsqueda por prefijo (ver busqueda.py)
+    rut_digitos = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    nombre_normalizado = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
+    # Clave de bloqueo para la detección de duplicados (ver duplicados.py)
+    nombre_fonetico = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
+
+    CAMPOS_BUSQUEDA = ('rut_digitos', 'nombre_normalizado', 'nombre_fonetico')
 
     class Meta:
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
+        indexes = [
+            models.Index(fields=['fecha_nacimiento']),
+            models.Index(fields=['telefono']),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
 
+    def actualizar_campos_busqueda(self):
+        """Recalcula las columnas de búsqueda; necesario antes de bulk_create/bulk_update."""
+        self.rut_digitos = rut_a_digitos(self.rut)
+        self.nombre_normalizado = normalizar_texto(self.nombre)[:100]
+        self.nombre_fonetico = clave_fonetica(self.nombre)[:100]
+
+    def save(self, *args, **kwargs):
+        self.actualizar_campos_busqueda()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.CAMPOS_BUSQUEDA}
+        super().save(*args, **kwargs)
+
     @property
     def edad(self):
         """Calcula la edad del paciente basado en la fecha de nacimiento."""
@@ -38,6 +62,41 @@ class Paciente(models.Model):
             return today.year - self.fecha_nacimiento.year - ((today.month, today.day) < (self.fecha_nacimiento.month, self.fecha_nacimiento.day))
         return None
 
+class PacienteTrigrama(models.Model):
+    """
+    Trigramas del nombre normalizado de cada paciente, para encontrar nombres
+    con errores de tipeo o por palabras intermedias.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='trigramas')
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['trigrama', 'paciente'])]
+
+
+class PosibleDuplicado(models.Model):
+    """
+    Par de pacientes que probablemente son la misma persona, detectado por
+    ``manage.py detectar_duplicados``. ``paciente`` es siempre el de menor id.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='posibles_duplicados')
+    duplicado = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='+')
+    puntaje = models.FloatField()
+    motivo = models.CharField(max_length=50)  # Clave de bloqueo que los reunió
+    descartado = models.BooleanField(default=False)  # Revisado: no son la misma persona
+    detectado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Posible duplicado"
+        verbose_name_plural = "Posibles duplicados"
+        constraints = [
+            models.UniqueConstraint(fields=['paciente', 'duplicado'], name='posible_duplicado_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente} ~ {self.duplicado} ({self.puntaje:.2f})"
+
+
 class Especialidad(models.Model):
     nombre = models.CharField(max_length=100, unique=True)  # Nombre único para la especialidad
     descripcion = models.TextField(blank=True, null=True)  # Descripción opcional
@@ -138,6 +197,10 @@ class Disponibilidad(models.Model):
     class Meta:
         verbose_name = "Disponibilidad"
         verbose_name_plural = "Disponibilidades"
+        indexes = [
+            models.Index(fields=['fecha_disponible']),  # Rangos por mes del calendario
+            models.Index(fields=['medico', 'fecha_disponible']),
+        ]
 
     def __str__(self):
         return f"{self.medico} - {self.fecha_disponible}"
@@ -160,6 +223,130 @@ class Reserva(models.Model):
     def __str__(self):
         return f"Reserva de {self.paciente.nombre} gestionada por {self.recepcionista.first_name if self.recepcionista else 'N/A'} para el médico {self.medico.user.first_name}"
 
+class DisponibilidadHistorica(models.Model):
+    """
+    Cupo pasado con reserva, trasladado desde ``Disponibilidad`` por
+    ``archivo.archivar_disponibilidades`` (mismas columnas y mismo id).
+    """
+    medico = models.ForeignKey('Medico', on_delete=models.CASCADE, related_name='+')
+    fecha_disponible = models.DateTimeField()
+    ocupada = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "Disponibilidad histórica"
+        verbose_name_plural = "Disponibilidades históricas"
+        indexes = [models.Index(fields=['medico', 'fecha_disponible'])]
+
+    def __str__(self):
+        return f"{self.medico} - {self.fecha_disponible}"
+
+class ReservaHistorica(models.Model):
+    """Reserva archivada junto con su cupo (mismas columnas y mismo id que ``Reserva``)."""
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='reservas_historicas')
+    especialidad = models.ForeignKey(Especialidad, on_delete=models.CASCADE, related_name='+')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='+')
+    fecha_reserva = models.ForeignKey(DisponibilidadHistorica, on_delete=models.CASCADE, related_name='reservas')
+    motivo = models.TextField()
+    recepcionista = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        verbose_name = "Reserva histórica"
+        verbose_name_plural = "Reservas históricas"
+
+    def __str__(self):
+        return f"Reserva histórica de {self.paciente_id} ({self.fecha_reserva_id})"
+
+class AgendaMedico(models.Model):
+    """
+    Modelo de lectura de la agenda diaria de cada médico: una fila por
+    reserva, con los datos que muestra el panel ya copiados, para leer el día
+    con una sola consulta indexada y sin joins. Se mantiene desde agenda.py.
+    """
+    reserva = models.OneToOneField(Reserva, on_delete=models.CASCADE, primary_key=True, related_name='agenda')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='agenda')
+    # Sin restricción de clave foránea: la fusión de duplicados lo reasigna en bloque.
+    paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    dia = models.DateField()  # Día local (America/Santiago) de la reserva
+    hora = models.DateTimeField()
+    paciente_nombre = models.CharField(max_length=100)
+    motivo = models.TextField()
+
+    class Meta:
+        verbose_name = "Entrada de agenda"
+        verbose_name_plural = "Agenda de médicos"
+        indexes = [models.Index(fields=['medico', 'dia', 'hora'])]
+
+    def __str__(self):
+        return f"{self.medico_id} {self.hora} {self.paciente_nombre}"
+
+class ResumenDiario(models.Model):
+    """
+    Totales diarios por médico para los reportes de utilización, calculados
+    cada noche por ``estadisticas.actualizar_resumenes``.
+    """
+    dia = models.DateField()
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='resumenes')
+    especialidad = models.ForeignKey(Especialidad, on_delete=models.CASCADE, related_name='resumenes')
+    cupos = models.PositiveIntegerField(default=0)  # Disponibilidades ofrecidas
+    reservados = models.PositiveIntegerField(default=0)
+    atendidas = models.PositiveIntegerField(default=0)  # Reservas con ficha del mismo día
+    inasistencias = models.PositiveIntegerField(default=0)
+    fichas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumen diario"
+        verbose_name_plural = "Resúmenes diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['medico', 'dia'], name='resumen_diario_unico'),
+        ]
+        indexes = [models.Index(fields=['dia'])]
+
+    def __str__(self):
+        return f"{self.dia} - {self.medico_id}"
+
+class ListaEspera(models.Model):
+    """
+    Paciente que espera un cupo de una especialidad (y opcionalmente de un
+    médico) dentro de una ventana de fechas. Cuando se libera un cupo que le
+    sirve, se le ofrece y el cupo queda retenido hasta ``oferta_expira``.
+    """
+    ESPERANDO = 'esperando'
+    OFRECIDA = 'ofrecida'
+    ASIGNADA = 'asignada'
+    CANCELADA = 'cancelada'
+    EXPIRADA = 'expirada'
+    ESTADOS = [
+        (ESPERANDO, 'Esperando'),
+        (OFRECIDA, 'Cupo ofrecido'),
+        (ASIGNADA, 'Asignada'),
+        (CANCELADA, 'Cancelada'),
+        (EXPIRADA, 'Expirada'),
+    ]
+
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='esperas')
+    especialidad = models.ForeignKey(Especialidad, on_delete=models.CASCADE)
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, null=True, blank=True)  # Vacío: cualquier médico
+    desde = models.DateTimeField()
+    hasta = models.DateTimeField()
+    motivo = models.TextField()
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=ESPERANDO)
+    creada = models.DateTimeField(auto_now_add=True)
+    # Último cupo ofrecido (retenido mientras la oferta está vigente)
+    disponibilidad = models.ForeignKey(Disponibilidad, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    oferta_expira = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lista de espera"
+        verbose_name_plural = "Lista de espera"
+        indexes = [
+            # Solo las solicitudes en espera, en orden de llegada por especialidad.
+            models.Index(fields=['especialidad', 'creada'], condition=models.Q(estado='esperando'), name='lista_espera_activa'),
+            models.Index(fields=['estado', 'oferta_expira']),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente} - {self.especialidad} ({self.get_estado_display()})"
+
 class Notificacion(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notificaciones')
     mensaje = models.TextField()
@@ -170,3 +357,43 @@ class Notificacion(models.Model):
         return f"Notificación para {self.usuario.username} - {self.mensaje}"
 
 
+
+
+class Tarea(models.Model):
+    """
+    Trabajo en segundo plano de la cola local (ver ``ficha_medica.cola``).
+    """
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADA = 'completada'
+    FALLIDA = 'fallida'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (COMPLETADA, 'Completada'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    ejecutar_despues = models.DateTimeField(default=now)
+    creada = models.DateTimeField(default=now)
+    iniciada = models.DateTimeField(blank=True, null=True)
+    terminada = models.DateTimeField(blank=True, null=True)
+    trabajador = models.CharField(max_length=100, blank=True)
+    latido = models.DateTimeField(blank=True, null=True)  # Lo renueva el trabajador mientras la ejecuta
+    espera_ms = models.FloatField(blank=True, null=True)  # Desde la creación hasta el primer intento
+    duracion_ms = models.FloatField(blank=True, null=True)  # Duración del último intento
+    resultado = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        indexes = [models.Index(fields=['estado', 'ejecutar_despues'])]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.estado})"
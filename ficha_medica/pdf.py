@@ -0,0 +1,200 @@
+"""
+Generación de PDFs de fichas médicas con ReportLab platypus.
+
+El contenido se maqueta con flowables (párrafos con ajuste de línea y salto de
+página automático) y el documento se escribe en un archivo temporal en disco,
+que luego se entrega en bloques mediante ``FileResponse``. Así un historial de
+decenas de páginas no queda completo en memoria dentro del ``HttpResponse``.
+
+Las fichas se maquetan a medida que se leen (``_DocumentoPorLotes``): en
+memoria solo están los flowables de la ficha en curso. ReportLab sí conserva
+hasta guardar el contenido de cada página ya dibujada (unos 20 KB por ficha),
+así que un documento admite como máximo ``PDF_MAX_FICHAS_DOCUMENTO`` fichas.
+Para más está la exportación en ZIP, con un PDF por ficha.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import FileResponse
+from django.utils.timezone import localtime
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import KeepTogether, PageBreak, Paragraph, SimpleDocTemplate, Spacer
+
+MARGEN = 2 * cm
+TITULO_DOCUMENTO = "Centro Médico"
+PIE_DOCUMENTO = "Este documento fue generado automáticamente."
+
+_estilos = getSampleStyleSheet()
+ESTILO_TITULO = ParagraphStyle('FichaTitulo', parent=_estilos['Title'], fontSize=16, spaceAfter=12)
+ESTILO_SECCION = ParagraphStyle('FichaSeccion', parent=_estilos['Heading4'], spaceBefore=8, spaceAfter=2)
+ESTILO_TEXTO = ParagraphStyle('FichaTexto', parent=_estilos['BodyText'], fontSize=11, leading=14)
+
+
+def datos_ficha(ficha):
+    """
+    Extrae de una ficha los datos necesarios para el PDF como un diccionario
+    de tipos simples (serializable y apto para enviarse a otros procesos).
+    """
+    paciente = ficha.paciente
+    medico = ficha.medico
+    return {
+        'id': ficha.id,
+        'paciente': paciente.nombre,
+        'rut': paciente.rut,
+        'edad': paciente.edad,
+        'medico': f"{medico.user.first_name} {medico.user.last_name}" if medico else None,
+        'diagnostico': ficha.diagnostico,
+        'tratamiento': ficha.tratamiento,
+        'observaciones': ficha.observaciones,
+        'fecha_creacion': localtime(ficha.fecha_creacion).strftime('%d/%m/%Y %H:%M'),
+    }
+
+
+def _parrafo(texto, estilo=ESTILO_TEXTO):
+    # Paragraph interpreta un subconjunto de XML: se escapa el texto libre y
+    # se conservan los saltos de línea escritos por el médico.
+    return Paragraph(escape(texto).replace('\n', '<br/>'), estilo)
+
+
+def _flowables_ficha(datos):
+    encabezado = [
+        _parrafo("Ficha Médica", ESTILO_TITULO),
+        _parrafo(f"Paciente: {datos['paciente']}"),
+        _parrafo(f"RUT: {datos['rut']}"),
+        _parrafo(f"Edad: {datos['edad'] if datos['edad'] else 'No registrada'}"),
+        _parrafo(f"Médico: {datos['medico'] or 'No asignado'}"),
+        _parrafo(f"Fecha de Creación: {datos['fecha_creacion']}"),
+    ]
+    flowables = [KeepTogether(encabezado), Spacer(1, 0.4 * cm)]
+    for titulo, texto, por_defecto in (
+        ("Diagnóstico", datos['diagnostico'], ''),
+        ("Tratamiento", datos['tratamiento'], 'No registrado'),
+        ("Observaciones", datos['observaciones'], 'Ninguna'),
+    ):
+        flowables.append(_parrafo(titulo, ESTILO_SECCION))
+        flowables.append(_parrafo(texto or por_defecto))
+    return flowables
+
+
+def _dibujar_marco(canvas, doc):
+    """Encabezado y pie de página comunes a todas las páginas."""
+    ancho, alto = doc.pagesize
+    canvas.saveState()
+    canvas.setFont("Helvetica-Bold", 10)
+    canvas.drawString(MARGEN, alto - MARGEN + 0.8 * cm, TITULO_DOCUMENTO)
+    canvas.setFont("Helvetica", 9)
+    canvas.drawRightString(ancho - MARGEN, alto - MARGEN + 0.8 * cm, doc.title)
+    canvas.line(MARGEN, alto - MARGEN + 0.6 * cm, ancho - MARGEN, alto - MARGEN + 0.6 * cm)
+    canvas.setFont("Helvetica-Oblique", 8)
+    canvas.drawString(MARGEN, MARGEN - 1 * cm, PIE_DOCUMENTO)
+    canvas.drawRightString(ancho - MARGEN, MARGEN - 1 * cm, f"Página {doc.page}")
+    canvas.restoreState()
+
+
+class _DocumentoPorLotes(SimpleDocTemplate):
+    """
+    Toma los flowables de ``lotes`` (un iterador de listas) solo cuando los
+    necesita. ``filterFlowables`` se llama antes de maquetar cada flowable;
+    ahí se agrega la siguiente ficha cuando a la historia le queda a lo más
+    uno. ReportLab también lo llama con sus listas internas, que no se tocan.
+    """
+
+    def __init__(self, destino, lotes, **kwargs):
+        super().__init__(destino, **kwargs)
+        self._lotes = lotes
+        self._historia = None
+
+    def build(self, flowables, **kwargs):
+        self._historia = flowables
+        super().build(flowables, **kwargs)
+
+    def filterFlowables(self, flowables):
+        if flowables is self._historia and len(flowables) <= 1:
+            flowables.extend(next(self._lotes, ()))
+
+
+def _lotes_fichas(fichas):
+    for indice, datos in enumerate(fichas):
+        yield ([PageBreak()] if indice else []) + _flowables_ficha(datos)
+
+
+def escribir_fichas_pdf(fichas, destino, titulo="Ficha Médica"):
+    """
+    Escribe en ``destino`` (ruta o archivo binario) un PDF con una o más
+    fichas, cada una a partir de una página nueva.
+
+    ``fichas`` es un iterable de diccionarios como los de ``datos_ficha``; se
+    recorre a medida que se maqueta.
+    """
+    lotes = _lotes_fichas(fichas)
+    documento = _DocumentoPorLotes(
+        destino, lotes, pagesize=A4, title=titulo, author=TITULO_DOCUMENTO,
+        leftMargin=MARGEN, rightMargin=MARGEN, topMargin=MARGEN, bottomMargin=MARGEN,
+    )
+    historia = next(lotes, None) or [_parrafo("No hay fichas médicas para mostrar.")]
+    documento.build(historia, onFirstPage=_dibujar_marco, onLaterPages=_dibujar_marco)
+
+
+def ruta_pdf_cacheado(datos, directorio):
+    """
+    Devuelve la ruta del PDF de una ficha dentro de ``directorio``, generándolo
+    solo si no existe. El nombre incluye un hash de los datos, por lo que una
+    ficha modificada nunca reutiliza un render anterior.
+
+    No usa la base de datos ni la configuración de Django, de modo que puede
+    ejecutarse en procesos de un ``ProcessPoolExecutor``.
+    """
+    huella = hashlib.sha1(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    directorio = Path(directorio)
+    ruta = directorio / f"ficha_{datos['id']}_{huella}.pdf"
+    if not ruta.exists():
+        directorio.mkdir(parents=True, exist_ok=True)
+        # Se escribe a un temporal y se renombra para que otro proceso nunca
+        # lea un PDF a medio escribir.
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                escribir_fichas_pdf([datos], archivo)
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+    return ruta
+
+
+def eliminar_pdf_cacheado(ficha_id, directorio):
+    """Elimina los renders guardados de una ficha."""
+    for ruta in Path(directorio).glob(f"ficha_{ficha_id}_*.pdf"):
+        ruta.unlink(missing_ok=True)
+
+
+@receiver(post_save, sender='ficha_medica.FichaMedica')
+@receiver(post_delete, sender='ficha_medica.FichaMedica')
+def limpiar_pdf_cacheado(sender, instance, **kwargs):
+    eliminar_pdf_cacheado(instance.pk, settings.FICHA_PDF_CACHE_DIR)
+
+
+def respuesta_pdf(fichas, nombre_archivo, titulo="Ficha Médica"):
+    """
+    Genera el PDF en un archivo temporal y lo devuelve como ``FileResponse``,
+    que lo transmite por bloques y cierra (eliminando) el archivo al terminar.
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_fichas_pdf(fichas, archivo, titulo=titulo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return FileResponse(
+        archivo, as_attachment=True, filename=nombre_archivo, content_type='application/pdf'
+    )
@@ -0,0 +1,185 @@
+"""
+Reprogramación masiva de las reservas de un médico que no podrá atender.
+
+El plan se arma en memoria con dos consultas: las reservas futuras del médico
+en el rango y los cupos libres de los candidatos. Los candidatos son los
+otros médicos de la especialidad o el mismo médico fuera del rango. Cada
+reserva, en orden cronológico, toma el cupo libre más cercano a su hora
+original (búsqueda binaria sobre los cupos ordenados), evitando que el
+paciente quede con dos horas a la vez. Las que no alcanzan cupo quedan
+informadas en ``sin_cupo``.
+
+Al aplicar el plan todo ocurre en una transacción:
+
+- se toman los cupos de destino con un ``UPDATE`` condicionado y, si alguno
+  ya no está libre, se revierte todo con ``PlanDesactualizado``;
+- las reservas se mueven con un ``UPDATE ... CASE`` por lote;
+- se retiran los cupos del médico en el rango;
+- las notificaciones se crean con un solo ``bulk_create``.
+
+Los ``UPDATE`` masivos no emiten señales, así que la agenda, el calendario y
+la línea de tiempo se actualizan aquí.
+"""
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils.timezone import localtime, now
+
+from .agenda import reconstruir_agenda
+from .calendario import invalidar_calendario
+from .linea_tiempo import invalidar_linea_tiempo
+from .models import Disponibilidad, ListaEspera, Medico, Notificacion, Reserva
+
+logger = logging.getLogger(__name__)
+
+DESTINOS = ('especialidad', 'mismo_medico')
+# Días después del rango en que se buscan cupos de reemplazo.
+HORIZONTE_DIAS = 30
+# Ids por UPDATE; cada uno usa varios parámetros en la consulta.
+TAMANO_LOTE = 300
+
+
+class PlanDesactualizado(Exception):
+    """Algún cupo o reserva del plan cambió entre la planificación y su aplicación."""
+
+
+def _lotes(elementos):
+    for inicio in range(0, len(elementos), TAMANO_LOTE):
+        yield elementos[inicio:inicio + TAMANO_LOTE]
+
+
+def _mas_cercano(fechas, objetivo, horas_paciente):
+    """Índice del cupo más cercano a ``objetivo`` que no choque con otra hora del paciente."""
+    derecha = bisect_left(fechas, objetivo)
+    izquierda = derecha - 1
+    while izquierda >= 0 or derecha < len(fechas):
+        if derecha < len(fechas) and (izquierda < 0 or fechas[derecha] - objetivo <= objetivo - fechas[izquierda]):
+            indice, derecha = derecha, derecha + 1
+        else:
+            indice, izquierda = izquierda, izquierda - 1
+        if fechas[indice] not in horas_paciente:
+            return indice
+    return None
+
+
+def planificar_reprogramacion(medico, inicio, fin, destino='especialidad'):
+    """
+    Plan para mover las reservas futuras de ``medico`` entre ``inicio`` y
+    ``fin`` (``datetime`` con zona horaria). Devuelve ``{'asignaciones',
+    'sin_cupo'}``. Cada asignación indica la reserva, el paciente, el cupo y
+    la hora de origen y de destino, y el médico de destino.
+    """
+    inicio = max(inicio, now())
+    reservas = list(
+        Reserva.objects.filter(medico=medico, fecha_reserva__fecha_disponible__range=(inicio, fin))
+        .select_related('paciente', 'fecha_reserva')
+        .order_by('fecha_reserva__fecha_disponible', 'id')
+    )
+    if not reservas:
+        return {'asignaciones': [], 'sin_cupo': []}
+
+    cupos = Disponibilidad.objects.filter(
+        ocupada=False, fecha_disponible__gt=now(), fecha_disponible__lte=fin + timedelta(days=HORIZONTE_DIAS)
+    )
+    if destino == 'mismo_medico':
+        cupos = cupos.filter(medico=medico).exclude(fecha_disponible__range=(inicio, fin))
+    else:
+        cupos = cupos.filter(medico__especialidad_id=medico.especialidad_id).exclude(medico=medico)
+    cupos = list(cupos.order_by('fecha_disponible', 'id').values_list('fecha_disponible', 'id', 'medico_id'))
+    fechas = [fecha for fecha, _, _ in cupos]
+
+    # Horas ya tomadas por cada paciente, para no darle dos reservas simultáneas.
+    horas_pacientes = defaultdict(set)
+    for paciente_id, fecha in Reserva.objects.filter(
+        paciente_id__in={reserva.paciente_id for reserva in reservas}, fecha_reserva__fecha_disponible__gt=now()
+    ).exclude(medico=medico, fecha_reserva__fecha_disponible__range=(inicio, fin)).values_list(
+        'paciente_id', 'fecha_reserva__fecha_disponible'
+    ):
+        horas_pacientes[paciente_id].add(fecha)
+
+    asignaciones, sin_cupo = [], []
+    for reserva in reservas:
+        original = reserva.fecha_reserva.fecha_disponible
+        indice = _mas_cercano(fechas, original, horas_pacientes[reserva.paciente_id])
+        datos = {
+            'reserva_id': reserva.id,
+            'paciente_id': reserva.paciente_id,
+            'paciente': reserva.paciente.nombre,
+            'cupo_origen': reserva.fecha_reserva_id,
+            'fecha_origen': original,
+        }
+        if indice is None:
+            sin_cupo.append(datos)
+            continue
+        fecha, cupo_id, medico_id = cupos.pop(indice)
+        del fechas[indice]
+        horas_pacientes[reserva.paciente_id].add(fecha)
+        asignaciones.append({**datos, 'cupo_destino': cupo_id, 'fecha_destino': fecha, 'medico_destino': medico_id})
+    return {'asignaciones': asignaciones, 'sin_cupo': sin_cupo}
+
+
+def aplicar_reprogramacion(medico, inicio, fin, plan):
+    """
+    Aplica ``plan`` (de ``planificar_reprogramacion``) y retira los cupos de
+    ``medico`` en el rango que quedaron sin reserva. Lanza
+    ``PlanDesactualizado`` si algún cupo de destino ya no está libre o alguna
+    reserva ya no está en su cupo de origen.
+    """
+    asignaciones = plan['asignaciones']
+    por_reserva = {a['reserva_id']: a for a in asignaciones}
+    ids = list(por_reserva)
+    with transaction.atomic():
+        for lote in _lotes(ids):
+            destinos = [por_reserva[i]['cupo_destino'] for i in lote]
+            if Disponibilidad.objects.filter(id__in=destinos, ocupada=False).update(ocupada=True) != len(destinos):
+                raise PlanDesactualizado("Algunos cupos de destino ya fueron reservados. Vuelva a generar el plan.")
+            movidas = Reserva.objects.filter(
+                id__in=lote, fecha_reserva_id__in=[por_reserva[i]['cupo_origen'] for i in lote]
+            ).update(
+                fecha_reserva_id=Case(*[When(id=i, then=Value(por_reserva[i]['cupo_destino'])) for i in lote]),
+                medico_id=Case(*[When(id=i, then=Value(por_reserva[i]['medico_destino'])) for i in lote]),
+            )
+            if movidas != len(lote):
+                raise PlanDesactualizado("Algunas reservas cambiaron. Vuelva a generar el plan.")
+
+        # El médico no atiende en el rango: sus cupos sin reserva se retiran. Las
+        # ofertas de la lista de espera sobre esos cupos vuelven a la lista.
+        retirados = Disponibilidad.objects.filter(
+            medico=medico, fecha_disponible__range=(max(inicio, now()), fin), reserva__isnull=True
+        )
+        ListaEspera.objects.filter(estado=ListaEspera.OFRECIDA, disponibilidad__in=retirados).update(
+            estado=ListaEspera.ESPERANDO, oferta_expira=None
+        )
+        _, borrados = retirados.delete()
+        cupos_retirados = borrados.get(Disponibilidad._meta.label, 0)
+
+        usuarios = dict(
+            Medico.objects.filter(id__in={a['medico_destino'] for a in asignaciones}).values_list('id', 'user_id')
+        )
+        notificaciones = [
+            Notificacion(
+                usuario_id=usuarios[a['medico_destino']],
+                mensaje=f"Se ha modificado la reserva para el paciente {a['paciente']}. "
+                        f"Nueva hora: {localtime(a['fecha_destino']).strftime('%d/%m/%Y %H:%M')}.",
+            )
+            for a in asignaciones
+        ]
+        if asignaciones:
+            notificaciones.append(Notificacion(
+                usuario_id=medico.user_id,
+                mensaje=f"Se reprogramaron {len(asignaciones)} reservas entre el "
+                        f"{localtime(inicio).strftime('%d/%m/%Y')} y el {localtime(fin).strftime('%d/%m/%Y')}.",
+            ))
+        Notificacion.objects.bulk_create(notificaciones)
+        reconstruir_agenda(Reserva.objects.filter(id__in=ids))
+
+    # Los meses de origen se invalidan al borrar sus cupos (señal post_delete).
+    invalidar_calendario(*(a['fecha_destino'] for a in asignaciones))
+    invalidar_linea_tiempo(*{a['paciente_id'] for a in asignaciones})
+    logger.info(f"Reprogramadas {len(asignaciones)} reservas del médico {medico.id}; {cupos_retirados} cupos retirados.")
+    return {'reprogramadas': len(asignaciones), 'sin_cupo': len(plan['sin_cupo']), 'cupos_retirados': cupos_retirados}
+
@@ -1,28 +1,31 @@
 from .models import Reserva, Notificacion
 from apscheduler.schedulers.background import BackgroundScheduler
+from core.metricas import medir_tarea
+from core.perfilado import perfilar_tarea
 from django.utils.timezone import now, localtime
 from datetime import timedelta
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 from django.db import IntegrityError
 
-def enviar_notificaciones_programadas():
-    hora_actual = localtime(now())  # Hora local
-    logger.info(f"Ejecutando notificaciones. Hora actual: {hora_actual}")
+def enviar_notificaciones_programadas(hora_actual=None):
+    hora_actual = localtime(hora_actual or now())  # Hora local
+    logger.debug(f"Ejecutando notificaciones. Hora actual: {hora_actual}")
 
-    reservas = Reserva.objects.filter(
+    reservas = list(Reserva.objects.filter(
         fecha_reserva__fecha_disponible__range=[
             hora_actual - timedelta(minutes=1),
             hora_actual + timedelta(minutes=5)
         ]
-    )
-    logger.info(f"Total reservas encontradas: {reservas.count()}")
+    ).select_related('paciente', 'fecha_reserva', 'medico__user'))
+    logger.debug(f"Total reservas encontradas: {len(reservas)}")
 
     for reserva in reservas:
         tiempo_restante = reserva.fecha_reserva.fecha_disponible - hora_actual
-        logger.info(f"Tiempo restante para {reserva.paciente.nombre}: {tiempo_restante}")
+        logger.debug(f"Tiempo restante para {reserva.paciente.nombre}: {tiempo_restante}")
 
         try:
             # Notificación 5 minutos antes
@@ -49,9 +52,80 @@ def enviar_notificaciones_programadas():
             logger.error(f"Error al crear notificación: {e}")
 
 
+def programar_notificaciones():
+    # La tarea usa la hora en que se programó, no la hora en que la toma un trabajador.
+    from .cola import encolar
+    encolar('enviar_notificaciones_programadas', momento=now().isoformat())
+
+
+def programar_resumenes():
+    # Se encola para que la ejecute un trabajador (manage.py run_workers) y no el proceso web.
+    from .cola import encolar
+    encolar('actualizar_resumenes')
+
+
+def programar_archivo():
+    from .cola import encolar
+    encolar('archivar_disponibilidades')
+
+
+def expirar_ofertas_espera():
+    from .lista_espera import expirar_ofertas
+    expirar_ofertas()
+
+
+def _trabajo(funcion):
+    # Métricas de duración y perfilado por muestreo (core/metricas.py, core/perfilado.py).
+    # En los trabajos que solo encolan se mide el encolado; la tarea en sí se
+    # mide donde se ejecuta, en cola.ejecutar_tarea.
+    return medir_tarea(perfilar_tarea(funcion))
+
+
+# Los trabajos nocturnos que no pudieron correr a su hora (proceso ocupado o
+# reiniciándose) se ejecutan igual dentro de este margen, una sola vez.
+MARGEN_NOCTURNO_SEGUNDOS = 3600
+
+
 def iniciar_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(enviar_notificaciones_programadas, 'interval', seconds=10)
+    scheduler = BackgroundScheduler(job_defaults={'coalesce': True})
+    scheduler.add_job(_trabajo(programar_notificaciones), 'interval', seconds=10)
   # Corre cada 30 segundos
+    scheduler.add_job(_trabajo(programar_resumenes), 'cron', hour=2, minute=0,  # Resúmenes de utilización, cada noche
+                      misfire_grace_time=MARGEN_NOCTURNO_SEGUNDOS)
+    scheduler.add_job(_trabajo(programar_archivo), 'cron', hour=3, minute=0,  # Limpieza de cupos, después de los resúmenes
+                      misfire_grace_time=MARGEN_NOCTURNO_SEGUNDOS)
+    scheduler.add_job(_trabajo(expirar_ofertas_espera), 'interval', seconds=60)  # Libera cupos de ofertas vencidas
     scheduler.start()
     logger.info("Scheduler iniciado para enviar notificaciones programadas.")
+
+
+_candado = None
+
+
+def iniciar_scheduler_unico():
+    """
+    Inicia el scheduler solo si ningún otro proceso de este servidor lo tiene
+    (candado de archivo en ``SCHEDULER_LOCK``). El candado se suelta al
+    terminar el proceso, así que el worker que reemplace al que lo tenía lo
+    retoma. Devuelve ``True`` si lo inició.
+    """
+    global _candado
+    from django.conf import settings
+    try:
+        import fcntl
+    except ImportError:  # Windows: sin candado, como antes
+        iniciar_scheduler()
+        return True
+    if _candado is not None:
+        return False
+    os.makedirs(os.path.dirname(settings.SCHEDULER_LOCK), exist_ok=True)
+    archivo = open(settings.SCHEDULER_LOCK, 'a')
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        archivo.close()
+        logger.info("El scheduler ya corre en otro proceso.")
+        return False
+    _candado = archivo
+    iniciar_scheduler()
+    return True
@@ -0,0 +1,123 @@
+"""
+Tareas en segundo plano de la aplicación, ejecutadas por ``manage.py run_workers``.
+"""
+import logging
+import os
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.timezone import now
+
+from core.replicas import leer_de_replica
+
+from .archivo import archivar_disponibilidades as archivar_cupos
+from .cola import purgar_tareas_terminadas, reportar_progreso, tarea
+from .duplicados import UMBRAL, detectar_duplicados as detectar_pares_duplicados, guardar_duplicados
+from .estadisticas import actualizar_resumenes as consolidar_resumenes
+from .exportacion_pdf import fichas_para_exportar, generar_zip
+from .importacion import escribir_reporte_errores, importar_pacientes as importar_csv_pacientes
+from .models import Notificacion, Paciente
+from .scheduler import enviar_notificaciones_programadas as enviar_avisos_reservas
+
+logger = logging.getLogger(__name__)
+
+
+def _archivos_exportacion(exportacion_id, **argumentos):
+    return [os.path.join(settings.EXPORTACIONES_DIR, f"{exportacion_id}.zip")]
+
+
+def _archivos_importacion(ruta, **argumentos):
+    return [ruta, f"{ruta}.errores.csv"]
+
+
+@tarea('exportar_fichas_pdf', max_intentos=2, archivos=_archivos_exportacion)
+@leer_de_replica()
+def exportar_fichas_pdf(exportacion_id, rut=None, desde=None, hasta=None):
+    """
+    Genera en ``EXPORTACIONES_DIR`` el ZIP de fichas de ``exportar_fichas_pdf``
+    (la vista), informando el avance en la tarea.
+    """
+    paciente = Paciente.objects.get(rut=rut) if rut else None
+    fichas = fichas_para_exportar(
+        paciente=paciente,
+        desde=date.fromisoformat(desde) if desde else None,
+        hasta=date.fromisoformat(hasta) if hasta else None,
+    )
+    total = fichas.count()
+    paso = max(total // 100, 1)
+    reportar_progreso(hechas=0, total=total)
+
+    def progreso(hechas, total):
+        if hechas % paso == 0:
+            reportar_progreso(hechas=hechas, total=total)
+
+    os.makedirs(settings.EXPORTACIONES_DIR, exist_ok=True)
+    ruta, = _archivos_exportacion(exportacion_id)
+    with open(ruta, 'wb') as salida:
+        for bloque in generar_zip(fichas, total=total, progreso=progreso):
+            salida.write(bloque)
+    return {'hechas': total, 'total': total, 'archivo': ruta}
+
+
+@tarea('importar_pacientes', max_intentos=1, archivos=_archivos_importacion)
+def importar_pacientes(ruta, actualizar=True):
+    """
+    Importa el CSV subido en ``ruta`` y deja junto a él el reporte de errores.
+    Es idempotente: reimportar el mismo archivo no duplica pacientes.
+    """
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        try:
+            resultado = importar_csv_pacientes(archivo, actualizar=actualizar)
+        except ValidationError as e:
+            # Con el mensaje legible en el error de la tarea, que muestra estado_importacion_pacientes.
+            raise ValueError(' '.join(e.messages)) from e
+    _, reporte = _archivos_importacion(ruta)
+    with open(reporte, 'w', newline='', encoding='utf-8') as destino:
+        escribir_reporte_errores(resultado, destino)
+    return {**resultado.como_dict(), 'reporte': reporte}
+
+
+@tarea('detectar_duplicados', max_intentos=1)
+def detectar_duplicados(umbral=UMBRAL):
+    """Recalcula la lista de posibles pacientes duplicados."""
+    with leer_de_replica():
+        pares = detectar_pares_duplicados(umbral=umbral)
+    guardar_duplicados(pares)
+    return {'pares': len(pares)}
+
+
+@tarea('actualizar_resumenes', max_intentos=3)
+@leer_de_replica()  # Solo las lecturas; los resúmenes se escriben en el primario.
+def actualizar_resumenes():
+    """Consolidación nocturna de los resúmenes diarios de utilización."""
+    return {'filas': consolidar_resumenes()}
+
+
+@tarea('archivar_disponibilidades', max_intentos=3)
+def archivar_disponibilidades():
+    """Limpieza nocturna de cupos vencidos, archivo de las reservas antiguas y purga de tareas terminadas."""
+    return {**archivar_cupos(), 'tareas_purgadas': purgar_tareas_terminadas()}
+
+
+@tarea('enviar_notificaciones_programadas', max_intentos=2)
+def enviar_notificaciones_programadas(momento):
+    """
+    Avisos a los médicos de las reservas que empiezan en ``momento`` (ISO) o
+    en 5 minutos. Se descarta si llega con más de
+    ``NOTIFICACIONES_ATRASO_MAXIMO_SEGUNDOS`` de atraso: el aviso ya no sirve.
+    """
+    programada = datetime.fromisoformat(momento)
+    atraso = (now() - programada).total_seconds()
+    if atraso > settings.NOTIFICACIONES_ATRASO_MAXIMO_SEGUNDOS:
+        logger.warning(f"Avisos programados para {momento} descartados ({atraso:.0f} s de atraso).")
+        return {'descartada': True}
+    enviar_avisos_reservas(programada)
+    return {'descartada': False}
+
+
+@tarea('notificar_usuarios', max_intentos=3)
+def notificar_usuarios(usuarios, mensaje):
+    """Crea la misma notificación para cada usuario de ``usuarios`` (IDs)."""
+    Notificacion.objects.bulk_create([Notificacion(usuario_id=usuario, mensaje=mensaje) for usuario in usuarios])
+    return {'notificaciones': len(usuarios)}
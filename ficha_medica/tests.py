@@ -1,3 +1,415 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import get_default_timezone, make_aware, now
+
+from core.actividad import vaciar
+from core.metricas import _resumen
+from ficha_medica import lista_espera
+from ficha_medica.calendario import disponibilidad_mensual_cacheada
+from ficha_medica.archivo import archivar_disponibilidades
+from ficha_medica.cola import (
+    _espera_reintento, ejecutar_tarea, encolar, purgar_tareas_terminadas, reclamar_tarea,
+    recuperar_tareas_abandonadas, tarea,
+)
+from ficha_medica.duplicados import detectar_duplicados, fusionar, fusionar_pares
+from ficha_medica.estadisticas import actualizar_resumenes
+from ficha_medica.exportacion import consulta_exportacion, generar_exportacion
+from ficha_medica.importacion import importar_pacientes
+from ficha_medica.linea_tiempo import linea_tiempo
+from ficha_medica.models import (
+    Disponibilidad, Especialidad, FichaMedica, ListaEspera, Medico, Paciente, Recepcionista, Reserva, ReservaHistorica,
+    ResumenDiario, Tarea,
+)
+
+
+def _medico(username='11111111-1'):
+    especialidad, _ = Especialidad.objects.get_or_create(nombre='Medicina general')
+    return Medico.objects.create(user=User.objects.create(username=username), especialidad=especialidad)
+
+
+@tarea('prueba_correcta', max_intentos=3)
+def tarea_correcta(valor):
+    return {'valor': valor}
+
+
+@tarea('prueba_con_error', max_intentos=2)
+def tarea_con_error():
+    raise RuntimeError("falla de prueba")
+
+
+@tarea('prueba_con_archivo', archivos=lambda ruta: [ruta, f"{ruta}.extra"])
+def tarea_con_archivo(ruta):
+    return {}
+
+
+@override_settings(TAREAS_REINTENTO_BASE_SEGUNDOS=10, TAREAS_REINTENTO_MAX_SEGUNDOS=600, TAREAS_TIMEOUT_SEGUNDOS=3600)
+class ColaTareasTests(TestCase):
+    def test_reclama_y_ejecuta(self):
+        encolada = encolar('prueba_correcta', valor=7)
+        reclamada = reclamar_tarea('trabajador-a')
+        self.assertEqual(reclamada.id, encolada.id)
+        self.assertEqual((reclamada.estado, reclamada.trabajador, reclamada.intentos), (Tarea.EN_CURSO, 'trabajador-a', 1))
+
+        ejecutar_tarea(reclamada)
+        reclamada.refresh_from_db()
+        self.assertEqual(reclamada.estado, Tarea.COMPLETADA)
+        self.assertEqual(reclamada.resultado, {'valor': 7})
+        self.assertIsNotNone(reclamada.espera_ms)
+        self.assertIsNone(reclamar_tarea('trabajador-a'))
+
+    def test_dos_trabajadores_no_reclaman_la_misma_tarea(self):
+        encolada = encolar('prueba_correcta', valor=1)
+        update_original = QuerySet.update
+        reclamadas_por_a = []
+
+        def update_con_carrera(consulta, **cambios):
+            # El trabajador A reclama entre la lectura de candidatas y el UPDATE de B.
+            if not reclamadas_por_a:
+                reclamadas_por_a.append(None)
+                reclamadas_por_a[0] = reclamar_tarea('trabajador-a')
+            return update_original(consulta, **cambios)
+
+        with mock.patch.object(QuerySet, 'update', update_con_carrera):
+            reclamada_por_b = reclamar_tarea('trabajador-b')
+
+        self.assertEqual(reclamadas_por_a[0].id, encolada.id)
+        self.assertIsNone(reclamada_por_b)
+        encolada.refresh_from_db()
+        self.assertEqual((encolada.trabajador, encolada.intentos), ('trabajador-a', 1))
+
+    def test_reintento_con_espera_creciente(self):
+        encolada = encolar('prueba_con_error')
+        antes = now()
+        ejecutar_tarea(reclamar_tarea('trabajador-a'))
+        encolada.refresh_from_db()
+        self.assertEqual(encolada.estado, Tarea.PENDIENTE)
+        self.assertIn("falla de prueba", encolada.error)
+        espera = (encolada.ejecutar_despues - antes).total_seconds()
+        self.assertTrue(8 <= espera <= 12.5, espera)
+        self.assertIsNone(reclamar_tarea('trabajador-a'))  # Aún no le toca
+
+        Tarea.objects.filter(id=encolada.id).update(ejecutar_despues=now())
+        ejecutar_tarea(reclamar_tarea('trabajador-a'))
+        encolada.refresh_from_db()
+        self.assertEqual((encolada.estado, encolada.intentos), (Tarea.FALLIDA, 2))
+        self.assertIsNotNone(encolada.terminada)
+
+    def test_registra_metricas_de_la_ejecucion(self):
+        etiquetas = (('tarea', 'prueba_con_error'),)
+        antes = _resumen().get(('tarea_cola_errores_total', etiquetas), 0)
+        encolar('prueba_con_error')
+        ejecutar_tarea(reclamar_tarea('trabajador-a'))
+        resumen = _resumen()
+        self.assertEqual(resumen[('tarea_cola_errores_total', etiquetas)], antes + 1)
+        self.assertGreaterEqual(resumen[('tarea_cola_segundos', etiquetas)][-1], 1)
+
+    def test_espera_de_reintento_acotada(self):
+        self.assertTrue(16 <= _espera_reintento(2) <= 24)
+        self.assertTrue(_espera_reintento(20) <= 600 * 1.2)
+
+    def test_recupera_tareas_abandonadas(self):
+        reintentable = encolar('prueba_correcta', valor=1)
+        agotada = encolar('prueba_con_error')
+        for trabajador in ('trabajador-a', 'trabajador-b'):
+            reclamar_tarea(trabajador)
+        Tarea.objects.filter(id=agotada.id).update(intentos=2)
+        Tarea.objects.update(iniciada=now() - timedelta(hours=2), latido=now() - timedelta(hours=2))
+
+        self.assertEqual(recuperar_tareas_abandonadas(), 1)
+        reintentable.refresh_from_db()
+        agotada.refresh_from_db()
+        self.assertEqual(reintentable.estado, Tarea.PENDIENTE)
+        self.assertEqual(agotada.estado, Tarea.FALLIDA)
+        self.assertEqual(reclamar_tarea('trabajador-c').id, reintentable.id)
+
+    def test_no_recupera_tareas_en_curso_recientes(self):
+        encolar('prueba_correcta', valor=1)
+        reclamar_tarea('trabajador-a')
+        self.assertEqual(recuperar_tareas_abandonadas(), 0)
+        self.assertEqual(Tarea.objects.get().estado, Tarea.EN_CURSO)
+
+    def test_no_recupera_tareas_largas_con_latido(self):
+        encolar('prueba_correcta', valor=1)
+        reclamar_tarea('trabajador-a')
+        Tarea.objects.update(iniciada=now() - timedelta(hours=2), latido=now() - timedelta(seconds=30))
+        self.assertEqual(recuperar_tareas_abandonadas(), 0)
+        self.assertEqual(Tarea.objects.get().estado, Tarea.EN_CURSO)
+
+    def test_descarta_resultado_de_intento_recuperado(self):
+        encolada = encolar('prueba_correcta', valor=1)
+        primera = reclamar_tarea('trabajador-a')
+        Tarea.objects.update(estado=Tarea.PENDIENTE)  # Dada por abandonada
+        reclamar_tarea('trabajador-b')
+        ejecutar_tarea(primera)
+        encolada.refresh_from_db()
+        self.assertEqual((encolada.estado, encolada.trabajador, encolada.intentos), (Tarea.EN_CURSO, 'trabajador-b', 2))
+
+    def test_purga_solo_tareas_terminadas_antiguas(self):
+        antigua = encolar('prueba_correcta', valor=1)
+        reciente = encolar('prueba_correcta', valor=2)
+        pendiente = encolar('prueba_correcta', valor=3)
+        Tarea.objects.filter(id=antigua.id).update(estado=Tarea.COMPLETADA, terminada=now() - timedelta(days=8))
+        Tarea.objects.filter(id=reciente.id).update(estado=Tarea.FALLIDA, terminada=now() - timedelta(days=1))
+        Tarea.objects.filter(id=pendiente.id).update(creada=now() - timedelta(days=30))
+
+        self.assertEqual(purgar_tareas_terminadas(dias=7), 1)
+        self.assertEqual(set(Tarea.objects.values_list('id', flat=True)), {reciente.id, pendiente.id})
+
+    def test_purga_elimina_los_archivos_de_la_tarea(self):
+        directorio = tempfile.mkdtemp()
+        rutas = [os.path.join(directorio, nombre) for nombre in ('antigua.csv', 'reciente.csv')]
+        for ruta in rutas:
+            open(ruta, 'w').close()
+        for ruta, dias in zip(rutas, (8, 1)):
+            tarea_archivo = encolar('prueba_con_archivo', ruta=ruta)
+            Tarea.objects.filter(id=tarea_archivo.id).update(estado=Tarea.FALLIDA, terminada=now() - timedelta(days=dias))
+
+        self.assertEqual(purgar_tareas_terminadas(dias=7), 1)  # El .extra de la antigua no existe: se ignora
+        self.assertEqual([os.path.exists(ruta) for ruta in rutas], [False, True])
+
+
+class CalendarioTests(TestCase):
+    def setUp(self):
+        self.medico = _medico()
+        self.zona = get_default_timezone()
+
+    def _momento(self, dia, hora):
+        return make_aware(datetime(2030, 5, dia, hora), self.zona)
+
+    def _leer_en(self, momento):
+        with mock.patch('ficha_medica.calendario.now', return_value=momento), \
+                mock.patch('ficha_medica.calendario.localdate', return_value=momento.date()):
+            return {dia['fecha']: dia['libres'] for dia in disponibilidad_mensual_cacheada(2030, 5)}
+
+    def test_cupos_pasados_se_descuentan_al_leer_la_cache(self):
+        for dia, hora in ((9, 10), (10, 10), (10, 15), (11, 10)):
+            Disponibilidad.objects.create(medico=self.medico, fecha_disponible=self._momento(dia, hora))
+
+        self.assertEqual(self._leer_en(self._momento(10, 9)), {'2030-05-09': 0, '2030-05-10': 2, '2030-05-11': 1})
+        # La segunda lectura usa el conteo cacheado, pero el cupo de las 10:00 ya pasó
+        self.assertEqual(self._leer_en(self._momento(10, 12)), {'2030-05-09': 0, '2030-05-10': 1, '2030-05-11': 1})
+
+
+class ResumenesTests(TestCase):
+    def test_cupo_a_medianoche_queda_fuera_del_bloque(self):
+        medico = _medico()
+        zona = get_default_timezone()
+        for momento in (datetime(2030, 5, 1, 10), datetime(2030, 5, 3, 0)):
+            Disponibilidad.objects.create(medico=medico, fecha_disponible=make_aware(momento, zona))
+
+        self.assertEqual(actualizar_resumenes(desde=date(2030, 5, 1), hasta=date(2030, 5, 2)), 1)
+        self.assertEqual(list(ResumenDiario.objects.values_list('dia', 'cupos')), [(date(2030, 5, 1), 1)])
+
+
+class ListaEsperaTests(TestCase):
+    def setUp(self):
+        medico = _medico()
+        self.cupo = Disponibilidad.objects.create(medico=medico, fecha_disponible=now() + timedelta(days=2))
+        self.esperas = [
+            ListaEspera.objects.create(
+                paciente=Paciente.objects.create(rut=rut, nombre='Paciente'), especialidad=medico.especialidad,
+                desde=now(), hasta=now() + timedelta(days=7), motivo='Control',
+            )
+            for rut in ('12345678-5', '11222333-9')
+        ]
+        self.oferta = lista_espera.ofrecer_cupo(self.cupo.id)
+
+    def _recargar(self):
+        self.cupo.refresh_from_db()
+        return [ListaEspera.objects.get(id=espera.id) for espera in self.esperas]
+
+    def test_retiene_el_cupo_y_acepta_la_oferta(self):
+        self.assertEqual(self.oferta.id, self.esperas[0].id)
+        self.assertEqual(self._recargar()[0].estado, ListaEspera.OFRECIDA)
+        self.assertTrue(self.cupo.ocupada)
+
+        reserva = lista_espera.aceptar_oferta(self.oferta)
+        self.assertEqual((reserva.fecha_reserva_id, reserva.paciente_id), (self.cupo.id, self.oferta.paciente_id))
+        self.assertEqual(self._recargar()[0].estado, ListaEspera.ASIGNADA)
+
+    def test_rechazo_ofrece_el_cupo_a_la_siguiente(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lista_espera.rechazar_oferta(self.oferta)
+        primera, segunda = self._recargar()
+        self.assertEqual(primera.estado, ListaEspera.ESPERANDO)
+        self.assertEqual((segunda.estado, segunda.disponibilidad_id), (ListaEspera.OFRECIDA, self.cupo.id))
+        self.assertTrue(self.cupo.ocupada)
+
+    def test_no_acepta_una_oferta_vencida(self):
+        ListaEspera.objects.filter(id=self.oferta.id).update(oferta_expira=now() - timedelta(minutes=1))
+        with self.assertRaises(ValueError):
+            lista_espera.aceptar_oferta(self.oferta)
+        self.assertFalse(Reserva.objects.exists())
+
+        lista_espera.expirar_ofertas()
+        self.assertEqual(self._recargar()[0].estado, ListaEspera.ESPERANDO)
+        self.assertFalse(self.cupo.ocupada)
+
+    def test_no_libera_una_oferta_aceptada_mientras_expiraba(self):
+        ListaEspera.objects.filter(id=self.oferta.id).update(oferta_expira=now() - timedelta(minutes=1))
+        liberar_original = lista_espera._liberar
+
+        def liberar_con_carrera(espera, estado, **condiciones):
+            # La recepción acepta la oferta entre la lectura de vencidas y su liberación.
+            ListaEspera.objects.filter(id=espera.id).update(estado=ListaEspera.ASIGNADA)
+            return liberar_original(espera, estado, **condiciones)
+
+        with mock.patch.object(lista_espera, '_liberar', liberar_con_carrera), \
+                self.captureOnCommitCallbacks() as callbacks:
+            lista_espera.expirar_ofertas()
+        self.assertEqual(callbacks, [])  # El cupo no se ofrece a nadie más
+        self.assertEqual(self._recargar()[0].estado, ListaEspera.ASIGNADA)
+        self.assertTrue(self.cupo.ocupada)
+
+    def test_fusion_de_duplicados_conserva_la_oferta(self):
+        principal = Paciente.objects.create(rut='12345687-5', nombre='Paciente')
+        fusionar([[principal, self.oferta.paciente]])
+
+        oferta = self._recargar()[0]
+        self.assertEqual((oferta.paciente_id, oferta.estado), (principal.id, ListaEspera.OFRECIDA))
+        self.assertEqual(lista_espera.aceptar_oferta(oferta).paciente_id, principal.id)
+
+    def test_no_rechaza_una_oferta_ya_aceptada(self):
+        lista_espera.aceptar_oferta(ListaEspera.objects.get(id=self.oferta.id))
+        with self.assertRaises(ValueError):
+            lista_espera.rechazar_oferta(self.oferta)  # Copia leída antes de aceptar
+        self.cupo.refresh_from_db()
+        self.assertTrue(self.cupo.ocupada)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+
+class DuplicadosTests(TestCase):
+    def test_homonimos_con_rut_distinto_no_son_duplicados(self):
+        # Mismo nombre y teléfono (familiares), RUT sin relación y sin fecha de nacimiento.
+        Paciente.objects.create(rut='12345678-5', nombre='María González', telefono='912345678')
+        Paciente.objects.create(rut='18765432-7', nombre='María González', telefono='912345678')
+        self.assertEqual(detectar_duplicados(), {})
+
+    def test_rut_mal_tipeado_es_duplicado(self):
+        principal = Paciente.objects.create(rut='12345678-5', nombre='José Núñez')
+        duplicado = Paciente.objects.create(rut='12345687-5', nombre='Jose Nunes')
+        self.assertEqual(list(detectar_duplicados()), [(principal.id, duplicado.id)])
+
+    def test_fusion_reasigna_fichas_y_reservas(self):
+        medico = _medico()
+        principal = Paciente.objects.create(rut='12345678-5', nombre='José Núñez')
+        duplicado = Paciente.objects.create(rut='12345687-5', nombre='Jose Nunes', telefono='912345678')
+        FichaMedica.objects.create(paciente=duplicado, medico=medico, diagnostico='Control')
+        cupo = Disponibilidad.objects.create(medico=medico, fecha_disponible=now() + timedelta(days=1), ocupada=True)
+        Reserva.objects.create(
+            paciente=duplicado, especialidad=medico.especialidad, medico=medico, fecha_reserva=cupo, motivo='Control',
+        )
+
+        resultado = fusionar_pares([(principal.id, duplicado.id)])
+        self.assertEqual(resultado, {'fichas': 1, 'reservas': 1, 'eliminados': 1})
+        self.assertFalse(Paciente.objects.filter(id=duplicado.id).exists())
+        principal.refresh_from_db()
+        self.assertEqual(principal.telefono, '912345678')
+        self.assertEqual((principal.fichas.count(), Reserva.objects.get().paciente_id), (1, principal.id))
+
+
+class ExportacionPdfTests(TestCase):
+    def setUp(self):
+        # La actividad se guarda dentro de la transacción del test y no al salir del proceso.
+        self.addCleanup(vaciar)
+
+    def test_el_identificador_de_exportacion_lo_genera_el_servidor(self):
+        medico = _medico()
+        self.client.force_login(medico.user)
+        paciente = Paciente.objects.create(rut='12345678-5', nombre='Paciente')
+        ajeno = 'a' * 32
+
+        respuesta = self.client.get(reverse('exportar_fichas_pdf'), {'rut': paciente.rut, 'exportacion': ajeno})
+        self.assertEqual(respuesta.status_code, 202)
+        exportacion_id = respuesta['X-Exportacion-Id']
+        self.assertNotEqual(exportacion_id, ajeno)
+        self.assertEqual(Tarea.objects.get().argumentos['exportacion_id'], exportacion_id)
+
+
+class ArchivoTests(TestCase):
+    def setUp(self):
+        self.medico = _medico()
+        self.paciente = Paciente.objects.create(rut='12345678-5', nombre='Paciente')
+        for dias, motivo in ((-400, 'Antigua'), (3, 'Próxima')):
+            cupo = Disponibilidad.objects.create(
+                medico=self.medico, fecha_disponible=now() + timedelta(days=dias), ocupada=True,
+            )
+            Reserva.objects.create(
+                paciente=self.paciente, especialidad=self.medico.especialidad, medico=self.medico,
+                fecha_reserva=cupo, motivo=motivo,
+            )
+        ResumenDiario.objects.create(
+            dia=now().date() - timedelta(days=1), medico=self.medico, especialidad=self.medico.especialidad,
+        )
+        self.assertEqual(archivar_disponibilidades()['reservas_archivadas'], 1)
+
+    def test_linea_tiempo_incluye_reservas_archivadas(self):
+        self.assertEqual(ReservaHistorica.objects.get().motivo, 'Antigua')
+        with self.assertNumQueries(4):
+            datos = linea_tiempo(self.paciente.id)
+        self.assertEqual([evento['motivo'] for evento in datos['eventos']], ['Próxima', 'Antigua'])
+        self.assertEqual((datos['conteos']['reservas'], datos['conteos']['reservas_futuras']), (2, 1))
+        self.assertEqual(datos['medicos'][0]['reservas'], 2)
+
+        pagina = linea_tiempo(self.paciente.id, limite=1)
+        siguiente = linea_tiempo(self.paciente.id, cursor=pagina['siguiente'], limite=1)
+        self.assertEqual([evento['motivo'] for evento in siguiente['eventos']], ['Antigua'])
+
+    def test_exportacion_incluye_reservas_archivadas(self):
+        csv = b''.join(generar_exportacion('reservas', consulta_exportacion('reservas'))).decode()
+        self.assertEqual([linea.split(',')[-1] for linea in csv.splitlines()[1:]], ['Antigua', 'Próxima'])
+        pacientes = consulta_exportacion('pacientes', hasta=(now() - timedelta(days=300)).date())
+        self.assertEqual(list(pacientes), [self.paciente])
+
+
+class ImportacionTests(TestCase):
+    def test_rut_con_k_minuscula_no_se_duplica(self):
+        existente = Paciente.objects.create(rut='12345670-k', nombre='Ana Rojas')
+        archivo = "rut,nombre,telefono\n12.345.670-K,Ana Rojas,912345678\n"
+
+        resultado = importar_pacientes(io.StringIO(archivo))
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.errores), (0, 1, []))
+        existente.refresh_from_db()
+        self.assertEqual(existente.telefono, '912345678')
+        self.assertEqual(importar_pacientes(io.StringIO(archivo)).sin_cambios, 1)
+        self.assertEqual(Paciente.objects.count(), 1)
+
+    def test_estado_informa_el_error_de_una_importacion_fallida(self):
+        recepcionista = Recepcionista.objects.create(user=User.objects.create(username='22222222-2'))
+        self.client.force_login(recepcionista.user)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as archivo:
+            archivo.write("nombre\nAna Rojas\n")
+        self.addCleanup(os.remove, archivo.name)
+        encolada = encolar('importar_pacientes', ruta=archivo.name)
+        ejecutar_tarea(reclamar_tarea('trabajador-a'))
+
+        respuesta = self.client.get(reverse('estado_importacion_pacientes', args=[encolada.id])).json()
+        self.assertEqual(respuesta['estado'], Tarea.FALLIDA)
+        self.assertEqual(respuesta['error'], "El archivo debe tener un encabezado con las columnas 'rut' y 'nombre'.")
+
+
+class BusquedaPacientesTests(TestCase):
+    def setUp(self):
+        recepcionista = Recepcionista.objects.create(user=User.objects.create(username='22222222-2'))
+        self.client.force_login(recepcionista.user)
+        Paciente.objects.create(rut='12345678-5', nombre='Ana Rojas')
+        Paciente.objects.create(rut='9876543-3', nombre='Luis Soto')
+
+    def _buscar(self, rut):
+        respuesta = self.client.get(reverse('listar_pacientes'), {'rut': rut})
+        return [paciente.nombre for paciente in respuesta.context['pacientes']]
+
+    def test_busca_por_prefijo_del_rut(self):
+        self.assertEqual(self._buscar('12.345'), ['Ana Rojas'])
+
+    def test_sin_coincidencias_por_prefijo_busca_en_todo_el_rut(self):
+        self.assertEqual(self._buscar('5678'), ['Ana Rojas'])
+        self.assertEqual(self._buscar('0000'), [])
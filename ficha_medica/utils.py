@@ -1,16 +1,208 @@
 from django.http import HttpResponseForbidden
+from functools import wraps
 import re
+import unicodedata
+import uuid
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import ValidationError
 
 
+def tiene_rol(usuario, rol):
+    """
+    Si el usuario pertenece al grupo ``rol``. Sin consulta cuando el usuario
+    viene de la caché (``core.autenticacion``), que trae ``nombres_grupos``.
+    """
+    nombres = getattr(usuario, 'nombres_grupos', None)
+    if nombres is not None:
+        return rol in nombres
+    return usuario.groups.filter(name=rol).exists()
+
+
 def role_required(role_name):
     """
     Decorador para verificar que un usuario pertenece a un grupo específico.
     """
     def decorator(view_func):
         def _wrapped_view(request, *args, **kwargs):
-            if not request.user.groups.filter(name=role_name).exists():
+            if not tiene_rol(request.user, role_name):
                 return HttpResponseForbidden(f"No tienes acceso al rol requerido: {role_name}.")
             return view_func(request, *args, **kwargs)
         return _wrapped_view
     return decorator
+
+
+def alogin_required(vista):
+    """
+    ``login_required`` para vistas ``async``. El usuario de la sesión se carga
+    en un hilo (``request.user`` es perezoso y consulta la base); después ya
+    se puede usar desde la vista.
+    """
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await vista(request, *args, **kwargs)
+    return envoltura
+
+
+def arole_required(role_name):
+    """``role_required`` para vistas ``async`` (va después de ``alogin_required``)."""
+    def decorator(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            if getattr(request.user, 'nombres_grupos', None) is not None:
+                permitido = role_name in request.user.nombres_grupos
+            else:
+                permitido = await request.user.groups.filter(name=role_name).aexists()
+            if not permitido:
+                return HttpResponseForbidden(f"No tienes acceso al rol requerido: {role_name}.")
+            return await vista(request, *args, **kwargs)
+        return envoltura
+    return decorator
+
+
+def digito_verificador(cuerpo):
+    """
+    Calcula el dígito verificador (módulo 11) del cuerpo numérico de un RUT.
+    """
+    suma = 0
+    factor = 2
+    for digito in reversed(str(cuerpo)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    if resto == 11:
+        return '0'
+    if resto == 10:
+        return 'K'
+    return str(resto)
+
+
+def normalizar_rut(rut):
+    """
+    Normaliza un RUT al formato 12345678-9 (sin puntos, con guion y K
+    mayúscula) y verifica su dígito verificador. Acepta variantes como
+    "12.345.678-k" o "123456785".
+    """
+    limpio = re.sub(r'[\s.\-]', '', str(rut or '')).upper()
+    if not re.match(r'^\d{7,8}[\dK]$', limpio):
+        raise ValidationError("El RUT debe estar en el formato 12345678-9.")
+    cuerpo, dv = limpio[:-1], limpio[-1]
+    if digito_verificador(cuerpo) != dv:
+        raise ValidationError("El dígito verificador del RUT no es válido.")
+    return f"{cuerpo}-{dv}"
+
+
+def rut_a_digitos(rut):
+    """
+    RUT sin puntos ni guion y con K mayúscula ("12.345.678-k" -> "12345678K"),
+    usado como clave de búsqueda por prefijo.
+    """
+    return re.sub(r'[^\dK]', '', str(rut or '').upper())
+
+
+def normalizar_texto(texto):
+    """
+    Texto en minúsculas, sin acentos y con espacios simples, para búsquedas
+    que no distinguen mayúsculas ni tildes ("José  Núñez" -> "jose nunez").
+    """
+    descompuesto = unicodedata.normalize('NFKD', str(texto or ''))
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def rango_prefijo(campo, prefijo):
+    """
+    Filtro equivalente a ``campo__startswith=prefijo`` expresado como rango
+    (``>= prefijo`` y ``< siguiente``), que a diferencia de ``LIKE`` sí puede
+    recorrer un índice B-tree en SQLite.
+    """
+    from django.db.models import Q
+    siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    return Q(**{f'{campo}__gte': prefijo, f'{campo}__lt': siguiente})
+
+
+def trigramas(texto):
+    """
+    Conjunto de trigramas de cada palabra del texto normalizado, con el mismo
+    relleno que pg_trgm (dos espacios antes y uno después de cada palabra).
+    """
+    resultado = set()
+    for palabra in normalizar_texto(texto).split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+# Reglas de pronunciación del español aplicadas en orden (texto ya sin acentos).
+_REGLAS_FONETICAS = (
+    (r'ch', 'x'),
+    (r'll', 'y'),
+    (r'qu', 'k'),
+    (r'gu([ei])', r'G\1'),  # G: g suave, protegida de la regla siguiente
+    (r'g([ei])', r'j\1'),
+    (r'c([ei])', r's\1'),
+    (r'c', 'k'),
+    (r'z', 's'),
+    (r'v', 'b'),
+    (r'w', 'b'),
+    (r'h', ''),
+    (r'y$', 'i'),
+    (r'(.)\1+', r'\1'),
+)
+
+
+def clave_fonetica(texto, palabras=2):
+    """
+    Clave fonética aproximada de las primeras ``palabras`` del nombre, para
+    agrupar variantes que suenan igual ("José Núñez" y "Jose Nunes" -> "jose nunes").
+    """
+    codigos = []
+    for palabra in normalizar_texto(texto).split()[:palabras]:
+        palabra = re.sub(r'[^a-z]', '', palabra)
+        for patron, reemplazo in _REGLAS_FONETICAS:
+            palabra = re.sub(patron, reemplazo, palabra)
+        if palabra:
+            codigos.append(palabra.lower())
+    return ' '.join(codigos)
+
+
+def cache_compartida():
+    """
+    Caché común a todos los procesos del servidor (``CACHES['compartida']``).
+    Las entradas que se invalidan al escribir deben ir aquí: en la caché local
+    de un worker, los demás no verían la invalidación.
+    """
+    from django.core.cache import caches
+    return caches['compartida']
+
+
+def _clave_version(espacio, identificador):
+    return f"{espacio}:{identificador}:version"
+
+
+def version_cache(espacio, identificador):
+    """
+    Versión vigente de las entradas de caché de ``espacio`` (por ejemplo
+    ``'paciente'``) para ``identificador``. Se incluye en las claves para que
+    ``invalidar_cache`` descarte todas las entradas de una vez. Las versiones
+    y las entradas viven en ``cache_compartida``.
+    """
+    cache = cache_compartida()
+    clave = _clave_version(espacio, identificador)
+    version = cache.get(clave)
+    if version is None:
+        nueva = uuid.uuid4().hex
+        cache.add(clave, nueva, None)
+        version = cache.get(clave) or nueva
+    return version
+
+
+def invalidar_cache(espacio, *identificadores):
+    """
+    Invalida las entradas cacheadas de ``identificadores``. Basta con borrar
+    la versión: la siguiente lectura genera una nueva al azar que no coincide
+    con ninguna clave anterior.
+    """
+    cache_compartida().delete_many([_clave_version(espacio, identificador) for identificador in identificadores])
@@ -1,6 +1,7 @@
 
 from django.contrib.auth.decorators import user_passes_test
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login
@@ -9,33 +10,57 @@ from django.http import JsonResponse
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.http import HttpResponse
-
-from ficha_medica.utils import role_required
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, StreamingHttpResponse
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+
+from core.actividad import actividad_lectura, registrar_actividad
+from core.metricas import exposicion
+from core.replicas import lectura_replica
+from ficha_medica.utils import role_required, normalizar_rut, rango_prefijo, rut_a_digitos
+from ficha_medica.busqueda import buscar_fichas, buscar_pacientes, consulta_fts, ids_coincidentes, usa_fts
+from ficha_medica.pdf import datos_ficha, respuesta_pdf, ruta_pdf_cacheado
+from ficha_medica.exportacion_pdf import fichas_para_exportar
+from ficha_medica.agenda import agenda_del_dia
+from ficha_medica.calendario import disponibilidad_mensual_cacheada, invalidar_calendario
+from ficha_medica.cola import encolar
+from ficha_medica.estadisticas import (
+    AGRUPACIONES as AGRUPACIONES_REPORTE, PERIODOS as PERIODOS_REPORTE, reporte_utilizacion
+)
+from ficha_medica.linea_tiempo import LIMITE_MAXIMO as LIMITE_MAXIMO_LINEA_TIEMPO, CursorInvalido, linea_tiempo_cacheada
+from ficha_medica.lista_espera import aceptar_oferta, rechazar_oferta
+from ficha_medica.reprogramacion import (
+    DESTINOS as DESTINOS_REPROGRAMACION, PlanDesactualizado, aplicar_reprogramacion, planificar_reprogramacion
+)
+from ficha_medica.exportacion import (
+    FORMATOS, consulta_exportacion, generar_exportacion, nombre_archivo, tipo_contenido
+)
 from ficha_medica.forms import (
     FichaMedicaForm, DisponibilidadForm, ReservaForm,
     PacienteForm, MedicoForm, RecepcionistaForm
 )
 from .models import (
     FichaMedica, Paciente, Reserva, Disponibilidad,
-    Medico, Especialidad, Recepcionista, Notificacion
+    Medico, Especialidad, Recepcionista, Notificacion, Tarea, ListaEspera
 )
 
 from django.utils.timezone import make_aware, localtime, now
 from datetime import datetime, timedelta, date
 from django.contrib.auth.models import Group, User
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+import hashlib
 import json
 import logging
+import os
+import re
+import uuid
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
 
-
-
-
 def admin_or_superuser_required(view_func):
     """
     Decorador que permite acceso solo a administradores o superusuarios.
@@ -43,39 +68,201 @@ def admin_or_superuser_required(view_func):
     return user_passes_test(lambda u: u.is_active and (u.is_staff or u.is_superuser))(view_func)
 
 
+@login_required
+@role_required('Medico')
+@actividad_lectura("Descargó el PDF de la ficha {ficha_id}")
 def generar_ficha_pdf(request, ficha_id):
     # Obtener la ficha médica específica
-    ficha = FichaMedica.objects.get(id=ficha_id)
+    ficha = get_object_or_404(
+        FichaMedica.objects.select_related('paciente', 'medico__user'), id=ficha_id
+    )
+    ruta = ruta_pdf_cacheado(datos_ficha(ficha), settings.FICHA_PDF_CACHE_DIR)
+    return FileResponse(
+        open(ruta, 'rb'), as_attachment=True,
+        filename=f"ficha_medica_{ficha_id}.pdf", content_type='application/pdf'
+    )
+
+
+def _error_demasiadas_fichas():
+    return JsonResponse({
+        'error': f"El PDF admite como máximo {settings.PDF_MAX_FICHAS_DOCUMENTO} fichas. Use la exportación en ZIP."
+    }, status=400)
+
+
+@login_required
+@role_required('Medico')
+@actividad_lectura("Descargó el historial en PDF del paciente {paciente_rut}")
+def generar_historial_pdf(request, paciente_rut):
+    """
+    Historial completo de fichas de un paciente en un solo PDF paginado.
+    """
+    paciente = get_object_or_404(Paciente, rut=paciente_rut)
+    fichas = (
+        FichaMedica.objects.filter(paciente=paciente)
+        .select_related('paciente', 'medico__user')
+        .order_by('fecha_creacion')
+    )
+    if fichas.count() > settings.PDF_MAX_FICHAS_DOCUMENTO:
+        return _error_demasiadas_fichas()
+    return respuesta_pdf(
+        (datos_ficha(ficha) for ficha in fichas.iterator(chunk_size=200)),
+        f"historial_{paciente.rut}.pdf",
+        titulo=f"Historial de {paciente.nombre}",
+    )
+
+
+@login_required
+@role_required('Medico')
+@actividad_lectura("Exportó fichas médicas en PDF")
+def exportar_fichas_pdf(request):
+    """
+    Exportación masiva de fichas (de un paciente y/o un rango de fechas) como
+    un ZIP con un PDF por ficha, o como un único PDF con ``formato=pdf``.
+
+    El ZIP no se arma durante la respuesta: con miles de fichas ocuparía un
+    hilo web y un pool de procesos por varios minutos, y una desconexión del
+    cliente perdería el trabajo. Lo arma un trabajador de la cola
+    (``run_workers``), la vista responde de inmediato con la tarea y el
+    archivo terminado se descarga en streaming (``descargar_exportacion_pdf``).
+    El avance se consulta en ``estado_exportacion_pdf``, o en
+    ``progreso_exportacion_pdf`` con el identificador de la cabecera
+    ``X-Exportacion-Id``, que siempre genera el servidor. Ambos leen la
+    tarea, así que responden igual desde cualquier worker.
+    """
+    rut = request.GET.get('rut', '').strip()
+    formato = request.GET.get('formato', 'zip')
+    try:
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') else None
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') else None
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    if not rut and not (desde and hasta):
+        return JsonResponse({'error': 'Indique un RUT o un rango de fechas.'}, status=400)
+
+    paciente = get_object_or_404(Paciente, rut=rut) if rut else None
+    fichas = fichas_para_exportar(paciente=paciente, desde=desde, hasta=hasta)
+    nombre = f"fichas_{rut}" if rut else f"fichas_{desde:%Y%m%d}_{hasta:%Y%m%d}"
+
+    if formato == 'pdf':
+        if fichas.count() > settings.PDF_MAX_FICHAS_DOCUMENTO:
+            return _error_demasiadas_fichas()
+        return respuesta_pdf(
+            (datos_ficha(ficha) for ficha in fichas.iterator(chunk_size=200)),
+            f"{nombre}.pdf", titulo=f"Fichas médicas {rut}".strip(),
+        )
+
+    exportacion_id = uuid.uuid4().hex  # También nombra el archivo: nunca se toma del cliente
+    # Se genera en un trabajador de la cola, no en el worker web.
+    tarea = encolar(
+        'exportar_fichas_pdf', exportacion_id=exportacion_id, rut=rut or None,
+        desde=desde.isoformat() if desde else None, hasta=hasta.isoformat() if hasta else None,
+    )
+    response = JsonResponse({
+        'tarea_id': tarea.id,
+        'exportacion_id': exportacion_id,
+        'estado_url': reverse('estado_exportacion_pdf', args=[tarea.id]),
+        'progreso_url': reverse('progreso_exportacion_pdf', args=[exportacion_id]),
+    }, status=202)
+    response['X-Exportacion-Id'] = exportacion_id
+    return response
+
 
-    # Configurar la respuesta HTTP para PDF
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="ficha_medica_{ficha_id}.pdf"'
+@login_required
+@role_required('Medico')
+def progreso_exportacion_pdf(request, exportacion_id):
+    tarea = Tarea.objects.filter(
+        nombre='exportar_fichas_pdf', argumentos__exportacion_id=exportacion_id
+    ).order_by('-id').first()
+    if tarea is None:
+        return JsonResponse({'error': 'Exportación no encontrada.'}, status=404)
+    progreso = tarea.resultado or {}
+    return JsonResponse({
+        'hechas': progreso.get('hechas', 0),
+        'total': progreso.get('total'),
+        'terminada': tarea.estado == Tarea.COMPLETADA,
+        'estado': tarea.estado,
+    })
 
-    # Crear el objeto canvas para generar el PDF
-    p = canvas.Canvas(response, pagesize=A4)
 
-    # Añadir contenido al PDF
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(200, 800, "Ficha Médica")
+@login_required
+@role_required('Medico')
+def estado_exportacion_pdf(request, tarea_id):
+    tarea = get_object_or_404(Tarea, id=tarea_id, nombre='exportar_fichas_pdf')
+    data = {
+        'estado': tarea.estado,
+        'intentos': tarea.intentos,
+        'progreso': {k: v for k, v in (tarea.resultado or {}).items() if k != 'archivo'},
+    }
+    if tarea.estado == Tarea.COMPLETADA:
+        data['descarga_url'] = reverse('descargar_exportacion_pdf', args=[tarea.id])
+    return JsonResponse(data)
 
-    p.setFont("Helvetica", 12)
-    p.drawString(100, 750, f"Paciente: {ficha.paciente.nombre}")
-    p.drawString(100, 730, f"RUT: {ficha.paciente.rut}")
-    p.drawString(100, 710, f"Edad: {ficha.paciente.edad if ficha.paciente.edad else 'No registrada'}")
-    p.drawString(100, 690, f"Diagnóstico: {ficha.diagnostico}")
-    p.drawString(100, 670, f"Tratamiento: {ficha.tratamiento}")
-    p.drawString(100, 650, f"Observaciones: {ficha.observaciones if ficha.observaciones else 'Ninguna'}")
-    p.drawString(100, 630, f"Fecha de Creación: {ficha.fecha_creacion.strftime('%d/%m/%Y')}")
 
-    p.setFont("Helvetica-Oblique", 10)  # Fuente corregida
-    p.drawString(100, 600, "Este documento fue generado automáticamente.")
+@login_required
+@role_required('Medico')
+@actividad_lectura("Descargó la exportación de fichas {tarea_id}")
+def descargar_exportacion_pdf(request, tarea_id):
+    tarea = get_object_or_404(Tarea, id=tarea_id, nombre='exportar_fichas_pdf', estado=Tarea.COMPLETADA)
+    ruta = tarea.resultado.get('archivo')
+    if not ruta or not os.path.exists(ruta):
+        return JsonResponse({'error': 'El archivo de la exportación ya no está disponible.'}, status=410)
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f"fichas_{tarea.id}.zip")
 
-    # Finalizar y cerrar el PDF
-    p.showPage()
-    p.save()
 
+def _respuesta_exportacion(request, modelo):
+    """
+    Respuesta en streaming con la exportación de ``modelo``. Parámetros GET:
+    ``formato`` (csv o jsonl), ``gzip``, ``desde``/``hasta`` (AAAA-MM-DD),
+    ``medico`` y ``especialidad`` (IDs).
+    """
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return JsonResponse({'error': 'Formato inválido. Use csv o jsonl.'}, status=400)
+    comprimir = request.GET.get('gzip') in ('1', 'true')
+    try:
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') else None
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') else None
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    medico_id = request.GET.get('medico', '')
+    especialidad_id = request.GET.get('especialidad', '')
+    if not (medico_id or '0').isdigit() or not (especialidad_id or '0').isdigit():
+        return JsonResponse({'error': 'Los IDs de médico y especialidad deben ser números válidos.'}, status=400)
+
+    consulta = consulta_exportacion(
+        modelo, desde=desde, hasta=hasta, medico_id=medico_id or None, especialidad_id=especialidad_id or None
+    )
+    response = StreamingHttpResponse(
+        generar_exportacion(modelo, consulta, formato=formato, comprimir=comprimir),
+        content_type=tipo_contenido(formato, comprimir),
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo(modelo, formato, comprimir)}"'
     return response
 
+
+@login_required
+@role_required('Recepcionista')
+@lectura_replica
+@actividad_lectura("Exportó las reservas")
+def exportar_reservas(request):
+    return _respuesta_exportacion(request, 'reservas')
+
+
+@login_required
+@role_required('Medico')
+@lectura_replica
+@actividad_lectura("Exportó las fichas médicas")
+def exportar_fichas(request):
+    return _respuesta_exportacion(request, 'fichas')
+
+
+@login_required
+@role_required('Recepcionista')
+@lectura_replica
+def exportar_pacientes(request):
+    return _respuesta_exportacion(request, 'pacientes')
+
+
 @login_required
 @admin_or_superuser_required
 def crear_recepcionista(request):
@@ -92,6 +279,7 @@ def crear_recepcionista(request):
 
     return render(request, 'recepcionistas/crear_recepcionista.html', {'form': form})
 
+
 @login_required
 def admin_dashboard(request):
     """
@@ -114,12 +302,14 @@ def admin_dashboard(request):
         'total_reservas': total_reservas,
     })
 
+
 @login_required
 @admin_or_superuser_required
 def listar_medicos(request):
     medicos = Medico.objects.select_related('user', 'especialidad').all()
     return render(request, 'core/listar_medicos.html', {'medicos': medicos})
 
+
 @login_required
 @admin_or_superuser_required
 def modificar_medico(request, medico_id):
@@ -147,8 +337,6 @@ def modificar_medico(request, medico_id):
     return render(request, 'core/modificar_medico.html', {'form': form, 'medico': medico})
 
 
-
-
 @login_required
 @admin_or_superuser_required
 def eliminar_medico(request, medico_id):
@@ -158,12 +346,14 @@ def eliminar_medico(request, medico_id):
     messages.success(request, "Médico eliminado exitosamente.")
     return redirect('listar_medicos')
 
+
 @login_required
 @admin_or_superuser_required
 def listar_recepcionistas(request):
     recepcionistas = Recepcionista.objects.select_related('user').all()
     return render(request, 'core/listar_recepcionistas.html', {'recepcionistas': recepcionistas})
 
+
 @login_required
 @admin_or_superuser_required
 def modificar_recepcionista(request, recepcionista_id):
@@ -194,7 +384,6 @@ def eliminar_recepcionista(request, recepcionista_id):
     return redirect('listar_recepcionistas')
 
 
-
 def home(request):
     """
     Página de inicio que maneja el inicio de sesión y redirección según roles.
@@ -223,20 +412,30 @@ def home(request):
     return render(request, 'core/home.html')
 
 
-
-
-
 @login_required
 @role_required('Medico')
+@lectura_replica
+@actividad_lectura("Listó las fichas médicas")
 def listar_fichas(request):
     fichas = FichaMedica.objects.all()
     rut_query = request.GET.get('rut', '').strip()
     fecha_query = request.GET.get('fecha', '').strip()
+    texto_query = request.GET.get('q', '').strip()
 
     # Filtrar por RUT
     if rut_query:
         fichas = fichas.filter(paciente__rut__icontains=rut_query)
 
+    # Filtrar por texto en diagnóstico, tratamiento y observaciones
+    if texto_query and consulta_fts(texto_query):
+        if usa_fts():
+            fichas = fichas.filter(id__in=ids_coincidentes(texto_query))
+        else:
+            fichas = fichas.filter(
+                Q(diagnostico__icontains=texto_query) | Q(tratamiento__icontains=texto_query)
+                | Q(observaciones__icontains=texto_query)
+            )
+
     # Filtrar por Fecha
     if fecha_query:
         fichas = fichas.filter(fecha_creacion__date=fecha_query)
@@ -250,8 +449,10 @@ def listar_fichas(request):
         'fichas': page_obj,
     })
 
+
 @login_required
 @role_required('Medico')
+@actividad_lectura("Consultó la ficha {ficha_id}")
 def modificar_ficha(request, ficha_id):
     ficha = get_object_or_404(FichaMedica, id=ficha_id)
 
@@ -259,6 +460,7 @@ def modificar_ficha(request, ficha_id):
         form = FichaMedicaForm(request.POST, instance=ficha)
         if form.is_valid():
             form.save()
+            registrar_actividad(request.user, f"Modificó la ficha {ficha.id}")
             # Agregar mensaje de éxito
             messages.success(request, "La ficha médica ha sido modificada exitosamente.")
             return redirect('listar_fichas_medicas')
@@ -278,37 +480,37 @@ def eliminar_ficha(request, ficha_id):
 
     if request.method == 'POST':
         ficha.delete()
+        registrar_actividad(request.user, f"Eliminó la ficha {ficha_id}")
         messages.success(request, "Ficha médica eliminada exitosamente.")
         return redirect('listar_fichas_medicas')  # Asegúrate de que 'listar_fichas' existe
     return render(request, 'fichas_medicas/listar_fichas.html', {'ficha': ficha})
 
+
 @login_required
 @role_required('Medico')
+@actividad_lectura("Consultó las fichas del paciente {paciente_rut}")
 def filtrar_fichas_por_paciente(request, paciente_rut):
     """
     Filtrar fichas médicas de un paciente por su RUT.
     """
-    fichas = FichaMedica.objects.filter(paciente__rut=paciente_rut)
+    fichas = FichaMedica.objects.filter(paciente__rut=paciente_rut).select_related('medico__user').order_by('-fecha_creacion')
     
     return render(request, 'fichas_medicas/filtrar_fichas.html', {
         'fichas': fichas,
         'paciente_rut': paciente_rut,
     })
 
+
 @login_required
 @role_required('Medico')
 def medico_dashboard(request):
     medico = request.user.medico
     hora_actual = localtime(now())  # Hora actual en la zona local
 
-    # Filtrar reservas de hoy y futuras
-    reservas_hoy = Reserva.objects.filter(
-        medico=medico,
-        fecha_reserva__fecha_disponible__date=hora_actual.date(),
-        fecha_reserva__fecha_disponible__gte=hora_actual - timedelta(minutes=5)  # Mostrar horas pasadas recientes
-    ).order_by('fecha_reserva__fecha_disponible')
+    # Reservas de hoy y futuras, desde la agenda precalculada (una sola consulta indexada)
+    reservas_hoy = agenda_del_dia(medico, hora_actual.date(), desde=hora_actual - timedelta(minutes=5))  # Mostrar horas pasadas recientes
 
-    logger.info(f"Reservas para hoy: {reservas_hoy.count()}")
+    logger.info(f"Reservas para hoy: {len(reservas_hoy)}")
 
     notificaciones = Notificacion.objects.filter(usuario=request.user, leido=False).order_by('-fecha_creacion')
 
@@ -331,32 +533,24 @@ def marcar_notificacion_leida(request, notificacion_id):
     return JsonResponse({"success": False, "message": "Método no permitido."}, status=405)
 
 
-
-
 @login_required
 @role_required('Medico')
 def obtener_notificaciones(request):
-    # Debug: imprimir el usuario actual
-    print(f"Usuario actual: {request.user}")
-
     # Filtra notificaciones no leídas para el usuario actual
     notificaciones = Notificacion.objects.filter(leido=False, usuario=request.user)
 
-    # Debug: Imprimir las notificaciones
-    print("Notificaciones encontradas:")
-    for n in notificaciones:
-        print(f"ID: {n.id}, Mensaje: {n.mensaje}, Fecha: {n.fecha_creacion}")
-
     # Devuelve las notificaciones en JSON
     data = [{"id": n.id, "mensaje": n.mensaje, "fecha_creacion": n.fecha_creacion} for n in notificaciones]
     return JsonResponse(data, safe=False)
 
+
 def modificar_disponibilidad(request):
     if request.method == "POST":
         id = request.POST.get('disponibilidad_id')
         fecha = request.POST.get('fecha')
         hora = request.POST.get('hora')
         disponibilidad = Disponibilidad.objects.get(id=id)
+        invalidar_calendario(disponibilidad.fecha_disponible)  # El mes anterior, si el cupo cambia de mes
         disponibilidad.fecha_disponible = f"{fecha} {hora}"
         disponibilidad.save()
         return redirect('gestionar_disponibilidades')
@@ -365,6 +559,7 @@ def modificar_disponibilidad(request):
 # Filtrar fichas médicas por paciente
 @login_required
 @role_required('Medico')
+@lectura_replica
 def filtrar_fichas_medicas(request):
     rut_query = request.GET.get('rut', '')  # Obtener el parámetro 'rut' de la URL
     fichas = FichaMedica.objects.all()
@@ -403,6 +598,7 @@ def crear_ficha_medica(request, reserva_id):
             ficha.medico = request.user.medico
             ficha.reserva = reserva  # Asignar la reserva al formulario
             ficha.save()
+            registrar_actividad(request.user, f"Creó la ficha {ficha.id} (reserva {reserva.id})")
             messages.success(request, "Ficha médica creada con éxito.")
             return redirect('medico_dashboard')
         else:
@@ -435,6 +631,7 @@ def crear_ficha_medica(request, reserva_id):
         'rut_medico': rut_medico,
     })
 
+
 @login_required
 @role_required('Medico')
 def gestionar_disponibilidades(request):
@@ -449,7 +646,7 @@ def gestionar_disponibilidades(request):
             disponibilidad.save()
             return redirect('gestionar_disponibilidades')  # Redirige después de guardar
         else:
-            print(form.errors)  # Depura errores del formulario
+            logger.debug(f"Disponibilidad no válida: {form.errors.as_json()}")
     else:
         form = DisponibilidadForm()
 
@@ -496,6 +693,7 @@ def crear_recepcionista(request):
         form = RecepcionistaForm()
     return render(request, 'core/crear_recepcionista.html', {'form': form})
 
+
 @login_required
 @role_required('Medico')
 def eliminar_disponibilidad(request, disponibilidad_id):
@@ -513,27 +711,46 @@ def recepcionista_dashboard(request):
     """
     return render(request, 'core/recepcionista.html') 
 
+
+def _pacientes_por_rut(rut_digitos):
+    """
+    Pacientes cuyo RUT contiene ``rut_digitos``. Se busca primero por prefijo
+    sobre la columna indexada ``rut_digitos``; solo si no hay ninguno se busca
+    en cualquier parte del RUT, con un ``LIKE '%...%'`` que recorre la tabla.
+    """
+    pacientes = Paciente.objects.filter(rango_prefijo('rut_digitos', rut_digitos))
+    if pacientes.exists():
+        return pacientes
+    return Paciente.objects.filter(rut_digitos__contains=rut_digitos)
+
+
 @login_required
 @role_required('Recepcionista')
+@lectura_replica
 def listar_pacientes(request):
     rut_query = request.GET.get('rut', '')
-    pacientes = Paciente.objects.filter(rut__icontains=rut_query).order_by('nombre') if rut_query else Paciente.objects.all().order_by('nombre')
+    rut_digitos = rut_a_digitos(rut_query)
+    pacientes = _pacientes_por_rut(rut_digitos).order_by('nombre') if rut_digitos else Paciente.objects.all().order_by('nombre')
     paginator = Paginator(pacientes, 5)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
     return render(request, 'pacientes/listar_pacientes.html', {'pacientes': page_obj, 'rut_query': rut_query})
 
+
 # Listar pacientes
 @login_required
 @role_required('Recepcionista')
+@lectura_replica
 def listar_pacientes(request):
     rut_query = request.GET.get('rut', '')
-    pacientes = Paciente.objects.filter(rut__icontains=rut_query).order_by('nombre') if rut_query else Paciente.objects.all().order_by('nombre')
+    rut_digitos = rut_a_digitos(rut_query)
+    pacientes = _pacientes_por_rut(rut_digitos).order_by('nombre') if rut_digitos else Paciente.objects.all().order_by('nombre')
     paginator = Paginator(pacientes, 5)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
     return render(request, 'pacientes/listar_pacientes.html', {'pacientes': page_obj, 'rut_query': rut_query})
 
+
 @login_required
 @role_required('Recepcionista')
 def recepcionista_dashboard(request):
@@ -550,6 +767,8 @@ def recepcionista_dashboard(request):
 # Listar reservas
 @login_required
 @role_required('Recepcionista')
+@lectura_replica
+@actividad_lectura("Listó las reservas")
 def listar_reservas(request):
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
@@ -582,6 +801,7 @@ def listar_reservas(request):
         'es_medico': es_medico,  # Pasar la verificación al template
     })
 
+
 @login_required
 @role_required('Recepcionista')
 def crear_paciente(request):
@@ -596,6 +816,55 @@ def crear_paciente(request):
     return render(request, 'pacientes/crear_paciente.html', {'form': form})
 
 
+@login_required
+@role_required('Recepcionista')
+def importar_pacientes(request):
+    """
+    Recibe un CSV de pacientes (campo ``archivo``) y encola su importación.
+    El avance y el resumen se consultan en ``estado_importacion_pacientes``.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    archivo = request.FILES.get('archivo')
+    if not archivo:
+        return JsonResponse({'error': 'Debe adjuntar un archivo CSV.'}, status=400)
+
+    os.makedirs(settings.EXPORTACIONES_DIR, exist_ok=True)
+    ruta = os.path.join(settings.EXPORTACIONES_DIR, f"importacion_{uuid.uuid4().hex}.csv")
+    with open(ruta, 'wb') as destino:
+        for bloque in archivo.chunks():
+            destino.write(bloque)
+    tarea = encolar('importar_pacientes', ruta=ruta, actualizar=request.POST.get('actualizar', '1') == '1')
+    return JsonResponse({
+        'tarea_id': tarea.id,
+        'estado_url': reverse('estado_importacion_pacientes', args=[tarea.id]),
+    }, status=202)
+
+
+@login_required
+@role_required('Recepcionista')
+def estado_importacion_pacientes(request, tarea_id):
+    tarea = get_object_or_404(Tarea, id=tarea_id, nombre='importar_pacientes')
+    data = {'estado': tarea.estado, 'resumen': None}
+    if tarea.estado == Tarea.COMPLETADA:
+        data['resumen'] = {k: v for k, v in tarea.resultado.items() if k != 'reporte'}
+        data['reporte_url'] = reverse('reporte_importacion_pacientes', args=[tarea.id])
+    elif tarea.estado == Tarea.FALLIDA:
+        # La última línea del traceback guardado es "Tipo: mensaje".
+        ultima = tarea.error.strip().splitlines()[-1] if tarea.error.strip() else ''
+        data['error'] = ultima.partition(': ')[2] or ultima or "La importación falló."
+    return JsonResponse(data)
+
+
+@login_required
+@role_required('Recepcionista')
+def reporte_importacion_pacientes(request, tarea_id):
+    tarea = get_object_or_404(Tarea, id=tarea_id, nombre='importar_pacientes', estado=Tarea.COMPLETADA)
+    ruta = tarea.resultado.get('reporte')
+    if not ruta or not os.path.exists(ruta):
+        return JsonResponse({'error': 'El reporte ya no está disponible.'}, status=410)
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f"errores_importacion_{tarea.id}.csv")
+
 
 @login_required
 @role_required('Recepcionista')
@@ -617,7 +886,6 @@ def modificar_paciente(request, paciente_id):
     return render(request, 'pacientes/modificar_paciente.html', {'paciente': paciente})
 
 
-
 @login_required
 @role_required('Recepcionista')
 def eliminar_paciente(request, paciente_id):
@@ -630,6 +898,7 @@ def eliminar_paciente(request, paciente_id):
 
     return redirect('listar_pacientes')  # Si no es POST, redirige igual
 
+
 @login_required
 @role_required('Recepcionista')
 def crear_reserva(request):
@@ -649,6 +918,7 @@ def crear_reserva(request):
             mensaje = f"Se ha registrado una nueva reserva para el paciente {reserva.paciente.nombre} para la fecha del {fecha_local.strftime('%d/%m/%Y %H:%M')}."
             Notificacion.objects.create(usuario=reserva.medico.user, mensaje=mensaje)
 
+            registrar_actividad(request.user, f"Creó la reserva {reserva.id}")
             messages.success(request, "Reserva creada exitosamente.")
             return redirect('listar_reservas')
         else:
@@ -661,6 +931,7 @@ def crear_reserva(request):
 
 @login_required
 @role_required('Recepcionista')
+@actividad_lectura("Consultó la reserva {reserva_id}")
 def modificar_reserva(request, reserva_id):
     reserva = get_object_or_404(Reserva, id=reserva_id)
     especialidades = Especialidad.objects.all()
@@ -696,25 +967,28 @@ def modificar_reserva(request, reserva_id):
                 'disponibilidades': disponibilidades
             })
 
-        # Liberar la disponibilidad anterior si se seleccionó una nueva
-        if reserva.fecha_reserva != nueva_disponibilidad:
-            reserva.fecha_reserva.ocupada = False
-            reserva.fecha_reserva.save()
-            nueva_disponibilidad.ocupada = True
-            nueva_disponibilidad.save()
-
-            # Crear notificación para el médico
-            fecha_local = localtime(nueva_disponibilidad.fecha_disponible)
-            mensaje = f"Se ha modificado la reserva para el paciente {reserva.paciente.nombre}. Nueva hora: {fecha_local.strftime('%d/%m/%Y %H:%M')}."
-            Notificacion.objects.create(usuario=medico.user, mensaje=mensaje)
-
-        # Actualizar los datos de la reserva
-        reserva.especialidad = especialidad
-        reserva.medico = medico
-        reserva.fecha_reserva = nueva_disponibilidad
-        reserva.motivo = request.POST.get('motivo', reserva.motivo)
-        reserva.save()
+        # En una transacción: el cupo liberado se ofrece a la lista de espera al confirmarse.
+        with transaction.atomic():
+            # Liberar la disponibilidad anterior si se seleccionó una nueva
+            if reserva.fecha_reserva != nueva_disponibilidad:
+                reserva.fecha_reserva.ocupada = False
+                reserva.fecha_reserva.save()
+                nueva_disponibilidad.ocupada = True
+                nueva_disponibilidad.save()
+
+                # Crear notificación para el médico
+                fecha_local = localtime(nueva_disponibilidad.fecha_disponible)
+                mensaje = f"Se ha modificado la reserva para el paciente {reserva.paciente.nombre}. Nueva hora: {fecha_local.strftime('%d/%m/%Y %H:%M')}."
+                Notificacion.objects.create(usuario=medico.user, mensaje=mensaje)
+
+            # Actualizar los datos de la reserva
+            reserva.especialidad = especialidad
+            reserva.medico = medico
+            reserva.fecha_reserva = nueva_disponibilidad
+            reserva.motivo = request.POST.get('motivo', reserva.motivo)
+            reserva.save()
 
+        registrar_actividad(request.user, f"Modificó la reserva {reserva.id}")
         messages.success(request, "Reserva modificada exitosamente.")
         return redirect('listar_reservas')  # Redireccionar después de guardar
 
@@ -727,32 +1001,30 @@ def modificar_reserva(request, reserva_id):
     })
 
 
-
 @login_required
 @role_required('Recepcionista')
 def eliminar_reserva(request, reserva_id):
     reserva = get_object_or_404(Reserva, id=reserva_id)
     if request.method == 'POST':
-        reserva.fecha_reserva.ocupada = False
-        reserva.fecha_reserva.save()
+        # En una transacción: el cupo liberado se ofrece a la lista de espera al confirmarse.
+        with transaction.atomic():
+            reserva.fecha_reserva.ocupada = False
+            reserva.fecha_reserva.save()
 
-        # Ajustar la fecha a hora local
-        fecha_local = localtime(reserva.fecha_reserva.fecha_disponible)
+            # Ajustar la fecha a hora local
+            fecha_local = localtime(reserva.fecha_reserva.fecha_disponible)
 
-        # Crear notificación
-        mensaje = f"Se ha eliminado la reserva para el paciente {reserva.paciente.nombre} programada para el {fecha_local.strftime('%d/%m/%Y %H:%M')}."
-        Notificacion.objects.create(usuario=reserva.medico.user, mensaje=mensaje)
+            # Crear notificación
+            mensaje = f"Se ha eliminado la reserva para el paciente {reserva.paciente.nombre} programada para el {fecha_local.strftime('%d/%m/%Y %H:%M')}."
+            Notificacion.objects.create(usuario=reserva.medico.user, mensaje=mensaje)
 
-        reserva.delete()
+            reserva.delete()
+        registrar_actividad(request.user, f"Eliminó la reserva {reserva_id}")
         return JsonResponse({"success": True})
     else:
         return JsonResponse({"error": "Método no permitido."}, status=405)
 
 
-
-
-
-
 def api_medicos(request):
     especialidad_id = request.GET.get('especialidad_id')
     if not especialidad_id:
@@ -772,7 +1044,6 @@ def api_medicos(request):
         return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
 
 
-
 def api_disponibilidades(request):
     medico_id = request.GET.get('medico_id')
     if not medico_id:
@@ -826,4 +1097,388 @@ def api_validar_rut(request):
         return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
 
 
-from django.http import JsonResponse
\ No newline at end of file
+MAX_RUTS_POR_CONSULTA = 1000
+
+
+@login_required
+def api_validar_ruts(request):
+    """
+    Valida una lista de RUTs en una sola petición.
+
+    Recibe por POST un JSON ``{"ruts": [...]}``. Cada RUT se normaliza
+    (puntos, guion, k minúscula), se verifica su dígito verificador y los
+    válidos se buscan todos juntos con una sola consulta ``rut IN (...)``.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    try:
+        ruts = json.loads(request.body).get('ruts')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON con la lista "ruts".'}, status=400)
+    if not isinstance(ruts, list) or not ruts:
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON con la lista "ruts".'}, status=400)
+    if len(ruts) > MAX_RUTS_POR_CONSULTA:
+        return JsonResponse({'error': f'Se admiten como máximo {MAX_RUTS_POR_CONSULTA} RUTs por consulta.'}, status=400)
+
+    resultados = []
+    for rut in ruts:
+        try:
+            resultados.append({'rut': rut, 'normalizado': normalizar_rut(rut), 'valido': True})
+        except ValidationError as e:
+            resultados.append({'rut': rut, 'normalizado': None, 'valido': False, 'error': e.messages[0]})
+
+    normalizados = {r['normalizado'] for r in resultados if r['valido']}
+    # Se incluye la variante con k minúscula por si fue guardada así.
+    buscados = normalizados | {rut.lower() for rut in normalizados if rut.endswith('K')}
+    pacientes = {
+        paciente.rut.upper(): paciente
+        for paciente in Paciente.objects.filter(rut__in=buscados).only('id', 'rut', 'nombre', 'fecha_nacimiento')
+    }
+    for resultado in resultados:
+        paciente = pacientes.get(resultado['normalizado'])
+        resultado['paciente'] = {
+            'id': paciente.id,
+            'nombre': paciente.nombre,
+            'edad': paciente.edad if paciente.fecha_nacimiento else 'No registrada',
+        } if paciente else None
+
+    return JsonResponse({'resultados': resultados})
+
+
+@login_required
+@role_required('Medico')
+def api_buscar_fichas(request):
+    """
+    Búsqueda de texto completo en las fichas, ordenada por relevancia.
+    Parámetros: ``q`` (admite prefijos como ``neumo*``), ``page`` y
+    ``propias=1`` para limitarse a las fichas del médico actual.
+    """
+    texto = request.GET.get('q', '').strip()
+    if not consulta_fts(texto):
+        return JsonResponse({'error': 'Se requiere un texto de búsqueda.'}, status=400)
+    pagina = request.GET.get('page', '1')
+    pagina = int(pagina) if pagina.isdigit() and int(pagina) > 0 else 1
+    por_pagina = 20
+    medico_id = request.user.medico.id if request.GET.get('propias') == '1' else None
+
+    resultados = buscar_fichas(texto, medico_id=medico_id, limite=por_pagina + 1, desplazamiento=(pagina - 1) * por_pagina)
+    data = [
+        {
+            'id': ficha.id,
+            'paciente': ficha.paciente.nombre,
+            'rut': ficha.paciente.rut,
+            'medico': f"{ficha.medico.user.first_name} {ficha.medico.user.last_name}" if ficha.medico else None,
+            'fecha_creacion': localtime(ficha.fecha_creacion).strftime('%d/%m/%Y %H:%M'),
+            'fragmentos': fragmentos,
+        }
+        for ficha, fragmentos in resultados[:por_pagina]
+    ]
+    return JsonResponse({'resultados': data, 'pagina': pagina, 'hay_mas': len(resultados) > por_pagina})
+
+
+@login_required
+@role_required('Recepcionista')
+def api_buscar_pacientes(request):
+    """
+    Búsqueda incremental de pacientes por prefijo de RUT o de nombre.
+    """
+    texto = request.GET.get('q', '').strip()
+    if not texto:
+        return JsonResponse({'error': 'Se requiere un texto de búsqueda.'}, status=400)
+    data = [
+        {'id': paciente.id, 'rut': paciente.rut, 'nombre': paciente.nombre}
+        for paciente in buscar_pacientes(texto)
+    ]
+    return JsonResponse(data, safe=False)
+
+
+@login_required
+@role_required('Medico')
+@actividad_lectura("Consultó la línea de tiempo del paciente {paciente_rut}")
+def api_linea_tiempo_paciente(request, paciente_rut):
+    """
+    Historial completo de un paciente: fichas y reservas ordenadas de la más
+    reciente a la más antigua, con conteos y médicos tratantes. Se pagina con
+    ``cursor`` (el valor ``siguiente`` de la respuesta anterior) y ``limite``.
+    """
+    paciente = get_object_or_404(Paciente.objects.only('id'), rut=paciente_rut)
+    limite = request.GET.get('limite', '20')
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_MAXIMO_LINEA_TIEMPO:
+        return JsonResponse({'error': f'El límite debe estar entre 1 y {LIMITE_MAXIMO_LINEA_TIEMPO}.'}, status=400)
+    try:
+        datos = linea_tiempo_cacheada(paciente.id, cursor=request.GET.get('cursor') or None, limite=int(limite))
+    except CursorInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(datos)
+
+
+@login_required
+@role_required('Medico')
+def api_agenda_medico(request):
+    """
+    Agenda del médico actual para ``fecha`` (AAAA-MM-DD, por defecto hoy).
+    Responde con un ETag y devuelve 304 si el cliente ya tiene esa versión.
+    """
+    fecha = request.GET.get('fecha')
+    if fecha:
+        try:
+            dia = datetime.strptime(fecha, '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    else:
+        dia = localtime(now()).date()
+
+    data = {
+        'fecha': dia.isoformat(),
+        'reservas': [
+            {
+                'reserva_id': entrada.reserva_id,
+                'hora': localtime(entrada.hora).strftime('%H:%M'),
+                'paciente': entrada.paciente_nombre,
+                'motivo': entrada.motivo,
+            }
+            for entrada in agenda_del_dia(request.user.medico, dia)
+        ],
+    }
+    contenido = json.dumps(data, ensure_ascii=False)
+    etag = f'"{hashlib.sha1(contenido.encode()).hexdigest()}"'
+    no_modificada = get_conditional_response(request, etag=etag)
+    if no_modificada is not None:
+        return no_modificada
+    respuesta = HttpResponse(contenido, content_type='application/json')
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+@login_required
+@role_required('Recepcionista')
+def api_calendario_disponibilidad(request):
+    """
+    Cupos libres y ocupados por día de un mes (``mes`` en formato AAAA-MM,
+    por defecto el actual), opcionalmente de un médico o una especialidad.
+    """
+    mes = request.GET.get('mes') or localtime(now()).strftime('%Y-%m')
+    try:
+        inicio_mes = datetime.strptime(mes, '%Y-%m')
+    except ValueError:
+        return JsonResponse({'error': 'Formato de mes inválido. Use el formato AAAA-MM.'}, status=400)
+    medico_id = request.GET.get('medico_id')
+    if medico_id and not medico_id.isdigit():
+        return JsonResponse({'error': 'El ID del médico debe ser un número válido.'}, status=400)
+    especialidad_id = request.GET.get('especialidad_id')
+    if especialidad_id and not especialidad_id.isdigit():
+        return JsonResponse({'error': 'El ID de la especialidad debe ser un número válido.'}, status=400)
+
+    dias = disponibilidad_mensual_cacheada(
+        inicio_mes.year, inicio_mes.month,
+        medico_id=int(medico_id) if medico_id else None,
+        especialidad_id=int(especialidad_id) if especialidad_id else None,
+    )
+    return JsonResponse({'mes': inicio_mes.strftime('%Y-%m'), 'dias': dias})
+
+
+@login_required
+@admin_or_superuser_required
+@lectura_replica
+def api_reporte_utilizacion(request):
+    """
+    Utilización por médico o especialidad (``agrupar``) y por semana o mes
+    (``periodo``) entre ``desde`` y ``hasta`` (por defecto, los últimos 90
+    días). Se calcula sobre los resúmenes diarios consolidados cada noche.
+    """
+    hoy = localtime(now()).date()
+    try:
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') else hoy - timedelta(days=90)
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') else hoy
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    periodo = request.GET.get('periodo', 'semana')
+    if periodo not in PERIODOS_REPORTE:
+        return JsonResponse({'error': f"Periodo no válido. Use uno de: {', '.join(PERIODOS_REPORTE)}."}, status=400)
+    agrupacion = request.GET.get('agrupar', 'medico')
+    if agrupacion not in AGRUPACIONES_REPORTE:
+        return JsonResponse({'error': f"Agrupación no válida. Use una de: {', '.join(AGRUPACIONES_REPORTE)}."}, status=400)
+
+    filas = reporte_utilizacion(desde, hasta, periodo=periodo, agrupacion=agrupacion)
+    return JsonResponse({'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'periodo': periodo, 'filas': filas})
+
+
+def _espera_a_dict(espera):
+    return {
+        'id': espera.id,
+        'paciente': {'rut': espera.paciente.rut, 'nombre': espera.paciente.nombre},
+        'especialidad': espera.especialidad.nombre,
+        'medico_id': espera.medico_id,
+        'desde': localtime(espera.desde).isoformat(),
+        'hasta': localtime(espera.hasta).isoformat(),
+        'motivo': espera.motivo,
+        'estado': espera.estado,
+        'creada': localtime(espera.creada).isoformat(),
+        'cupo_ofrecido': localtime(espera.disponibilidad.fecha_disponible).isoformat()
+        if espera.estado == ListaEspera.OFRECIDA and espera.disponibilidad else None,
+        'oferta_expira': localtime(espera.oferta_expira).isoformat() if espera.oferta_expira else None,
+    }
+
+
+@login_required
+@role_required('Recepcionista')
+def api_lista_espera(request):
+    """
+    GET: solicitudes en espera y con cupo ofrecido, en orden de llegada
+    (opcionalmente de una ``especialidad_id``).
+    POST: agrega un paciente a la lista. Recibe un JSON con ``rut``,
+    ``especialidad_id``, ``medico_id`` (opcional), ``desde`` y ``hasta``
+    (AAAA-MM-DD, ambos inclusive) y ``motivo``.
+    """
+    if request.method == 'GET':
+        esperas = ListaEspera.objects.filter(
+            estado__in=[ListaEspera.ESPERANDO, ListaEspera.OFRECIDA]
+        ).select_related('paciente', 'especialidad', 'disponibilidad').order_by('creada')
+        especialidad_id = request.GET.get('especialidad_id')
+        if especialidad_id:
+            if not especialidad_id.isdigit():
+                return JsonResponse({'error': 'El ID de la especialidad debe ser un número válido.'}, status=400)
+            esperas = esperas.filter(especialidad_id=especialidad_id)
+        return JsonResponse({'esperas': [_espera_a_dict(espera) for espera in esperas]})
+
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    try:
+        datos = json.loads(request.body)
+    except ValueError:
+        datos = None
+    if not isinstance(datos, dict):
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON válido.'}, status=400)
+    if not all(datos.get(campo) for campo in ('rut', 'especialidad_id', 'desde', 'hasta', 'motivo')):
+        return JsonResponse({'error': 'Los campos rut, especialidad_id, desde, hasta y motivo son obligatorios.'}, status=400)
+    try:
+        desde = make_aware(datetime.strptime(datos['desde'], '%Y-%m-%d'))
+        hasta = make_aware(datetime.strptime(datos['hasta'], '%Y-%m-%d') + timedelta(days=1)) - timedelta(microseconds=1)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    if hasta < max(desde, now()):
+        return JsonResponse({'error': 'La ventana de fechas debe terminar en el futuro y después de su inicio.'}, status=400)
+
+    try:
+        paciente = Paciente.objects.get(rut=normalizar_rut(datos['rut']))
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    except Paciente.DoesNotExist:
+        return JsonResponse({'error': 'Paciente no encontrado.'}, status=404)
+    especialidad = Especialidad.objects.filter(id=datos['especialidad_id']).first()
+    if especialidad is None:
+        return JsonResponse({'error': 'Especialidad no encontrada.'}, status=404)
+    medico = None
+    if datos.get('medico_id'):
+        medico = Medico.objects.filter(id=datos['medico_id'], especialidad=especialidad).first()
+        if medico is None:
+            return JsonResponse({'error': 'Médico no encontrado en la especialidad indicada.'}, status=404)
+
+    espera = ListaEspera.objects.create(
+        paciente=paciente, especialidad=especialidad, medico=medico,
+        desde=desde, hasta=hasta, motivo=datos['motivo'],
+    )
+    return JsonResponse(_espera_a_dict(espera), status=201)
+
+
+@login_required
+@role_required('Recepcionista')
+def api_lista_espera_aceptar(request, espera_id):
+    """Confirma el cupo ofrecido a una solicitud y crea la reserva."""
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    espera = get_object_or_404(ListaEspera.objects.select_related('paciente', 'disponibilidad__medico__user'), id=espera_id)
+    try:
+        reserva = aceptar_oferta(espera, request.user)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    fecha_local = localtime(reserva.fecha_reserva.fecha_disponible)
+    mensaje = f"Se ha registrado una nueva reserva para el paciente {reserva.paciente.nombre} para la fecha del {fecha_local.strftime('%d/%m/%Y %H:%M')}."
+    Notificacion.objects.create(usuario=reserva.medico.user, mensaje=mensaje)
+    registrar_actividad(request.user, f"Creó la reserva {reserva.id} desde la lista de espera {espera_id}")
+    return JsonResponse({'success': True, 'reserva_id': reserva.id, 'fecha': fecha_local.isoformat()})
+
+
+@login_required
+@role_required('Recepcionista')
+def api_lista_espera_rechazar(request, espera_id):
+    """
+    Libera el cupo ofrecido, que pasa a la siguiente solicitud. Con
+    ``cancelar=1`` el paciente además sale de la lista de espera.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    espera = get_object_or_404(ListaEspera.objects.select_related('disponibilidad'), id=espera_id)
+    try:
+        rechazar_oferta(espera, cancelar=request.POST.get('cancelar') == '1')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({'success': True})
+
+
+def _asignacion_a_dict(asignacion):
+    datos = {
+        'reserva_id': asignacion['reserva_id'],
+        'paciente': asignacion['paciente'],
+        'fecha_origen': localtime(asignacion['fecha_origen']).isoformat(),
+    }
+    if 'cupo_destino' in asignacion:
+        datos['medico_destino'] = asignacion['medico_destino']
+        datos['fecha_destino'] = localtime(asignacion['fecha_destino']).isoformat()
+    return datos
+
+
+@login_required
+@role_required('Recepcionista')
+def api_reprogramar_medico(request, medico_id):
+    """
+    Reprograma las reservas de un médico que no podrá atender entre ``desde``
+    y ``hasta`` (AAAA-MM-DD, ambos inclusive). Con ``destino=especialidad``
+    (por defecto) las reservas pasan a otros médicos de la especialidad. Con
+    ``mismo_medico`` pasan a cupos del mismo médico fuera del rango.
+    Recibe un JSON por POST. Por defecto solo devuelve el plan; con
+    ``"aplicar": true`` lo ejecuta.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+    medico = get_object_or_404(Medico, id=medico_id)
+    try:
+        datos = json.loads(request.body)
+    except ValueError:
+        datos = None
+    if not isinstance(datos, dict):
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON válido.'}, status=400)
+    try:
+        inicio = make_aware(datetime.strptime(datos.get('desde') or '', '%Y-%m-%d'))
+        fin = make_aware(datetime.strptime(datos.get('hasta') or '', '%Y-%m-%d') + timedelta(days=1)) - timedelta(microseconds=1)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Formato de fecha inválido. Use el formato AAAA-MM-DD.'}, status=400)
+    if fin < inicio:
+        return JsonResponse({'error': 'La fecha de término debe ser posterior a la de inicio.'}, status=400)
+    destino = datos.get('destino', 'especialidad')
+    if destino not in DESTINOS_REPROGRAMACION:
+        return JsonResponse({'error': f"Destino no válido. Use uno de: {', '.join(DESTINOS_REPROGRAMACION)}."}, status=400)
+
+    plan = planificar_reprogramacion(medico, inicio, fin, destino)
+    respuesta = {
+        'asignaciones': [_asignacion_a_dict(a) for a in plan['asignaciones']],
+        'sin_cupo': [_asignacion_a_dict(a) for a in plan['sin_cupo']],
+        'aplicado': False,
+    }
+    if datos.get('aplicar') is True:
+        try:
+            respuesta['resultado'] = aplicar_reprogramacion(medico, inicio, fin, plan)
+        except PlanDesactualizado as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        respuesta['aplicado'] = True
+        registrar_actividad(request.user, f"Reprogramó las reservas del médico {medico.id} entre {datos['desde']} y {datos['hasta']}")
+    return JsonResponse(respuesta)
+
+
+def metricas(request):
+    """Métricas de Prometheus (core/metricas.py). Solo para las IPs de ``METRICAS_IPS``."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICAS_IPS:
+        return HttpResponseForbidden("No tienes permiso para acceder a esta página.")
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
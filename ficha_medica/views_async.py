@@ -0,0 +1,108 @@
+"""
+Versiones ``async`` de los endpoints JSON de consulta y sondeo.
+
+Responden igual que sus pares de ``views.py``, pero usan el ORM asíncrono
+(``aget``, ``aexists``, ``async for``). Bajo ASGI (``centro_medico.asgi``,
+que activa ``VISTAS_ASYNC``) un worker atiende muchas peticiones de AJAX y de
+sondeo a la vez sin reservar un hilo para cada una mientras esperan. Bajo
+WSGI se usan las versiones síncronas (``centro_medico/urls.py``), porque ahí
+una vista ``async`` solo añade el costo de levantar un bucle de eventos por
+petición.
+"""
+import re
+
+from django.http import JsonResponse
+from django.utils.timezone import localtime, now
+
+from ficha_medica.models import Disponibilidad, Medico, Notificacion, Paciente, Reserva
+from ficha_medica.utils import alogin_required, arole_required
+
+
+@alogin_required
+@arole_required('Medico')
+async def obtener_notificaciones(request):
+    data = [
+        {"id": n.id, "mensaje": n.mensaje, "fecha_creacion": n.fecha_creacion}
+        async for n in Notificacion.objects.filter(leido=False, usuario=request.user)
+    ]
+    return JsonResponse(data, safe=False)
+
+
+async def obtener_reservas_activas(request):
+    hora_actual = localtime(now())
+    reservas = Reserva.objects.filter(fecha_reserva__fecha_disponible__gte=hora_actual).select_related(
+        'paciente', 'fecha_reserva'
+    )
+    data = [
+        {"id": r.id, "paciente": r.paciente.nombre, "hora": r.fecha_reserva.fecha_disponible.strftime('%H:%M')}
+        async for r in reservas
+    ]
+    return JsonResponse(data, safe=False)
+
+
+async def api_medicos(request):
+    especialidad_id = request.GET.get('especialidad_id')
+    if not especialidad_id:
+        return JsonResponse({'error': 'Se requiere el ID de la especialidad.'}, status=400)
+
+    if not especialidad_id.isdigit():
+        return JsonResponse({'error': 'El ID de la especialidad debe ser un número válido.'}, status=400)
+
+    try:
+        data = [
+            {'id': medico.id, 'nombre': f"{medico.user.first_name} {medico.user.last_name}"}
+            async for medico in Medico.objects.filter(especialidad_id=especialidad_id).select_related('user')
+        ]
+        if not data:
+            return JsonResponse({'error': 'No hay médicos registrados para esta especialidad.'}, status=404)
+        return JsonResponse(data, safe=False)
+    except Exception as e:
+        return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
+
+
+async def api_disponibilidades(request):
+    medico_id = request.GET.get('medico_id')
+    if not medico_id:
+        return JsonResponse({'error': 'Se requiere el ID del médico.'}, status=400)
+
+    if not medico_id.isdigit():
+        return JsonResponse({'error': 'El ID del médico debe ser un número válido.'}, status=400)
+
+    try:
+        medico = await Medico.objects.aget(id=medico_id)
+        data = [
+            {
+                'id': disp.id,
+                'fecha_hora': localtime(disp.fecha_disponible).strftime('%d/%m/%Y %H:%M')
+            }
+            async for disp in Disponibilidad.objects.filter(medico=medico, ocupada=False, fecha_disponible__gte=now())
+        ]
+        if not data:
+            return JsonResponse({'error': 'No hay disponibilidades para este médico.'}, status=404)
+        return JsonResponse(data, safe=False)
+    except Medico.DoesNotExist:
+        return JsonResponse({'error': 'El médico no existe.'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
+
+
+async def api_validar_rut(request):
+    rut = request.GET.get('rut')
+    if not rut:
+        return JsonResponse({'error': 'RUT no proporcionado.'}, status=400)
+
+    # Valida formato del RUT
+    if not re.match(r'^\d{7,8}-\d{1}$', rut):
+        return JsonResponse({'error': 'El RUT debe estar en el formato correcto (12345678-9).'}, status=400)
+
+    try:
+        paciente = await Paciente.objects.aget(rut=rut)
+        edad = paciente.edad if paciente.fecha_nacimiento else 'No registrada'
+        return JsonResponse({
+            'nombre': paciente.nombre,
+            'edad': edad
+        })
+    except Paciente.DoesNotExist:
+        return JsonResponse({'error': 'Paciente no encontrado.'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
@@ -0,0 +1,66 @@
+"""
+Configuración de gunicorn para producción (``start.sh``).
+
+Por omisión sirve la aplicación WSGI (``centro_medico.wsgi``) con workers
+``gthread``: cada proceso atiende ``GUNICORN_THREADS`` peticiones a la vez y
+cada hilo conserva su conexión a la base (``CONN_MAX_AGE``). Con
+``GUNICORN_ASGI=1`` sirve ``centro_medico.asgi`` con workers de uvicorn.
+
+La aplicación se carga una vez en el proceso maestro (``preload_app``) y los
+workers se reciclan tras ``GUNICORN_MAX_REQUESTS`` peticiones, con un margen
+aleatorio para que no se reinicien todos juntos. Por eso el scheduler de
+tareas periódicas no corre aquí: un worker reciclado a la hora de un trabajo
+nocturno lo perdería. Lo ejecuta ``manage.py run_workers`` (``start.sh``).
+"""
+import multiprocessing
+import os
+
+# Se lee al cargar la aplicación en el maestro (FichaMedicaConfig.ready).
+os.environ['SCHEDULER_AUTOINICIO'] = '0'
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'centro_medico.settings')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ.get('GUNICORN_ASGI') == '1':
+    wsgi_app = 'centro_medico.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'centro_medico.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None  # Vacío: sin log de accesos
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    from core.metricas import limpiar
+    limpiar()
+
+
+def pre_fork(server, worker):
+    # Una conexión abierta al cargar la aplicación no debe heredarse a los workers.
+    from django.db import connections
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    from core.actividad import vaciar
+    from core.metricas import volcar
+    vaciar()  # Antes de volcar, así las métricas incluyen lo guardado al salir
+    volcar()
+
+
+def child_exit(server, worker):
+    # En el maestro: las métricas del worker terminado pasan al acumulado.
+    from core.metricas import consolidar_proceso
+    consolidar_proceso(worker.pid)
@@ -1,2 +1,13 @@
 #!/bin/bash
-gunicorn nombre_proyecto.wsgi:application --bind 0.0.0.0:$PORT
+# Servidor web y trabajadores de la cola de tareas (ficha_medica/cola.py).
+# Los avisos, resúmenes, archivo, exportaciones e importaciones se encolan:
+# sin trabajadores quedan pendientes. run_workers también corre el scheduler
+# de tareas periódicas. Si uno de los dos procesos termina se detiene el otro,
+# para que el contenedor se reinicie completo.
+SCHEDULER_AUTOINICIO=0 python manage.py run_workers --procesos "${TAREAS_PROCESOS:-2}" &
+gunicorn --config gunicorn.conf.py &
+
+trap 'kill -TERM $(jobs -p) 2>/dev/null; wait; exit' TERM INT
+wait -n
+kill -TERM $(jobs -p) 2>/dev/null
+wait